@@ -6,6 +6,9 @@ from app.api.v1 import (
     data_analytics,
     ecosystem,
     esg_climate,
+    events,
+    jobs,
+    market_data,
     operations,
     portfolios,
     private_markets,
@@ -26,4 +29,7 @@ api_router.include_router(data_analytics.router, prefix="/data-analytics", tags=
 api_router.include_router(esg_climate.router, prefix="/esg-climate", tags=["esg-climate"])
 api_router.include_router(wealth.router, prefix="/wealth", tags=["wealth"])
 api_router.include_router(ecosystem.router, prefix="/ecosystem", tags=["ecosystem"])
+api_router.include_router(market_data.router, prefix="/market-data", tags=["market-data"])
+api_router.include_router(events.router, prefix="/events", tags=["events"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 api_router.include_router(design_principles.router, prefix="/design-principles", tags=["design-principles"])
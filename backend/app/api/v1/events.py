@@ -0,0 +1,39 @@
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from app.core.auth import get_stream_user_id
+from app.core.config import settings
+from app.services import events
+
+router = APIRouter()
+
+
+async def event_stream(request: Request, user_id: str) -> AsyncIterator[str]:
+    """SSE body: events as they arrive, a comment line when idle, until the client leaves."""
+    # Subscribed on first iteration, so a response that never starts streaming leaves nothing behind.
+    sub = events.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            batch = await sub.next(settings.sse_heartbeat_seconds)
+            if not batch:
+                yield ": ping\n\n"
+            for event in batch:
+                yield events.format_sse(event)
+    finally:
+        events.unsubscribe(sub)
+
+
+@router.get("/stream")
+async def stream_events(request: Request, user_id: str = Depends(get_stream_user_id)):
+    """
+    Server-sent events for the current user: order.created/order.status/order.deleted,
+    risk_results.changed, holdings.changed, job.status, job.progress and resync.
+    Authenticate with the usual bearer header or ``?token=``.
+    """
+    return StreamingResponse(
+        event_stream(request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
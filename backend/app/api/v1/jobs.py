@@ -0,0 +1,60 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from app.core.auth import get_current_user_id
+from app.services import jobs
+
+router = APIRouter()
+
+
+class JobCreate(BaseModel):
+    job_type: str
+    params: dict[str, Any] = {}
+
+
+@router.get("")
+def list_jobs(user_id: str = Depends(get_current_user_id)):
+    return jobs.list_jobs(user_id)
+
+
+@router.get("/types")
+def list_job_types(user_id: str = Depends(get_current_user_id)):
+    return jobs.job_types()
+
+
+@router.post("")
+def create_job(body: JobCreate, user_id: str = Depends(get_current_user_id)):
+    try:
+        return jobs.submit(user_id, body.job_type, body.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, user_id: str = Depends(get_current_user_id)):
+    job = jobs.get(user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str, user_id: str = Depends(get_current_user_id)):
+    job = jobs.get(user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return jobs.result(job_id)
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str, user_id: str = Depends(get_current_user_id)):
+    try:
+        job = jobs.cancel(user_id, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,132 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from app.core.auth import get_current_user_id
+from app.db import csv_store, price_store
+from app.services import fx, securities
+
+router = APIRouter()
+
+
+class PricePoint(BaseModel):
+    symbol: str
+    date: str
+    close: float
+
+
+class PriceImport(BaseModel):
+    prices: list[PricePoint] = []
+    csv: str | None = None  # symbol,date,close text, for bulk loads
+
+
+class Security(BaseModel):
+    symbol: str
+    asset_class: str
+    name: str = ""
+    currency: str = ""
+    sector: str = ""
+    isin: str = ""
+    cusip: str = ""
+
+
+class SecurityImport(BaseModel):
+    securities: list[Security]
+
+
+class FxRate(BaseModel):
+    currency: str
+    rate: float  # units of the base currency per unit of ``currency``
+    as_of: str | None = None
+
+
+class FxImport(BaseModel):
+    rates: list[FxRate]
+
+
+@router.get("/symbols")
+def list_symbols(user_id: str = Depends(get_current_user_id)):
+    return price_store.symbols()
+
+
+@router.get("/prices/{symbol}")
+def get_prices(
+    symbol: str,
+    start: str | None = None,
+    end: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    try:
+        dates, closes = price_store.get_series(symbol, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not len(dates) and price_store.latest(symbol) is None:
+        raise HTTPException(status_code=404, detail="No prices for symbol")
+    return {
+        "symbol": price_store.normalize_symbol(symbol),
+        "dates": dates.astype(str).tolist(),
+        "closes": closes.tolist(),
+    }
+
+
+@router.get("/prices/{symbol}/latest")
+def get_latest_price(symbol: str, user_id: str = Depends(get_current_user_id)):
+    point = price_store.latest(symbol)
+    if point is None:
+        raise HTTPException(status_code=404, detail="No prices for symbol")
+    return {"symbol": price_store.normalize_symbol(symbol), "date": point[0], "close": point[1]}
+
+
+@router.post("/prices")
+def import_prices(body: PriceImport, user_id: str = Depends(get_current_user_id)):
+    grouped: dict[str, tuple[list[str], list[float]]] = {}
+    for p in body.prices:
+        dates, closes = grouped.setdefault(price_store.normalize_symbol(p.symbol), ([], []))
+        dates.append(p.date)
+        closes.append(p.close)
+    try:
+        loaded = {s: price_store.upsert_series(s, d, c) for s, (d, c) in grouped.items()}
+        if body.csv:
+            loaded.update(price_store.load_csv_text(body.csv))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid price data: {e}")
+    return {"loaded": loaded, "as_of_date": price_store.as_of_date()}
+
+
+@router.get("/fx")
+def list_fx_rates(user_id: str = Depends(get_current_user_id)):
+    return {"base_currency": fx.rates().base, "rates": csv_store.read_table("fx_rates")}
+
+
+@router.post("/fx")
+def import_fx_rates(body: FxImport, user_id: str = Depends(get_current_user_id)):
+    try:
+        return fx.upsert_rates([r.model_dump() for r in body.rates])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/fx/matrix")
+def fx_matrix(user_id: str = Depends(get_current_user_id)):
+    """Cross rates: ``matrix[i][j]`` is units of currencies[j] per unit of currencies[i]."""
+    rates = fx.rates()
+    return {"base_currency": rates.base, "currencies": rates.currencies, "matrix": rates.matrix.tolist()}
+
+
+@router.get("/securities")
+def list_securities(user_id: str = Depends(get_current_user_id)):
+    return [securities.lookup(symbol) for symbol in sorted(securities.master())]
+
+
+@router.post("/securities")
+def import_securities(body: SecurityImport, user_id: str = Depends(get_current_user_id)):
+    try:
+        return securities.upsert_securities([s.model_dump() for s in body.securities])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/securities/{symbol}")
+def get_security(symbol: str, user_id: str = Depends(get_current_user_id)):
+    row = securities.lookup(symbol)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Security not found")
+    return row
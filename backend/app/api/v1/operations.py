@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from app.core.auth import get_current_user_id
+from app.core.config import settings
 from app.db import csv_store
+from app.services import cash_ladder, fx, ledger, reconciliation
 
 router = APIRouter()
 
@@ -10,12 +12,14 @@ class AccountCreate(BaseModel):
     name: str
     account_type: str = "general"
     currency: str = "USD"
+    portfolio_id: str = ""  # portfolio whose trades settle into this account
 
 
 class AccountUpdate(BaseModel):
     name: str | None = None
     account_type: str | None = None
     currency: str | None = None
+    portfolio_id: str | None = None
 
 
 class TransactionCreate(BaseModel):
@@ -24,6 +28,7 @@ class TransactionCreate(BaseModel):
     amount: str
     date: str
     description: str = ""
+    order_id: str = ""  # the order this cash leg settles, if any
 
 
 class TransactionUpdate(BaseModel):
@@ -31,6 +36,12 @@ class TransactionUpdate(BaseModel):
     amount: str | None = None
     date: str | None = None
     description: str | None = None
+    order_id: str | None = None
+
+
+class ReconciliationRequest(BaseModel):
+    quantity_tolerance: float = reconciliation.DEFAULT_QUANTITY_TOLERANCE
+    cash_tolerance: float = reconciliation.DEFAULT_CASH_TOLERANCE
 
 
 @router.get("/accounts")
@@ -43,17 +54,68 @@ def create_account(
     body: AccountCreate,
     user_id: str = Depends(get_current_user_id),
 ):
+    _check_portfolio(user_id, body.portfolio_id)
     row = {
         "id": csv_store.generate_id(),
         "user_id": user_id,
         "name": body.name,
         "account_type": body.account_type,
         "currency": body.currency,
+        "portfolio_id": body.portfolio_id,
     }
     csv_store.append_row("accounts", row)
     return row
 
 
+@router.get("/accounts/balances")
+def account_balances(
+    currency: str | None = None,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Each account's balance (through ``as_of`` if given), in the account's currency and
+    converted into ``currency`` (default: the base currency). Accounts in a currency with
+    no FX rate are listed unconverted and left out of the total.
+    """
+    target = fx.normalize(currency or settings.base_currency)
+    accounts = csv_store.get_by_user("accounts", user_id)
+    try:
+        balances = [ledger.balance(a["id"], as_of)[0] for a in accounts]
+        converted, known, unconverted = fx.convert_known(balances, [a.get("currency") or "" for a in accounts], target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "currency": target,
+        "as_of": as_of,
+        "total": float(converted.sum()),
+        "unconverted_currencies": unconverted,
+        "accounts": [
+            {
+                "account_id": a["id"],
+                "name": a.get("name"),
+                "account_currency": a.get("currency"),
+                "balance": balances[i],
+                "converted": float(converted[i]) if known[i] else None,
+            }
+            for i, a in enumerate(accounts)
+        ],
+    }
+
+
+@router.get("/accounts/cash-ladder")
+def all_cash_ladders(
+    days: int = 10,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Projected daily cash per account and currency over the next ``days`` days."""
+    try:
+        return cash_ladder.ladders(user_id, days, as_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/accounts/{account_id}")
 def get_account(
     account_id: str,
@@ -76,6 +138,7 @@ def update_account(
     if not any(r.get("id") == account_id for r in rows):
         raise HTTPException(status_code=404, detail="Account not found")
     updates = body.model_dump(exclude_unset=True)
+    _check_portfolio(user_id, updates.get("portfolio_id"))
     if updates:
         csv_store.update_row("accounts", "id", account_id, updates)
     rows = csv_store.get_by_user("accounts", user_id)
@@ -98,16 +161,76 @@ def delete_account(
     return None
 
 
+def _check_portfolio(user_id: str, portfolio_id: str | None) -> None:
+    if portfolio_id and not any(p.get("id") == portfolio_id for p in csv_store.get_by_user("portfolios", user_id)):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+
+def _check_account(user_id: str, account_id: str) -> None:
+    if not any(a.get("id") == account_id for a in csv_store.get_by_user("accounts", user_id)):
+        raise HTTPException(status_code=404, detail="Account not found")
+
+
 @router.get("/accounts/{account_id}/transactions")
 def list_transactions(
     account_id: str,
+    start: str | None = None,
+    end: str | None = None,
     user_id: str = Depends(get_current_user_id),
 ):
-    accounts = csv_store.get_by_user("accounts", user_id)
-    if not any(a.get("id") == account_id for a in accounts):
+    """The account's transactions, optionally only those dated ``start`` through ``end`` (inclusive)."""
+    _check_account(user_id, account_id)
+    try:
+        return ledger.transactions(user_id, account_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/accounts/{account_id}/balance")
+def get_account_balance(
+    account_id: str,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Balance through ``as_of`` (inclusive; default: every transaction)."""
+    _check_account(user_id, account_id)
+    try:
+        balance, count = ledger.balance(account_id, as_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"account_id": account_id, "as_of": as_of, "balance": balance, "transactions": count}
+
+
+@router.get("/accounts/{account_id}/ledger")
+def get_account_ledger(
+    account_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Statement for a date range: opening and closing balances and entries with running balances."""
+    _check_account(user_id, account_id)
+    try:
+        return {"account_id": account_id, "start": start, "end": end, **ledger.entries(account_id, start, end)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/accounts/{account_id}/cash-ladder")
+def get_cash_ladder(
+    account_id: str,
+    days: int = 10,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Projected daily cash for one account: scheduled transactions plus T+1/T+2 settlement of open orders."""
+    try:
+        result = cash_ladder.ladder(user_id, account_id, days, as_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
         raise HTTPException(status_code=404, detail="Account not found")
-    transactions = csv_store.get_by_user("transactions", user_id)
-    return [t for t in transactions if t.get("account_id") == account_id]
+    return result
 
 
 @router.post("/transactions")
@@ -126,6 +249,7 @@ def create_transaction(
         "amount": body.amount,
         "date": body.date,
         "description": body.description,
+        "order_id": body.order_id,
     }
     csv_store.append_row("transactions", row)
     return row
@@ -156,3 +280,28 @@ def delete_transaction(
         raise HTTPException(status_code=404, detail="Transaction not found")
     csv_store.delete_row("transactions", "id", transaction_id)
     return None
+
+
+@router.post("/reconciliation")
+def run_reconciliation(
+    body: ReconciliationRequest | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Reconcile holdings, fills and cash legs now, replacing the previous breaks (large books: use a job)."""
+    body = body or ReconciliationRequest()
+    try:
+        return reconciliation.run(user_id, body.quantity_tolerance, body.cash_tolerance)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/reconciliation/breaks")
+def list_reconciliation_breaks(
+    break_type: str | None = None,
+    portfolio_id: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Breaks found by the latest reconciliation run."""
+    if break_type is not None and break_type not in reconciliation.BREAK_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown break type: {break_type}")
+    return reconciliation.list_breaks(user_id, break_type, portfolio_id)
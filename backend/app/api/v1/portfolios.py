@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from app.core.auth import get_current_user_id
 from app.db import csv_store
+from app.services import exposure, securities, tax_lots, valuation
 
 router = APIRouter()
 
@@ -18,7 +19,7 @@ class PortfolioUpdate(BaseModel):
 
 class HoldingCreate(BaseModel):
     symbol: str
-    asset_class: str
+    asset_class: str | None = None  # defaults to the security master's
     quantity: str
     avg_cost: str
 
@@ -52,6 +53,37 @@ def create_portfolio(
     return row
 
 
+@router.get("/valuation")
+def get_portfolios_valuation(
+    portfolio_id: list[str] = Query(default=[]),
+    currency: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Value several portfolios (all of the user's if none given) with combined breakdowns,
+    converted into ``currency`` if given.
+    """
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+    if portfolio_id:
+        missing = set(portfolio_id) - set(owned)
+        if missing:
+            raise HTTPException(status_code=404, detail="Portfolio not found")
+        owned = [pid for pid in owned if pid in set(portfolio_id)]
+    try:
+        return valuation.value_portfolios(user_id, owned, include_positions=False, currency=currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/exposure")
+def get_exposure(currency: str | None = None, user_id: str = Depends(get_current_user_id)):
+    """Exposure across all of the user's portfolios by symbol, asset class and currency."""
+    try:
+        return exposure.user_exposure(user_id, currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/{portfolio_id}")
 def get_portfolio(
     portfolio_id: str,
@@ -109,6 +141,47 @@ def list_holdings(
     return [h for h in holdings if h.get("portfolio_id") == portfolio_id]
 
 
+@router.get("/{portfolio_id}/valuation")
+def get_portfolio_valuation(
+    portfolio_id: str,
+    currency: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    portfolios = csv_store.get_by_user("portfolios", user_id)
+    if not any(p.get("id") == portfolio_id for p in portfolios):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    try:
+        return valuation.value_portfolios(user_id, [portfolio_id], currency=currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{portfolio_id}/lots")
+def list_lots(
+    portfolio_id: str,
+    symbol: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    portfolios = csv_store.get_by_user("portfolios", user_id)
+    if not any(p.get("id") == portfolio_id for p in portfolios):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return tax_lots.open_lots(portfolio_id, symbol.strip().upper() if symbol else None)
+
+
+@router.get("/{portfolio_id}/realized-gains")
+def get_realized_gains(
+    portfolio_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    include_records: bool = False,
+    user_id: str = Depends(get_current_user_id),
+):
+    portfolios = csv_store.get_by_user("portfolios", user_id)
+    if not any(p.get("id") == portfolio_id for p in portfolios):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return tax_lots.realized_gains(portfolio_id, start, end, include_records)
+
+
 @router.post("/{portfolio_id}/holdings")
 def create_holding(
     portfolio_id: str,
@@ -118,12 +191,15 @@ def create_holding(
     portfolios = csv_store.get_by_user("portfolios", user_id)
     if not any(p.get("id") == portfolio_id for p in portfolios):
         raise HTTPException(status_code=404, detail="Portfolio not found")
+    asset_class = body.asset_class or (securities.lookup(body.symbol) or {}).get("asset_class")
+    if not asset_class:
+        raise HTTPException(status_code=400, detail="Symbol not in the security master; asset_class is required")
     row = {
         "id": csv_store.generate_id(),
         "portfolio_id": portfolio_id,
         "user_id": user_id,
         "symbol": body.symbol,
-        "asset_class": body.asset_class,
+        "asset_class": asset_class,
         "quantity": body.quantity,
         "avg_cost": body.avg_cost,
     }
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from app.core.auth import get_current_user_id
+from app.core.config import settings
 from app.db import csv_store
+from app.services import fx, private_markets
+from app.services.numeric import float_column, group_sum
 
 router = APIRouter()
 
@@ -31,6 +34,28 @@ class CommitmentUpdate(BaseModel):
     date: str | None = None
 
 
+class CashFlowCreate(BaseModel):
+    fund_id: str
+    flow_type: str  # call, distribution or nav
+    amount: str  # non-negative; the type gives the direction
+    currency: str = "USD"
+    date: str
+
+
+class CashFlowUpdate(BaseModel):
+    flow_type: str | None = None
+    amount: str | None = None
+    currency: str | None = None
+    date: str | None = None
+
+
+def _get_fund(user_id: str, fund_id: str) -> dict:
+    for f in csv_store.get_by_user("funds", user_id):
+        if f.get("id") == fund_id:
+            return f
+    raise HTTPException(status_code=404, detail="Fund not found")
+
+
 @router.get("/funds")
 def list_funds(user_id: str = Depends(get_current_user_id)):
     return csv_store.get_by_user("funds", user_id)
@@ -43,6 +68,15 @@ def create_fund(body: FundCreate, user_id: str = Depends(get_current_user_id)):
     return row
 
 
+@router.get("/analytics")
+def fund_analytics_rollup(group_by: str = "fund", user_id: str = Depends(get_current_user_id)):
+    """IRR, TVPI, DPI and RVPI per fund, strategy or vintage, plus the whole program, in the base currency."""
+    try:
+        return private_markets.rollup(user_id, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/funds/{fund_id}")
 def get_fund(fund_id: str, user_id: str = Depends(get_current_user_id)):
     rows = csv_store.get_by_user("funds", user_id)
@@ -72,9 +106,29 @@ def delete_fund(fund_id: str, user_id: str = Depends(get_current_user_id)):
     for c in csv_store.get_by_user("commitments", user_id):
         if c.get("fund_id") == fund_id:
             csv_store.delete_row("commitments", "id", c["id"])
+    flows = {c["id"] for c in csv_store.get_by_user("fund_cash_flows", user_id) if c.get("fund_id") == fund_id}
+    if flows:
+        csv_store.delete_rows("fund_cash_flows", "id", flows)
     return None
 
 
+@router.get("/funds/{fund_id}/cash-flows")
+def list_cash_flows(fund_id: str, user_id: str = Depends(get_current_user_id)):
+    _get_fund(user_id, fund_id)
+    flows = [c for c in csv_store.get_by_user("fund_cash_flows", user_id) if c.get("fund_id") == fund_id]
+    return sorted(flows, key=lambda c: c.get("date") or "")
+
+
+@router.get("/funds/{fund_id}/analytics")
+def get_fund_analytics(fund_id: str, user_id: str = Depends(get_current_user_id)):
+    """IRR, TVPI, DPI and RVPI for one fund from its cash flows, in the base currency."""
+    fund = _get_fund(user_id, fund_id)
+    try:
+        return private_markets.fund_analytics(user_id, fund)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/funds/{fund_id}/commitments")
 def list_commitments(fund_id: str, user_id: str = Depends(get_current_user_id)):
     funds = csv_store.get_by_user("funds", user_id)
@@ -84,6 +138,35 @@ def list_commitments(fund_id: str, user_id: str = Depends(get_current_user_id)):
     return [c for c in commitments if c.get("fund_id") == fund_id]
 
 
+@router.get("/commitments/totals")
+def commitment_totals(currency: str | None = None, user_id: str = Depends(get_current_user_id)):
+    """
+    Committed amounts in ``currency`` (default: the base currency), overall and per fund.
+    Commitments in a currency with no FX rate are left out and their currencies listed.
+    """
+    target = fx.normalize(currency or settings.base_currency)
+    commitments = csv_store.get_by_user("commitments", user_id)
+    try:
+        amounts, known, unconverted = fx.convert_known(
+            float_column(commitments, "amount"), [c.get("currency") or "" for c in commitments], target
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    commitments, amounts = [c for c, k in zip(commitments, known) if k], amounts[known]
+    fund_ids, (per_fund,) = group_sum([c.get("fund_id") or "" for c in commitments], amounts)
+    names = {f["id"]: f.get("name") for f in csv_store.get_by_user("funds", user_id)}
+    return {
+        "currency": target,
+        "total": float(amounts.sum()),
+        "count": len(commitments),
+        "unconverted_currencies": unconverted,
+        "by_fund": [
+            {"fund_id": fid, "name": names.get(fid), "amount": float(a)}
+            for fid, a in zip(fund_ids, per_fund)
+        ],
+    }
+
+
 @router.post("/commitments")
 def create_commitment(body: CommitmentCreate, user_id: str = Depends(get_current_user_id)):
     funds = csv_store.get_by_user("funds", user_id)
@@ -112,3 +195,39 @@ def delete_commitment(commitment_id: str, user_id: str = Depends(get_current_use
         raise HTTPException(status_code=404, detail="Commitment not found")
     csv_store.delete_row("commitments", "id", commitment_id)
     return None
+
+
+@router.post("/cash-flows")
+def create_cash_flow(body: CashFlowCreate, user_id: str = Depends(get_current_user_id)):
+    _get_fund(user_id, body.fund_id)
+    try:
+        row = private_markets.validate_cash_flow({"id": csv_store.generate_id(), "user_id": user_id, **body.model_dump()})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    csv_store.append_row("fund_cash_flows", row)
+    return row
+
+
+@router.put("/cash-flows/{flow_id}")
+def update_cash_flow(flow_id: str, body: CashFlowUpdate, user_id: str = Depends(get_current_user_id)):
+    rows = csv_store.get_by_user("fund_cash_flows", user_id)
+    current = next((r for r in rows if r.get("id") == flow_id), None)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Cash flow not found")
+    updates = body.model_dump(exclude_unset=True)
+    try:
+        merged = private_markets.validate_cash_flow({**current, **updates})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if updates:
+        csv_store.update_row("fund_cash_flows", "id", flow_id, {k: merged[k] for k in updates})
+    return merged
+
+
+@router.delete("/cash-flows/{flow_id}")
+def delete_cash_flow(flow_id: str, user_id: str = Depends(get_current_user_id)):
+    rows = csv_store.get_by_user("fund_cash_flows", user_id)
+    if not any(r.get("id") == flow_id for r in rows):
+        raise HTTPException(status_code=404, detail="Cash flow not found")
+    csv_store.delete_row("fund_cash_flows", "id", flow_id)
+    return None
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from app.core.auth import get_current_user_id
 from app.db import csv_store
+from app.services import covariance, factors, risk_cache
+from app.services import scenarios as scenario_engine
 
 router = APIRouter()
 
@@ -25,6 +27,41 @@ class ResultCreate(BaseModel):
     value: str
 
 
+class FactorLoading(BaseModel):
+    symbol: str
+    rates: float = 0.0
+    equity: float = 0.0
+    credit: float = 0.0
+    fx: float = 0.0
+    specific_vol: float = 0.0  # annualised
+
+
+class FactorLoadingsImport(BaseModel):
+    loadings: list[FactorLoading]
+
+
+class ScenarioRun(BaseModel):
+    scenario_ids: list[str] = []  # empty = all of the user's scenarios
+    portfolio_ids: list[str] = []  # empty = all of the user's portfolios
+
+
+def _run(user_id: str, scenario_ids: list[str], portfolio_ids: list[str]) -> dict:
+    scenarios = csv_store.get_by_user("risk_scenarios", user_id)
+    if scenario_ids:
+        if set(scenario_ids) - {s["id"] for s in scenarios}:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        scenarios = [s for s in scenarios if s["id"] in set(scenario_ids)]
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+    if portfolio_ids:
+        if set(portfolio_ids) - set(owned):
+            raise HTTPException(status_code=404, detail="Portfolio not found")
+        owned = [pid for pid in owned if pid in set(portfolio_ids)]
+    try:
+        return scenario_engine.run_scenarios(user_id, scenarios, owned)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/scenarios")
 def list_scenarios(user_id: str = Depends(get_current_user_id)):
     return csv_store.get_by_user("risk_scenarios", user_id)
@@ -46,6 +83,21 @@ def create_scenario(
     return row
 
 
+@router.post("/scenarios/run")
+def run_scenarios(
+    body: ScenarioRun,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Run many scenarios against many portfolios in one vectorized pass and one write."""
+    return _run(user_id, body.scenario_ids, body.portfolio_ids)
+
+
+@router.get("/cache/stats")
+def cache_stats(user_id: str = Depends(get_current_user_id)):
+    """Risk results cache size and hit rate (process-wide)."""
+    return risk_cache.stats()
+
+
 @router.get("/scenarios/{scenario_id}")
 def get_scenario(
     scenario_id: str,
@@ -90,6 +142,15 @@ def delete_scenario(
     return None
 
 
+@router.post("/scenarios/{scenario_id}/run")
+def run_scenario(
+    scenario_id: str,
+    body: ScenarioRun | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    return _run(user_id, [scenario_id], body.portfolio_ids if body else [])
+
+
 @router.get("/scenarios/{scenario_id}/results")
 def list_results(
     scenario_id: str,
@@ -129,3 +190,62 @@ def delete_result(
         raise HTTPException(status_code=404, detail="Result not found")
     csv_store.delete_row("risk_results", "id", result_id)
     return None
+
+
+@router.get("/covariance")
+def get_covariance(
+    symbol: list[str] = Query(default=[]),
+    portfolio_id: list[str] = Query(default=[]),
+    window: int = covariance.DEFAULT_WINDOW,
+    method: str = "ledoit_wolf",
+    lam: float = covariance.DEFAULT_DECAY,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Covariance of daily log returns. The universe is ``symbol`` if given, else the
+    symbols held in ``portfolio_id`` (default: all of the user's portfolios).
+    """
+    symbols = symbol
+    if not symbols:
+        holdings = csv_store.get_by_user("holdings", user_id)
+        if portfolio_id:
+            owned = {p["id"] for p in csv_store.get_by_user("portfolios", user_id)}
+            if set(portfolio_id) - owned:
+                raise HTTPException(status_code=404, detail="Portfolio not found")
+            holdings = [h for h in holdings if h.get("portfolio_id") in set(portfolio_id)]
+        symbols = [h.get("symbol") or "" for h in holdings]
+    try:
+        result = covariance.estimate(symbols, window=window, method=method, as_of=as_of, lam=lam)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "matrix": result["matrix"].tolist()}
+
+
+@router.get("/factors")
+def factor_decomposition(
+    portfolio_id: list[str] = Query(default=[]),
+    include_holdings: bool = True,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Factor exposures and marginal/component risk per factor and holding for the user's portfolios."""
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+    if set(portfolio_id) - set(owned):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    pids = [pid for pid in owned if not portfolio_id or pid in set(portfolio_id)]
+    holdings = [h for h in csv_store.get_by_user("holdings", user_id) if h.get("portfolio_id") in set(pids)]
+    return {
+        "factors": list(factors.FACTORS),
+        "factor_covariance": factors.FACTOR_COV.tolist(),
+        "portfolios": factors.decompose(holdings, pids, include_holdings),
+    }
+
+
+@router.get("/factors/loadings")
+def list_factor_loadings(user_id: str = Depends(get_current_user_id)):
+    return csv_store.read_table("factor_loadings")
+
+
+@router.post("/factors/loadings")
+def import_factor_loadings(body: FactorLoadingsImport, user_id: str = Depends(get_current_user_id)):
+    return factors.upsert_loadings([l.model_dump() for l in body.loadings])
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from datetime import datetime, timezone
 from app.core.auth import get_current_user_id
-from app.db import csv_store
+from app.db import csv_store, price_store
+from app.services import compliance, execution, orders, positions, securities, tax_lots
+from app.services.numeric import format_number, to_float
 
 router = APIRouter()
 
@@ -12,11 +13,29 @@ class OrderCreate(BaseModel):
     symbol: str
     side: str  # BUY / SELL
     quantity: str
-    order_type: str = "MARKET"
+    order_type: str = "MARKET"  # MARKET or LIMIT
+    limit_price: float | None = None
+    submitted_at: str | None = None  # order time for replays (default now)
+
+
+class OrderBatch(BaseModel):
+    orders: list[OrderCreate]
+
+
+class RuleCreate(BaseModel):
+    name: str
+    rule_type: str  # max_weight_symbol, max_weight_asset_class, restricted_symbols, min_cash
+    params_json: str = "{}"
+    enabled: bool = True
+
+
+class SweepRequest(BaseModel):
+    symbols: list[str] = []
 
 
 class OrderUpdate(BaseModel):
     status: str | None = None
+    fill_price: float | None = None  # used when the order moves to FILLED; defaults to latest close
 
 
 @router.get("/orders")
@@ -24,42 +43,132 @@ def list_orders(
     portfolio_id: str | None = None,
     user_id: str = Depends(get_current_user_id),
 ):
-    rows = csv_store.get_by_user("orders", user_id)
+    rows = orders.list_orders(user_id)
     if portfolio_id:
         rows = [r for r in rows if r.get("portfolio_id") == portfolio_id]
-    return rows
+    security_ids, class_ids = securities.holding_classes(rows)
+    labels = securities.asset_class_labels()
+    return [
+        {**r, "security_id": int(s), "asset_class": labels[c]}
+        for r, s, c in zip(rows, security_ids, class_ids)
+    ]
+
+
+def _submit(user_id: str, items: list[OrderCreate]) -> list[dict]:
+    """Run pre-trade compliance over the whole batch, then execute; failing orders are REJECTED."""
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+    if any(o.portfolio_id not in owned for o in items):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    try:
+        return compliance.submit(user_id, [o.model_dump() for o in items], owned)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/orders")
 def create_order(
     body: OrderCreate,
     user_id: str = Depends(get_current_user_id),
+):
+    """Create an order and run it through the execution simulator."""
+    return _submit(user_id, [body])[0]
+
+
+@router.post("/orders/batch")
+def create_orders(
+    body: OrderBatch,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Create and execute many orders in sequence with batched writes (e.g. replaying a trading day)."""
+    return _submit(user_id, body.orders)
+
+
+@router.get("/compliance/rules")
+def list_compliance_rules(user_id: str = Depends(get_current_user_id)):
+    return csv_store.get_by_user("compliance_rules", user_id)
+
+
+@router.post("/compliance/rules")
+def create_compliance_rule(
+    body: RuleCreate,
+    user_id: str = Depends(get_current_user_id),
 ):
     row = {
         "id": csv_store.generate_id(),
         "user_id": user_id,
-        "portfolio_id": body.portfolio_id,
-        "symbol": body.symbol,
-        "side": body.side,
-        "quantity": body.quantity,
-        "order_type": body.order_type,
-        "status": "NEW",
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "name": body.name,
+        "rule_type": body.rule_type,
+        "params_json": body.params_json,
+        "enabled": "1" if body.enabled else "0",
     }
-    csv_store.append_row("orders", row)
+    try:
+        compliance.validate(row)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    csv_store.append_row("compliance_rules", row)
     return row
 
 
+@router.delete("/compliance/rules/{rule_id}")
+def delete_compliance_rule(
+    rule_id: str,
+    user_id: str = Depends(get_current_user_id),
+):
+    rows = csv_store.get_by_user("compliance_rules", user_id)
+    if not any(r.get("id") == rule_id for r in rows):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    csv_store.delete_row("compliance_rules", "id", rule_id)
+    return None
+
+
+@router.post("/compliance/check")
+def check_compliance(
+    body: OrderBatch,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Dry-run pre-trade compliance for a batch of proposed orders; nothing is created."""
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+    return compliance.check(user_id, [o.model_dump() for o in body.orders], owned)
+
+
+@router.post("/execution/sweep")
+def sweep_orders(
+    body: SweepRequest,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Fill resting orders the latest closes have moved through (all symbols if none given)."""
+    return execution.sweep(user_id, body.symbols or None)
+
+
+@router.get("/book/{symbol}")
+def get_order_book(
+    symbol: str,
+    user_id: str = Depends(get_current_user_id),
+):
+    return execution.depth(user_id, symbol)
+
+
 @router.get("/orders/{order_id}")
 def get_order(
     order_id: str,
     user_id: str = Depends(get_current_user_id),
 ):
-    rows = csv_store.get_by_user("orders", user_id)
-    for r in rows:
-        if r.get("id") == order_id:
-            return r
-    raise HTTPException(status_code=404, detail="Order not found")
+    order = orders.get(user_id, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+@router.get("/orders/{order_id}/history")
+def get_order_history(
+    order_id: str,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Creation and every later state change of an order, oldest first."""
+    events = orders.history(user_id, order_id)
+    if events is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return events
 
 
 @router.put("/orders/{order_id}")
@@ -68,14 +177,70 @@ def update_order(
     body: OrderUpdate,
     user_id: str = Depends(get_current_user_id),
 ):
-    rows = csv_store.get_by_user("orders", user_id)
-    if not any(r.get("id") == order_id for r in rows):
+    """Move an order through its lifecycle; invalid transitions are rejected with 409."""
+    order = orders.get(user_id, order_id)
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    updates = body.model_dump(exclude_unset=True)
-    if updates:
-        csv_store.update_row("orders", "id", order_id, updates)
-    rows = csv_store.get_by_user("orders", user_id)
-    return next(r for r in rows if r.get("id") == order_id)
+    if body.status is None:
+        return order
+    status = body.status.upper()
+    change = {"order_id": order_id, "status": status, "reason": "manual"}
+    fill = None
+    if status == orders.FILLED:
+        fill_price = body.fill_price
+        if fill_price is None:
+            point = price_store.latest(order.get("symbol") or "")
+            if point is None:
+                raise HTTPException(status_code=400, detail="No market price for symbol; provide fill_price")
+            fill_price = point[1]
+        filled = to_float(order.get("filled_quantity"))
+        remaining = to_float(order.get("quantity")) - filled
+        fill = {
+            **order,
+            "order_id": order_id,
+            "quantity": remaining,
+            "price": fill_price,
+            "lot_method": tax_lots.preferred_method(user_id),
+        }
+        notional = filled * to_float(order.get("avg_fill_price")) + remaining * fill_price
+        change["filled_quantity"] = format_number(filled + remaining)
+        change["avg_fill_price"] = format_number(notional / (filled + remaining)) if filled + remaining else ""
+    try:
+        with orders.lock:
+            updated = orders.record([change])[0]
+            if fill:
+                positions.apply_fills([fill])
+    except orders.InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return updated
+
+
+@router.get("/positions")
+def get_positions(
+    portfolio_id: str,
+    as_of: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Positions rebuilt from fill events as of a date or timestamp (default: now)."""
+    portfolios = csv_store.get_by_user("portfolios", user_id)
+    if not any(p.get("id") == portfolio_id for p in portfolios):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return positions.positions_as_of(portfolio_id, as_of)
+
+
+@router.get("/positions/events")
+def list_position_events(
+    portfolio_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    portfolios = csv_store.get_by_user("portfolios", user_id)
+    if not any(p.get("id") == portfolio_id for p in portfolios):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return positions.portfolio_events(portfolio_id, start, end)
 
 
 @router.delete("/orders/{order_id}")
@@ -83,8 +248,7 @@ def delete_order(
     order_id: str,
     user_id: str = Depends(get_current_user_id),
 ):
-    rows = csv_store.get_by_user("orders", user_id)
-    if not any(r.get("id") == order_id for r in rows):
+    if orders.get(user_id, order_id) is None:
         raise HTTPException(status_code=404, detail="Order not found")
     csv_store.delete_row("orders", "id", order_id)
     return None
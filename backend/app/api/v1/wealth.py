@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from app.core.auth import get_current_user_id
 from app.db import csv_store
+from app.services import covariance, drift, optimizer, rebalance
 
 router = APIRouter()
 
@@ -19,11 +20,41 @@ class ModelPortfolioUpdate(BaseModel):
 class ClientAccountCreate(BaseModel):
     model_id: str
     name: str
+    portfolio_id: str | None = None  # portfolio holding the account's positions
 
 
 class ClientAccountUpdate(BaseModel):
     model_id: str | None = None
     name: str | None = None
+    portfolio_id: str | None = None
+
+
+class RebalanceRequest(BaseModel):
+    model_id: str | None = None  # None = every model
+    tolerance_pct: float = rebalance.DEFAULT_TOLERANCE_PCT  # sleeves within +/- this many weight points do not trade
+    dry_run: bool = True
+
+
+class OptimizeRequest(BaseModel):
+    symbols: list[str] = []  # universe (default: the model's symbols)
+    model_id: str | None = None  # warm start and turnover reference
+    expected_returns: dict[str, float] | None = None  # annualised; default: historical mean
+    risk_aversion: float = optimizer.DEFAULT_RISK_AVERSION
+    long_only: bool = True
+    min_weight: float = 0.0
+    max_weight: float = 1.0
+    bounds: dict[str, list[float]] = {}  # per-symbol [min, max] weights
+    max_turnover: float | None = None  # max sum of |weight changes| from the model's allocation
+    frontier_points: int = 0
+    risk_aversion_range: tuple[float, float] = optimizer.DEFAULT_RANGE
+    covariance_method: str = "ledoit_wolf"
+    window: int = covariance.DEFAULT_WINDOW
+    save: bool = False  # write the result to the model's allocation_json
+
+
+def _check_portfolio(user_id: str, portfolio_id: str | None) -> None:
+    if portfolio_id and not any(p.get("id") == portfolio_id for p in csv_store.get_by_user("portfolios", user_id)):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
 
 
 @router.get("/models")
@@ -38,6 +69,33 @@ def create_model(body: ModelPortfolioCreate, user_id: str = Depends(get_current_
     return row
 
 
+@router.post("/models/optimize")
+def optimize_model(body: OptimizeRequest, user_id: str = Depends(get_current_user_id)):
+    """Mean-variance optimal allocation (and optionally an efficient frontier) for a model."""
+    if body.model_id and not any(m.get("id") == body.model_id for m in csv_store.get_by_user("model_portfolios", user_id)):
+        raise HTTPException(status_code=404, detail="Model portfolio not found")
+    try:
+        return optimizer.optimize(
+            user_id,
+            body.symbols,
+            model_id=body.model_id,
+            expected_returns=body.expected_returns,
+            risk_aversion=body.risk_aversion,
+            min_weight=body.min_weight,
+            max_weight=body.max_weight,
+            bounds=body.bounds,
+            long_only=body.long_only,
+            max_turnover=body.max_turnover,
+            frontier_points=body.frontier_points,
+            risk_aversion_range=body.risk_aversion_range,
+            method=body.covariance_method,
+            window=body.window,
+            save=body.save,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/models/{model_id}")
 def get_model(model_id: str, user_id: str = Depends(get_current_user_id)):
     rows = csv_store.get_by_user("model_portfolios", user_id)
@@ -80,11 +138,42 @@ def create_client_account(body: ClientAccountCreate, user_id: str = Depends(get_
     models = csv_store.get_by_user("model_portfolios", user_id)
     if not any(m.get("id") == body.model_id for m in models):
         raise HTTPException(status_code=404, detail="Model portfolio not found")
-    row = {"id": csv_store.generate_id(), "user_id": user_id, "model_id": body.model_id, "name": body.name}
+    _check_portfolio(user_id, body.portfolio_id)
+    row = {
+        "id": csv_store.generate_id(),
+        "user_id": user_id,
+        "model_id": body.model_id,
+        "name": body.name,
+        "portfolio_id": body.portfolio_id or "",
+    }
     csv_store.append_row("client_accounts", row)
     return row
 
 
+@router.post("/rebalance")
+def rebalance_accounts(body: RebalanceRequest, user_id: str = Depends(get_current_user_id)):
+    """
+    Compare every linked client account of a model (or all models) with its targets and
+    generate the minimal order set; with ``dry_run`` false the orders are submitted as one batch.
+    """
+    if body.model_id and not any(m.get("id") == body.model_id for m in csv_store.get_by_user("model_portfolios", user_id)):
+        raise HTTPException(status_code=404, detail="Model portfolio not found")
+    try:
+        return rebalance.rebalance(user_id, body.model_id, body.tolerance_pct, body.dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/drift/top")
+def top_drifted_accounts(
+    limit: int = Query(20, ge=1, le=1000),
+    model_id: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    """Linked client accounts with the largest drift from their model, served from the drift monitor."""
+    return drift.top(user_id, limit, model_id)
+
+
 @router.get("/client-accounts/{account_id}")
 def get_client_account(account_id: str, user_id: str = Depends(get_current_user_id)):
     rows = csv_store.get_by_user("client_accounts", user_id)
@@ -100,6 +189,7 @@ def update_client_account(account_id: str, body: ClientAccountUpdate, user_id: s
     if not any(r.get("id") == account_id for r in rows):
         raise HTTPException(status_code=404, detail="Client account not found")
     updates = body.model_dump(exclude_unset=True)
+    _check_portfolio(user_id, updates.get("portfolio_id"))
     if updates:
         csv_store.update_row("client_accounts", "id", account_id, updates)
     return next(r for r in csv_store.get_by_user("client_accounts", user_id) if r.get("id") == account_id)
@@ -7,6 +7,20 @@ class Settings(BaseSettings):
     secret_key: str = "change-me-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60 * 24 * 7  # 1 week
+    base_currency: str = "USD"  # FX rates are stored against this currency
+    simulate_execution: bool = True  # match new orders in the local execution simulator
+    position_snapshot_interval: int = 500  # position events per portfolio between snapshots
+    risk_workers: int = 0  # process pool size for risk engines (0 = one per CPU)
+    risk_parallel_min_portfolios: int = 32  # below this, risk runs in-process
+    risk_cache_size: int = 10_000  # cached (scenario params, portfolio) results
+    rebalance_parallel_min_accounts: int = 20_000  # below this, rebalance plans run in-process
+    job_workers: int = 2  # background job threads started with the app
+    job_risk_chunk: int = 10  # scenarios per batch (and progress step) in risk_run jobs
+    sse_heartbeat_seconds: float = 15.0  # comment line sent on idle event streams
+    mc_chunk_paths: int = 20_000  # Monte Carlo paths generated per block
+    mc_max_paths: int = 5_000_000
+    mc_parallel_min_paths: int = 200_000  # below this, Monte Carlo runs in-process
+    mc_memory_floats: int = 16_000_000  # Monte Carlo tail and P&L buffers per process (8 bytes each)
 
     class Config:
         env_prefix = "ALADDIN_"
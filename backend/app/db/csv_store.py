@@ -1,7 +1,10 @@
 import csv
+import logging
 import os
 import tempfile
+import threading
 import uuid
+from collections.abc import Callable, Iterator
 from pathlib import Path
 from typing import Any
 
@@ -14,20 +17,78 @@ TABLE_SCHEMAS: dict[str, list[str]] = {
     "holdings": ["id", "portfolio_id", "user_id", "symbol", "asset_class", "quantity", "avg_cost"],
     "risk_scenarios": ["id", "user_id", "name", "scenario_type", "params_json"],
     "risk_results": ["id", "user_id", "scenario_id", "portfolio_id", "metric", "value"],
-    "orders": ["id", "user_id", "portfolio_id", "symbol", "side", "quantity", "order_type", "status", "created_at"],
-    "accounts": ["id", "user_id", "name", "account_type", "currency"],
-    "transactions": ["id", "user_id", "account_id", "type", "amount", "date", "description"],
+    "orders": ["id", "user_id", "portfolio_id", "symbol", "side", "quantity", "order_type", "status", "created_at", "limit_price", "filled_quantity", "avg_fill_price"],
+    "accounts": ["id", "user_id", "name", "account_type", "currency", "portfolio_id"],
+    "transactions": ["id", "user_id", "account_id", "type", "amount", "date", "description", "order_id"],
     "funds": ["id", "user_id", "name", "strategy", "vintage_year"],
     "commitments": ["id", "user_id", "fund_id", "amount", "currency", "date"],
+    "fund_cash_flows": ["id", "user_id", "fund_id", "flow_type", "amount", "currency", "date"],
     "saved_reports": ["id", "user_id", "name", "report_type", "config_json", "created_at"],
     "portfolio_esg": ["id", "user_id", "portfolio_id", "score_type", "value", "as_of_date"],
     "model_portfolios": ["id", "user_id", "name", "allocation_json"],
-    "client_accounts": ["id", "user_id", "model_id", "name"],
+    "client_accounts": ["id", "user_id", "model_id", "name", "portfolio_id"],
     "integrations": ["id", "user_id", "provider", "integration_type", "status", "config_json"],
     "user_preferences": ["user_id", "key", "value"],
     "design_principles_preferences": ["user_id", "key", "value"],
+    "position_events": ["id", "user_id", "portfolio_id", "order_id", "symbol", "side", "quantity", "price", "executed_at", "lot_method"],
+    "position_snapshots": ["id", "user_id", "portfolio_id", "as_of", "event_count", "positions_json"],
+    "order_events": ["id", "order_id", "user_id", "from_status", "from_filled_quantity", "from_avg_fill_price", "status", "filled_quantity", "avg_fill_price", "reason", "at"],
+    "compliance_rules": ["id", "user_id", "name", "rule_type", "params_json", "enabled"],
+    "fx_rates": ["currency", "rate", "as_of"],
+    "securities": ["symbol", "name", "asset_class", "currency", "sector", "isin", "cusip"],
+    "factor_loadings": ["symbol", "rates", "equity", "credit", "fx", "specific_vol"],
+    "reconciliation_breaks": ["id", "user_id", "run_id", "break_type", "portfolio_id", "symbol", "order_id", "expected", "actual", "difference", "detected_at"],
+    "jobs": ["id", "user_id", "job_type", "status", "params_json", "progress", "error", "cancel_requested", "created_at", "started_at", "finished_at"],
 }
 
+logger = logging.getLogger(__name__)
+
+# Table name -> write counter. Lets callers key in-memory caches on table contents.
+_versions: dict[str, int] = {}
+
+# Mutation hook: (op, old_row, new_row). op is "insert", "update", "delete", or
+# "reset" when the whole table was overwritten via write_table (both rows None).
+MutationHook = Callable[[str, dict[str, Any] | None, dict[str, Any] | None], None]
+_hooks: dict[str, list[MutationHook]] = {}
+
+# Table name -> lock serialising read-modify-write cycles (and their hook calls)
+# between request threads and background workers.
+_table_locks: dict[str, threading.RLock] = {}
+_table_locks_guard = threading.Lock()
+
+
+def _lock_for(name: str) -> threading.RLock:
+    with _table_locks_guard:
+        return _table_locks.setdefault(name, threading.RLock())
+
+
+def table_lock(name: str) -> threading.RLock:
+    """The (re-entrant) lock every mutator of a table holds; hold it to make a read-modify-write atomic."""
+    return _lock_for(name)
+
+
+def add_mutation_hook(name: str, hook: MutationHook) -> None:
+    """Call hook after every row insert/update/delete on a table (in the writer's thread)."""
+    _get_columns(name)
+    _hooks.setdefault(name, []).append(hook)
+
+
+def _notify(name: str, op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    for hook in _hooks.get(name, ()):
+        try:
+            hook(op, old, new)
+        except Exception:
+            logger.exception("Mutation hook failed for table %s", name)
+
+
+def table_version(name: str) -> int:
+    """Number of writes to a table made by this process (0 if untouched)."""
+    return _versions.get(name, 0)
+
+
+def _bump_version(name: str) -> None:
+    _versions[name] = _versions.get(name, 0) + 1
+
 
 def _table_path(name: str) -> Path:
     path = Path(settings.data_dir)
@@ -63,8 +124,32 @@ def read_table(name: str) -> list[dict[str, Any]]:
     return rows
 
 
+def iter_rows(name: str, columns: list[str]) -> Iterator[tuple[str, ...]]:
+    """Stream the given columns of every row as tuples, without loading the table."""
+    path = _table_path(name)
+    all_columns = _get_columns(name)
+    _ensure_headers(path, all_columns)
+    picks = [all_columns.index(c) for c in columns]
+    width = len(all_columns)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # skip header
+        for row in reader:
+            if not any(row):
+                continue
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            yield tuple(row[i] for i in picks)
+
+
 def write_table(name: str, rows: list[dict[str, Any]]) -> None:
     """Overwrite table with given rows. Atomic write (temp file then replace)."""
+    with _lock_for(name):
+        _write_rows(name, rows)
+        _notify(name, "reset", None, None)
+
+
+def _write_rows(name: str, rows: list[dict[str, Any]]) -> None:
     path = _table_path(name)
     columns = _get_columns(name)
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -75,6 +160,7 @@ def write_table(name: str, rows: list[dict[str, Any]]) -> None:
             writer.writeheader()
             writer.writerows(rows)
         os.replace(tmp, path)
+        _bump_version(name)
     except Exception:
         if os.path.exists(tmp):
             os.unlink(tmp)
@@ -83,39 +169,150 @@ def write_table(name: str, rows: list[dict[str, Any]]) -> None:
 
 def append_row(name: str, row: dict[str, Any]) -> None:
     """Append one row. Row must contain all columns; id can be generated if missing."""
-    columns = _get_columns(name)
-    path = _table_path(name)
-    _ensure_headers(path, columns)
-    if "id" in columns and (not row.get("id")):
-        row = {**row, "id": str(uuid.uuid4())}
-    out = {c: row.get(c, "") for c in columns}
-    with open(path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
-        writer.writerow(out)
+    with _lock_for(name):
+        columns = _get_columns(name)
+        path = _table_path(name)
+        _ensure_headers(path, columns)
+        if "id" in columns and (not row.get("id")):
+            row = {**row, "id": str(uuid.uuid4())}
+        out = {c: row.get(c, "") for c in columns}
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writerow(out)
+        _bump_version(name)
+        _notify(name, "insert", None, out)
+
+
+def append_rows(name: str, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Append many rows with a single file open. Returns the rows as written (ids filled in)."""
+    with _lock_for(name):
+        columns = _get_columns(name)
+        path = _table_path(name)
+        _ensure_headers(path, columns)
+        out = []
+        for row in rows:
+            if "id" in columns and (not row.get("id")):
+                row = {**row, "id": str(uuid.uuid4())}
+            out.append({c: row.get(c, "") for c in columns})
+        if not out:
+            return out
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writerows(out)
+        _bump_version(name)
+        for row in out:
+            _notify(name, "insert", None, row)
+        return out
 
 
 def update_row(name: str, id_field: str, id_value: str, updates: dict[str, Any]) -> bool:
     """Update the first row where id_field == id_value. Returns True if a row was updated."""
-    rows = read_table(name)
-    columns = _get_columns(name)
-    for i, row in enumerate(rows):
-        if str(row.get(id_field, "")) == str(id_value):
-            for k, v in updates.items():
-                if k in columns:
-                    rows[i][k] = v
-            write_table(name, rows)
-            return True
-    return False
+    with _lock_for(name):
+        rows = read_table(name)
+        columns = _get_columns(name)
+        for i, row in enumerate(rows):
+            if str(row.get(id_field, "")) == str(id_value):
+                old = dict(row)
+                for k, v in updates.items():
+                    if k in columns:
+                        rows[i][k] = v
+                _write_rows(name, rows)
+                _notify(name, "update", old, rows[i])
+                return True
+        return False
 
 
 def delete_row(name: str, id_field: str, id_value: str) -> bool:
     """Remove the first row where id_field == id_value. Returns True if a row was removed."""
-    rows = read_table(name)
-    new_rows = [r for r in rows if str(r.get(id_field, "")) != str(id_value)]
-    if len(new_rows) == len(rows):
-        return False
-    write_table(name, new_rows)
-    return True
+    with _lock_for(name):
+        rows = read_table(name)
+        new_rows = [r for r in rows if str(r.get(id_field, "")) != str(id_value)]
+        if len(new_rows) == len(rows):
+            return False
+        _write_rows(name, new_rows)
+        for old in rows:
+            if str(old.get(id_field, "")) == str(id_value):
+                _notify(name, "delete", old, None)
+        return True
+
+
+def update_rows(name: str, id_field: str, updates: dict[str, dict[str, Any]]) -> int:
+    """Apply updates keyed by id_value in one rewrite. Returns the number of rows updated."""
+    with _lock_for(name):
+        if not updates:
+            return 0
+        rows = read_table(name)
+        columns = _get_columns(name)
+        changed = []
+        for row in rows:
+            patch = updates.get(str(row.get(id_field, "")))
+            if patch is None:
+                continue
+            old = dict(row)
+            for k, v in patch.items():
+                if k in columns:
+                    row[k] = v
+            changed.append((old, row))
+        if changed:
+            _write_rows(name, rows)
+            for old, new in changed:
+                _notify(name, "update", old, new)
+        return len(changed)
+
+
+def upsert_rows(name: str, key_fields: list[str], rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Insert rows, replacing existing rows with the same key_fields values (their id is kept),
+    in one rewrite; nothing is written if every row is already stored as given.
+    Returns the rows as stored.
+    """
+    with _lock_for(name):
+        if not rows:
+            return []
+        columns = _get_columns(name)
+        existing = read_table(name)
+        position = {tuple(r.get(k, "") for k in key_fields): i for i, r in enumerate(existing)}
+        events: list[tuple[str, dict[str, Any] | None, dict[str, Any]]] = []
+        stored = []
+        for row in rows:
+            key = tuple(row.get(k, "") for k in key_fields)
+            i = position.get(key)
+            if i is None:
+                new = {c: row.get(c, "") for c in columns}
+                if "id" in columns and not new.get("id"):
+                    new["id"] = str(uuid.uuid4())
+                position[key] = len(existing)
+                existing.append(new)
+                events.append(("insert", None, new))
+            else:
+                old = existing[i]
+                new = {**{c: row.get(c, "") for c in columns}, **({"id": old["id"]} if "id" in columns else {})}
+                if new != old:
+                    existing[i] = new
+                    events.append(("update", old, new))
+            stored.append(new)
+        if not events:
+            return stored
+        _write_rows(name, existing)
+        for op, old, new in events:
+            _notify(name, op, old, new)
+        return stored
+
+
+def delete_rows(name: str, id_field: str, id_values: set[str]) -> int:
+    """Remove every row whose id_field is in id_values in one rewrite. Returns rows removed."""
+    with _lock_for(name):
+        if not id_values:
+            return 0
+        rows = read_table(name)
+        kept, removed = [], []
+        for row in rows:
+            (removed if str(row.get(id_field, "")) in id_values else kept).append(row)
+        if removed:
+            _write_rows(name, kept)
+            for old in removed:
+                _notify(name, "delete", old, None)
+        return len(removed)
 
 
 def get_by_user(table: str, user_id: str) -> list[dict[str, Any]]:
@@ -0,0 +1,340 @@
+"""Per-symbol daily close series stored as memory-mapped NumPy arrays."""
+import csv
+import io
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TextIO
+
+import numpy as np
+
+from app.core.config import settings
+
+RECORD_DTYPE = np.dtype([("date", "datetime64[D]"), ("close", "<f8")])
+_SUFFIX = ".npy"
+
+_lock = threading.RLock()
+# Symbol -> memory-mapped record array (opened lazily, replaced on write)
+_series_cache: dict[str, np.ndarray] = {}
+# Bumped on every write so callers can key caches on the store contents; persisted in
+# _VERSION_FILE so pool workers and other processes see writes made elsewhere
+_version = 0
+_VERSION_FILE = ".version"
+_as_of_cache: tuple[int, str | None] | None = None
+# (version, symbol, earliest date written) per write, newest last; bounded
+_changes: list[tuple[int, str, np.datetime64]] = []
+_changes_floor = 0  # versions at or below this may be missing from _changes
+_MAX_CHANGES = 10_000
+_EARLIEST = np.datetime64("0001-01-01", "D")
+
+
+def _prices_dir() -> Path:
+    path = Path(settings.data_dir) / "prices"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def normalize_symbol(symbol: str) -> str:
+    return symbol.strip().upper()
+
+
+def _encode_filename(symbol: str) -> str:
+    """Map a symbol to a filesystem-safe name (e.g. ``BRK/B`` -> ``BRK%2FB``)."""
+    return "".join(c if c.isalnum() or c in "._-" else f"%{ord(c):02X}" for c in symbol)
+
+
+def _decode_filename(name: str) -> str:
+    out, i = [], 0
+    while i < len(name):
+        if name[i] == "%":
+            out.append(chr(int(name[i + 1:i + 3], 16)))
+            i += 3
+        else:
+            out.append(name[i])
+            i += 1
+    return "".join(out)
+
+
+def _series_path(symbol: str) -> Path:
+    return _prices_dir() / f"{_encode_filename(symbol)}{_SUFFIX}"
+
+
+def _to_dates(values: Iterable) -> np.ndarray:
+    """Parse ISO date strings (time part ignored) or datetimes into datetime64[D]."""
+    if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[D]")
+    return np.array([str(v)[:10] for v in values], dtype="datetime64[D]")
+
+
+def _open_series(symbol: str) -> np.ndarray | None:
+    with _lock:
+        _sync_version()
+        cached = _series_cache.get(symbol)
+        if cached is not None:
+            return cached
+        path = _series_path(symbol)
+        if not path.exists():
+            return None
+        series = np.load(path, mmap_mode="r")
+        _series_cache[symbol] = series
+        return series
+
+
+def _sync_version() -> None:
+    """Adopt the stored version if another process wrote since (caller holds _lock)."""
+    global _version, _changes_floor
+    try:
+        stored = int((_prices_dir() / _VERSION_FILE).read_text(encoding="utf-8") or 0)
+    except (OSError, ValueError):
+        return
+    if stored > _version:
+        _version = stored
+        _changes_floor = stored  # what those writes touched is unknown here
+        _series_cache.clear()  # cached maps may point at replaced files
+
+
+def version() -> int:
+    """Monotonic counter of store writes, shared by every process using the data dir."""
+    with _lock:
+        _sync_version()
+        return _version
+
+
+def _record_change(symbol: str, first: np.datetime64) -> None:
+    """Bump the version and log a write (caller holds _lock)."""
+    global _version, _changes_floor
+    _sync_version()
+    _version += 1
+    fd, tmp = tempfile.mkstemp(dir=_prices_dir(), prefix=".version_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(str(_version))
+    os.replace(tmp, _prices_dir() / _VERSION_FILE)
+    _changes.append((_version, symbol, first))
+    if len(_changes) > _MAX_CHANGES:
+        drop = len(_changes) - _MAX_CHANGES // 2
+        _changes_floor = _changes[drop - 1][0]
+        del _changes[:drop]
+
+
+def changed_since(since: int, symbol_list: Iterable[str]) -> np.datetime64 | None:
+    """
+    Earliest date written for any of ``symbol_list`` by writes after version ``since``;
+    None if there were none. Unknown (too old to tell) counts as the earliest possible date.
+    """
+    wanted = {normalize_symbol(s) for s in symbol_list}
+    with _lock:
+        _sync_version()
+        if since < _changes_floor:
+            return _EARLIEST
+        earliest = None
+        for v, symbol, first in reversed(_changes):
+            if v <= since:
+                break
+            if symbol in wanted and (earliest is None or first < earliest):
+                earliest = first
+        return earliest
+
+
+def changed_symbols(since: int) -> set[str] | None:
+    """Symbols written after version ``since``; None if that is too old to tell."""
+    with _lock:
+        _sync_version()
+        if since < _changes_floor:
+            return None
+        changed = set()
+        for v, symbol, _ in reversed(_changes):
+            if v <= since:
+                break
+            changed.add(symbol)
+        return changed
+
+
+def symbols() -> list[str]:
+    """All symbols with a stored series, sorted."""
+    names = (p.name[: -len(_SUFFIX)] for p in _prices_dir().glob(f"*{_SUFFIX}"))
+    return sorted(_decode_filename(n) for n in names)
+
+
+def get_series(
+    symbol: str,
+    start: str | None = None,
+    end: str | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return ``(dates, closes)`` for ``start <= date <= end`` (both optional, inclusive).
+    Both arrays are views over the memory map; unknown symbols give empty arrays.
+    """
+    series = _open_series(normalize_symbol(symbol))
+    if series is None:
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.float64)
+    dates = series["date"]
+    lo = int(np.searchsorted(dates, np.datetime64(start[:10], "D"), side="left")) if start else 0
+    hi = int(np.searchsorted(dates, np.datetime64(end[:10], "D"), side="right")) if end else len(dates)
+    window = series[lo:hi]
+    return window["date"], window["close"]
+
+
+def latest(symbol: str) -> tuple[str, float] | None:
+    """Most recent ``(date, close)`` for a symbol, or None if it has no history."""
+    series = _open_series(normalize_symbol(symbol))
+    if series is None or len(series) == 0:
+        return None
+    last = series[-1]
+    return str(last["date"]), float(last["close"])
+
+
+def latest_prices(symbol_list: Iterable[str]) -> np.ndarray:
+    """Latest close for each symbol as a float64 array (NaN where no history)."""
+    keys = [normalize_symbol(s) for s in symbol_list]
+    unique: dict[str, float] = {}
+    for key in keys:
+        if key not in unique:
+            series = _open_series(key)
+            unique[key] = series["close"][-1] if series is not None and len(series) else np.nan
+    return np.array([unique[k] for k in keys], dtype=np.float64)
+
+
+def price_as_of(symbol: str, as_of: str) -> float | None:
+    """Close on or before ``as_of`` (last observation carried forward)."""
+    series = _open_series(normalize_symbol(symbol))
+    if series is None:
+        return None
+    i = int(np.searchsorted(series["date"], np.datetime64(as_of[:10], "D"), side="right"))
+    return float(series["close"][i - 1]) if i else None
+
+
+def aligned_closes(
+    symbol_list: list[str],
+    periods: int,
+    end: str | None = None,
+    start: str | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Closes for ``symbol_list`` on the last ``periods`` dates (union calendar) from ``start``
+    up to ``end`` (both optional, inclusive).
+    Returns ``(dates, matrix)`` with one column per symbol; each column carries its last
+    close forward over dates it has no observation for, and is NaN before its first one.
+    """
+    tails = []
+    for s in symbol_list:
+        dates, closes = get_series(s, end=end)
+        tails.append((dates, closes))
+    lo = np.datetime64(start[:10], "D") if start else None
+    recent = [d[-periods:] if lo is None else d[-periods:][d[-periods:] >= lo] for d, _ in tails]
+    union = np.unique(np.concatenate(recent)) if tails else np.empty(0, "datetime64[D]")
+    union = union[-periods:]
+    matrix = np.full((len(union), len(symbol_list)), np.nan)
+    for j, (dates, closes) in enumerate(tails):
+        if not len(dates):
+            continue
+        idx = np.searchsorted(dates, union, side="right") - 1
+        have = idx >= 0
+        matrix[have, j] = closes[idx[have]]
+    return union, matrix
+
+
+def as_of_date() -> str | None:
+    """Latest date present in the store (the date current prices refer to)."""
+    global _as_of_cache
+    current = version()
+    cached = _as_of_cache
+    if cached is not None and cached[0] == current:
+        return cached[1]
+    best: np.datetime64 | None = None
+    for s in symbols():
+        series = _open_series(s)
+        if series is not None and len(series) and (best is None or series["date"][-1] > best):
+            best = series["date"][-1]
+    result = str(best) if best is not None else None
+    _as_of_cache = (current, result)
+    return result
+
+
+def upsert_series(symbol: str, dates: Iterable, closes: Iterable[float]) -> int:
+    """
+    Merge observations into a symbol's series. New values replace existing ones on
+    the same date. Returns the resulting series length.
+    """
+    key = normalize_symbol(symbol)
+    new_dates = _to_dates(dates)
+    new_closes = np.asarray(closes if isinstance(closes, np.ndarray) else list(closes), dtype=np.float64)
+    if len(new_dates) != len(new_closes):
+        raise ValueError("dates and closes must have the same length")
+    new = np.empty(len(new_dates), dtype=RECORD_DTYPE)
+    new["date"] = new_dates
+    new["close"] = new_closes
+    with _lock:
+        existing = _open_series(key)
+        merged = np.concatenate([np.asarray(existing), new]) if existing is not None else new
+        # Stable sort keeps new rows after old ones on equal dates; keep the last of each run
+        merged = merged[np.argsort(merged["date"], kind="stable")]
+        if len(merged):
+            keep = np.append(merged["date"][1:] != merged["date"][:-1], True)
+            merged = merged[keep]
+        if len(merged) == 0:
+            return 0
+        # Drop our map of the old file before replacing it (an open mapping blocks the replace on Windows).
+        del existing
+        _series_cache.pop(key, None)
+        path = _series_path(key)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".prices_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, merged)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        _record_change(key, new_dates.min())
+        return len(merged)
+
+
+def delete_series(symbol: str) -> bool:
+    key = normalize_symbol(symbol)
+    with _lock:
+        _series_cache.pop(key, None)
+        path = _series_path(key)
+        if not path.exists():
+            return False
+        path.unlink()
+        _record_change(key, _EARLIEST)
+        return True
+
+
+def load_csv(source: str | Path | TextIO, symbol: str | None = None) -> dict[str, int]:
+    """
+    Bulk load closes from CSV. Columns are ``symbol,date,close``; the symbol column
+    may be omitted for single-symbol files, in which case ``symbol`` (or the file
+    stem) is used. Returns symbol -> resulting series length.
+    """
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            return load_csv(f, symbol or path.stem)
+    grouped: dict[str, tuple[list[str], list[float]]] = defaultdict(lambda: ([], []))
+    reader = csv.DictReader(source)
+    for row in reader:
+        sym = row.get("symbol") or symbol
+        date, close = row.get("date"), row.get("close")
+        if not sym or not date or close in (None, ""):
+            continue
+        bucket = grouped[normalize_symbol(sym)]
+        bucket[0].append(date)
+        bucket[1].append(float(close))
+    return {sym: upsert_series(sym, d, c) for sym, (d, c) in grouped.items()}
+
+
+def load_csv_text(text: str) -> dict[str, int]:
+    return load_csv(io.StringIO(text))
+
+
+def load_csv_dir(directory: str | Path) -> dict[str, int]:
+    """Load every ``*.csv`` in a directory (one symbol per file, or long format)."""
+    loaded: dict[str, int] = {}
+    for path in sorted(Path(directory).glob("*.csv")):
+        loaded.update(load_csv(path))
+    return loaded
@@ -7,6 +7,7 @@ from app.api.v1 import api_router
 from app.core.config import settings
 from app.db import csv_store
 from app.core.auth import hash_password
+from app.services import jobs, pool
 
 
 @asynccontextmanager
@@ -21,7 +22,10 @@ async def lifespan(app: FastAPI):
             "password_hash": hash_password("demo"),
             "display_name": "Demo User",
         })
+    jobs.start()
     yield
+    jobs.stop()
+    pool.shutdown()
 
 
 app = FastAPI(
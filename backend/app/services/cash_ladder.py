@@ -0,0 +1,176 @@
+"""Cash projection ladder: expected cash per account, currency and day."""
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import ledger, orders, securities
+from app.services.numeric import to_float
+
+SETTLEMENT_DAYS: dict[str, int] = {"equity": 1, "fixed_income": 1, "cash": 0}
+DEFAULT_SETTLEMENT_DAYS = 2
+MAX_DAYS = 366
+
+_lock = threading.Lock()
+_cache: dict[str, dict[tuple, dict[str, Any]]] = {}  # user_id -> key -> ladder
+_generation: dict[str, int] = {}  # user_id -> invalidation count
+_reset_count = 0
+_MAX_PER_USER = 32
+
+
+def _invalidate(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _reset_count
+    with _lock:
+        if op == "reset":
+            _cache.clear()
+            _reset_count += 1
+            return
+        for row in (old, new):
+            if row is not None:
+                user_id = row.get("user_id") or ""
+                _cache.pop(user_id, None)
+                _generation[user_id] = _generation.get(user_id, 0) + 1
+
+
+for _table in ("orders", "order_events", "transactions", "accounts", "portfolios"):
+    csv_store.add_mutation_hook(_table, _invalidate)
+
+
+def _day(text: str) -> date:
+    try:
+        return date.fromisoformat((text or "")[:10])
+    except ValueError:
+        raise ValueError(f"Invalid date: {text!r}")
+
+
+def _order_flows(
+    user_id: str, settle_into: dict[str, str], portfolio_currency: dict[str, str],
+) -> tuple[list[str], list[str], list[int], list[float], int]:
+    """(account ids, currencies, settlement lags, amounts) for open orders, plus the unpriced count."""
+    pending = [
+        o for o in orders.list_orders(user_id)
+        if o.get("status") in orders.OPEN and o.get("portfolio_id") in settle_into
+    ]
+    if not pending:
+        return [], [], [], [], 0
+    remaining = np.array([to_float(o.get("quantity")) - to_float(o.get("filled_quantity")) for o in pending])
+    price = np.array([to_float(o.get("limit_price")) for o in pending])
+    no_limit = price <= 0
+    if no_limit.any():
+        price[no_limit] = price_store.latest_prices([o.get("symbol") or "" for o in pending])[no_limit]
+    sign = np.array([1.0 if (o.get("side") or "").upper() == "SELL" else -1.0 for o in pending])
+    priced = (price > 0) & (remaining > 0)
+    amounts = sign * remaining * np.where(priced, price, 0.0)
+    master = securities.master()
+    classes = securities.asset_classes(pending)
+    accounts, currencies, lags, out = [], [], [], []
+    for i in np.flatnonzero(priced):
+        o = pending[i]
+        row = master.get(price_store.normalize_symbol(o.get("symbol") or "")) or {}
+        accounts.append(settle_into[o["portfolio_id"]])
+        currencies.append(row.get("currency") or portfolio_currency.get(o["portfolio_id"]) or "")
+        lags.append(SETTLEMENT_DAYS.get(classes[i], DEFAULT_SETTLEMENT_DAYS))
+        out.append(float(amounts[i]))
+    unpriced = int(((remaining > 0) & ~priced).sum())
+    return accounts, currencies, lags, out, unpriced
+
+
+def _build(user_id: str, start: date, days: int) -> dict[str, Any]:
+    accounts = csv_store.get_by_user("accounts", user_id)
+    account_currency = {a["id"]: (a.get("currency") or "").upper() for a in accounts}
+    portfolio_currency = {p["id"]: p.get("currency") or "" for p in csv_store.get_by_user("portfolios", user_id)}
+    settle_into: dict[str, str] = {}
+    for a in accounts:
+        if a.get("portfolio_id") in portfolio_currency:
+            settle_into.setdefault(a["portfolio_id"], a["id"])
+
+    keys: dict[tuple[str, str], int] = {}  # (account_id, currency) -> grid row
+    for a in accounts:
+        keys[(a["id"], account_currency[a["id"]])] = len(keys)
+    t_rows, o_rows, cols, amounts = [], [], [], []
+    end = start + timedelta(days=days)
+    for t in csv_store.get_by_user("transactions", user_id):
+        if t.get("account_id") not in account_currency:
+            continue
+        try:
+            when = _day(t.get("date") or "")
+        except ValueError:
+            continue
+        if start < when <= end:
+            t_rows.append(keys[(t["account_id"], account_currency[t["account_id"]])])
+            cols.append((when - start).days)
+            amounts.append(to_float(t.get("amount")))
+
+    o_accounts, o_currencies, o_lags, o_amounts, unpriced = _order_flows(user_id, settle_into, portfolio_currency)
+    for account_id, currency, lag, amount in zip(o_accounts, o_currencies, o_lags, o_amounts):
+        if lag > days:
+            continue
+        key = (account_id, currency.upper() or account_currency[account_id])
+        o_rows.append(keys.setdefault(key, len(keys)))
+        cols.append(lag)
+        amounts.append(amount)
+
+    scheduled = np.bincount(np.array(t_rows, dtype=np.int64), minlength=len(keys))
+    pending = np.bincount(np.array(o_rows, dtype=np.int64), minlength=len(keys))
+    rows = np.array(t_rows + o_rows, dtype=np.int64)
+    flows = np.zeros((len(keys), days + 1))
+    np.add.at(flows, (rows, np.array(cols, dtype=np.int64)), np.array(amounts, dtype=np.float64))
+    opening = np.zeros(len(keys))
+    for a in accounts:
+        opening[keys[(a["id"], account_currency[a["id"]])]] = ledger.balance(a["id"], start.isoformat())[0]
+    balances = opening[:, None] + np.cumsum(flows, axis=1)
+
+    ladders: dict[str, dict[str, Any]] = {
+        a["id"]: {"account_id": a["id"], "name": a.get("name"), "currency": account_currency[a["id"]], "currencies": []}
+        for a in accounts
+    }
+    for (account_id, currency), i in keys.items():
+        ladders[account_id]["currencies"].append({
+            "currency": currency,
+            "opening_balance": float(opening[i]),
+            "flows": flows[i].tolist(),
+            "balances": balances[i].tolist(),
+            "min_balance": float(balances[i].min()),
+            "scheduled_transactions": int(scheduled[i]),
+            "pending_orders": int(pending[i]),
+        })
+    return {
+        "as_of": start.isoformat(),
+        "days": days,
+        "dates": [(start + timedelta(days=d)).isoformat() for d in range(days + 1)],
+        "unpriced_orders": unpriced,
+        "accounts": list(ladders.values()),
+    }
+
+
+def ladders(user_id: str, days: int = 10, as_of: str | None = None) -> dict[str, Any]:
+    """Cash ladders for all of the user's accounts. Raises ValueError for a bad horizon or date."""
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+    start = _day(as_of) if as_of else datetime.now(timezone.utc).date()
+    key = (start, days, price_store.version(), securities.version())
+    with _lock:
+        hit = _cache.get(user_id, {}).get(key)
+        seen = (_generation.get(user_id, 0), _reset_count)
+    if hit is not None:
+        return hit
+    result = _build(user_id, start, days)
+    with _lock:
+        # A write that landed during the build may not be reflected; don't cache it.
+        if seen == (_generation.get(user_id, 0), _reset_count):
+            entries = _cache.setdefault(user_id, {})
+            if len(entries) >= _MAX_PER_USER:
+                entries.clear()
+            entries[key] = result
+    return result
+
+
+def ladder(user_id: str, account_id: str, days: int = 10, as_of: str | None = None) -> dict[str, Any] | None:
+    """One account's cash ladder, or None if the user has no such account."""
+    full = ladders(user_id, days, as_of)
+    account = next((a for a in full["accounts"] if a["account_id"] == account_id), None)
+    if account is None:
+        return None
+    return {k: v for k, v in full.items() if k != "accounts"} | account
@@ -0,0 +1,216 @@
+"""Pre-trade compliance."""
+import json
+import threading
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import execution, securities
+from app.services.numeric import to_float
+from app.services.valuation import price_holdings
+
+RULE_TYPES = ("max_weight_symbol", "max_weight_asset_class", "restricted_symbols", "min_cash")
+CASH_CLASS = "cash"
+_EPS = 1e-9
+
+
+class _Rule:
+    __slots__ = ("id", "name", "rule_type", "portfolios", "limit", "securities", "asset_class", "sides", "min_amount", "min_frac")
+
+    def __init__(self, row: dict[str, Any]):
+        try:
+            params = json.loads(row.get("params_json") or "{}")
+        except json.JSONDecodeError:
+            raise ValueError("params_json must be valid JSON") from None
+        if not isinstance(params, dict):
+            raise ValueError("params_json must be a JSON object")
+        self.id = row.get("id") or ""
+        self.name = row.get("name") or self.id
+        self.rule_type = row.get("rule_type") or ""
+        if self.rule_type not in RULE_TYPES:
+            raise ValueError(f"rule_type must be one of {', '.join(RULE_TYPES)}")
+        self.portfolios = set(params.get("portfolio_ids") or []) or None
+        symbols = [str(s) for s in params.get("symbols") or []]
+        self.securities = securities.intern(symbols) if symbols else None
+        self.asset_class = params.get("asset_class") or None
+        self.sides = {str(s).upper() for s in params.get("sides") or ["BUY", "SELL"]}
+        self.limit = to_float(params.get("max_pct"), -1.0) / 100.0
+        self.min_amount = to_float(params.get("min_amount"))
+        self.min_frac = to_float(params.get("min_pct")) / 100.0
+        if self.rule_type.startswith("max_weight") and self.limit < 0:
+            raise ValueError("max_weight rules need max_pct")
+        if self.rule_type == "restricted_symbols" and self.securities is None:
+            raise ValueError("restricted_symbols rules need symbols")
+        if self.rule_type == "min_cash" and self.min_amount <= 0 and self.min_frac <= 0:
+            raise ValueError("min_cash rules need min_amount or min_pct")
+
+    def scope(self, portfolio_ids: list[str]) -> np.ndarray:
+        """Mask over portfolio indices the rule applies to."""
+        if self.portfolios is None:
+            return np.ones(len(portfolio_ids), dtype=bool)
+        return np.array([pid in self.portfolios for pid in portfolio_ids], dtype=bool)
+
+
+_lock = threading.Lock()
+_compiled: dict[str, tuple[int, list[_Rule]]] = {}
+
+
+def validate(row: dict[str, Any]) -> None:
+    """Raise ValueError if a rule row would not compile."""
+    _Rule(row)
+
+
+def rules_for(user_id: str) -> list[_Rule]:
+    """The user's enabled rules, compiled (cached per table version)."""
+    version = csv_store.table_version("compliance_rules")
+    with _lock:
+        hit = _compiled.get(user_id)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+    rules = [
+        _Rule(r) for r in csv_store.get_by_user("compliance_rules", user_id)
+        if (r.get("enabled") or "1") not in ("0", "false", "False")
+    ]
+    with _lock:
+        _compiled[user_id] = (version, rules)
+    return rules
+
+
+def check(user_id: str, orders: list[dict[str, Any]], portfolio_ids: list[str]) -> dict[str, Any]:
+    """
+    Evaluate proposed orders (portfolio_id, symbol, side, quantity, optional order_type and
+    limit_price) against the user's rules. ``portfolio_ids`` are the user's portfolios.
+    Returns overall pass/fail, per-order results (in input order) and the breaches found.
+    """
+    rules = rules_for(user_id)
+    n = len(orders)
+    reasons: list[list[str]] = [[] for _ in range(n)]
+    breaches: list[dict[str, Any]] = []
+    if rules and n:
+        _evaluate(user_id, rules, orders, portfolio_ids, reasons, breaches)
+    results = [{"index": i, "passed": not r, "reasons": r} for i, r in enumerate(reasons)]
+    return {
+        "passed": all(r["passed"] for r in results),
+        "rules": len(rules),
+        "orders": results,
+        "breaches": breaches,
+    }
+
+
+def submit(user_id: str, proposed: list[dict[str, Any]], portfolio_ids: list[str]) -> list[dict[str, Any]]:
+    """
+    Check a batch of proposed orders, then execute it; failing orders are REJECTED
+    with a "compliance: ..." reason. Each returned row carries ``compliance_reasons``.
+    """
+    checked = check(user_id, proposed, portfolio_ids)["orders"]
+    rejections = {r["index"]: "compliance: " + "; ".join(r["reasons"]) for r in checked if not r["passed"]}
+    rows = execution.submit(user_id, proposed, rejections)
+    return [{**row, "compliance_reasons": r["reasons"]} for row, r in zip(rows, checked)]
+
+
+def _evaluate(
+    user_id: str,
+    rules: list[_Rule],
+    orders: list[dict[str, Any]],
+    portfolio_ids: list[str],
+    reasons: list[list[str]],
+    breaches: list[dict[str, Any]],
+) -> None:
+    index = {pid: i for i, pid in enumerate(portfolio_ids)}
+    n_p = len(portfolio_ids)
+    if n_p == 0:
+        for r in reasons:
+            r.append("unknown portfolio")
+        return
+    holdings = [h for h in csv_store.get_by_user("holdings", user_id) if h.get("portfolio_id") in index]
+
+    # Current positions.
+    _, qty, _, px, _ = price_holdings(holdings)
+    h_mv = qty * px
+    h_sec, h_cls = securities.holding_classes(holdings)
+    h_p = np.array([index[h["portfolio_id"]] for h in holdings], dtype=np.int64)
+
+    # Proposed orders: signed notional at the limit price, else the latest close.
+    held_class = {price_store.normalize_symbol(h.get("symbol") or ""): h.get("asset_class") or "" for h in holdings}
+    symbols = [price_store.normalize_symbol(o.get("symbol") or "") for o in orders]
+    o_sec, o_cls = securities.classify(symbols, [held_class.get(s, "") for s in symbols])
+    o_p = np.array([index.get(o.get("portfolio_id") or "", -1) for o in orders], dtype=np.int64)
+    sides = np.array([str(o.get("side") or "").upper() for o in orders], dtype=object)
+    closes = price_store.latest_prices(symbols)
+    limits = np.array([
+        to_float(o.get("limit_price"), np.nan) if str(o.get("order_type") or "").upper() == "LIMIT" else np.nan
+        for o in orders
+    ])
+    o_px = np.where(np.isnan(limits), closes, limits)
+    sign = np.where(sides == "BUY", 1.0, np.where(sides == "SELL", -1.0, 0.0))
+    delta = sign * np.array([to_float(o.get("quantity")) for o in orders]) * o_px
+    valid = (o_p >= 0) & ~np.isnan(o_px) & (sign != 0)
+    for i in np.flatnonzero(~valid):
+        reasons[i].append("unknown portfolio" if o_p[i] < 0 else "no price to evaluate" if np.isnan(o_px[i]) else "invalid side")
+    delta = np.where(valid, delta, 0.0)
+    o_pv = np.where(valid, o_p, 0)
+
+    # Post-trade cash and NAV per portfolio.
+    class_labels = securities.asset_class_labels()
+    cash_id = class_labels.index(CASH_CLASS) if CASH_CLASS in class_labels else -1
+    h_cash = h_cls == cash_id
+    o_cash = o_cls == cash_id
+    cash_pre = np.bincount(h_p[h_cash], weights=h_mv[h_cash], minlength=n_p)
+    has_cash = np.bincount(h_p[h_cash], minlength=n_p) > 0
+    trade_flow = np.bincount(o_pv[~o_cash], weights=delta[~o_cash], minlength=n_p)
+    cash_post = cash_pre - np.where(has_cash, trade_flow, 0.0) + np.bincount(o_pv[o_cash], weights=delta[o_cash], minlength=n_p)
+    invested = np.bincount(h_p[~h_cash], weights=h_mv[~h_cash], minlength=n_p) + trade_flow
+    nav = np.where(has_cash, invested + cash_post, invested)
+    safe_nav = np.where(nav > _EPS, nav, np.inf)
+
+    symbol_labels = securities.symbol_labels()  # after interning every symbol above
+    all_p = np.concatenate([h_p, o_pv])
+    all_mv = np.concatenate([h_mv, delta])
+    all_cash = np.concatenate([h_cash, o_cash])
+
+    def weight_rule(rule: _Rule, keys: np.ndarray, labels: list[str], eligible: np.ndarray) -> None:
+        """Breaches of a max-weight rule over (portfolio, key) buckets; cash rows never breach."""
+        width = len(labels) + 1
+        codes, inverse = np.unique(all_p * width + np.where(all_cash, width - 1, keys), return_inverse=True)
+        mv = np.bincount(inverse, weights=all_mv, minlength=len(codes))
+        b_p, b_key = codes // width, codes % width
+        weight = mv / safe_nav[b_p]
+        breached = (weight > rule.limit + _EPS) & rule.scope(portfolio_ids)[b_p] & np.append(eligible, False)[b_key]
+        if not breached.any():
+            return
+        for b in np.flatnonzero(breached):
+            breaches.append({
+                "rule_id": rule.id, "rule": rule.name, "portfolio_id": portfolio_ids[b_p[b]],
+                "key": labels[b_key[b]], "weight_pct": float(weight[b] * 100), "limit_pct": rule.limit * 100,
+            })
+        o_bucket = inverse[len(holdings):]
+        for i in np.flatnonzero(valid & breached[o_bucket] & (delta > 0)):
+            b = o_bucket[i]
+            reasons[i].append(f"{rule.name}: {labels[b_key[b]]} would be {weight[b] * 100:.2f}% (max {rule.limit * 100:g}%)")
+
+    for rule in rules:
+        if rule.rule_type == "max_weight_symbol":
+            eligible = np.ones(len(symbol_labels), dtype=bool)
+            if rule.securities is not None:
+                eligible[:] = False
+                eligible[rule.securities] = True
+            weight_rule(rule, np.concatenate([h_sec, o_sec]), symbol_labels, eligible)
+        elif rule.rule_type == "max_weight_asset_class":
+            eligible = np.array([rule.asset_class in (None, label) for label in class_labels], dtype=bool)
+            weight_rule(rule, np.concatenate([h_cls, o_cls]), class_labels, eligible)
+        elif rule.rule_type == "restricted_symbols":
+            hit = valid & rule.scope(portfolio_ids)[o_pv] & np.isin(o_sec, rule.securities) & np.isin(sides, list(rule.sides))
+            for i in np.flatnonzero(hit):
+                reasons[i].append(f"{rule.name}: {symbols[i]} is restricted for {sides[i]}")
+        elif rule.rule_type == "min_cash":
+            floor = np.maximum(rule.min_amount, rule.min_frac * np.where(nav > 0, nav, 0.0))
+            short = (cash_post < floor - _EPS) & rule.scope(portfolio_ids)
+            hit = valid & short[o_pv] & (delta > 0) & ~o_cash
+            for p in np.flatnonzero(short & (np.bincount(o_pv[hit], minlength=n_p) > 0)):
+                breaches.append({
+                    "rule_id": rule.id, "rule": rule.name, "portfolio_id": portfolio_ids[p],
+                    "key": CASH_CLASS, "cash": float(cash_post[p]), "min_cash": float(floor[p]),
+                })
+            for i in np.flatnonzero(hit):
+                reasons[i].append(f"{rule.name}: cash would be {cash_post[o_pv[i]]:.2f} (min {floor[o_pv[i]]:.2f})")
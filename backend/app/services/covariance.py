@@ -0,0 +1,197 @@
+"""Covariance estimation over the price store."""
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from app.db import price_store
+
+METHODS = ("sample", "ewma", "ledoit_wolf")
+DEFAULT_WINDOW = 250
+DEFAULT_DECAY = 0.94
+_REBUILD_EVERY = 250
+_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_windows: dict[tuple, "_Window"] = {}
+_cache: "OrderedDict[tuple, dict[str, Any]]" = OrderedDict()
+
+
+def _returns(closes: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.log(closes[1:] / closes[:-1])
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def log_returns(symbols: list[str], window: int, as_of: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """(return dates, window x symbols daily log returns); missing observations count as 0."""
+    dates, closes = price_store.aligned_closes(symbols, window + 1, as_of)
+    if len(closes) < 2:
+        return dates[:0], np.zeros((0, len(symbols)))
+    return dates[1:], _returns(closes)
+
+
+class _Window:
+    """
+    Rolling window of return rows with the running sums the estimators use.
+    Rows live in a preallocated ``window x p`` ring buffer; ``head`` is the oldest.
+    """
+
+    def __init__(self, window: int, lam: float, closes: np.ndarray, dates: np.ndarray, version: int):
+        returns = _returns(closes) if len(closes) >= 2 else np.zeros((0, closes.shape[1]))
+        self.window = window
+        self.lam = lam
+        self.rows = np.zeros((window, closes.shape[1]))
+        self.rows[: len(returns)] = returns
+        self.head = 0
+        self.n = len(returns)
+        self.end = dates[-1] if len(dates) else None
+        self.last_closes = closes[-1].copy() if len(closes) else None
+        self.version = version
+        self.total = returns.sum(axis=0)
+        self.cross = returns.T @ returns
+        self.quartic = float((np.einsum("ij,ij->i", returns, returns) ** 2).sum())
+        ages = np.arange(len(returns))[::-1]
+        self.decayed = (returns * ((1 - lam) * lam ** ages)[:, None]).T @ returns
+        self.slides = 0
+
+    def advance(self, dates: np.ndarray, closes: np.ndarray, version: int) -> None:
+        """Slide forward over closes for the dates after ``end`` (newest last)."""
+        lam = self.lam
+        for row in _returns(np.vstack([self.last_closes, closes])):
+            outer = np.outer(row, row)
+            self.total += row
+            self.cross += outer
+            self.quartic += float(row @ row) ** 2
+            self.decayed = lam * self.decayed + (1 - lam) * outer
+            if self.n == self.window:
+                old = self.rows[self.head]
+                old_outer = np.outer(old, old)
+                self.total -= old
+                self.cross -= old_outer
+                self.quartic -= float(old @ old) ** 2
+                self.decayed -= (1 - lam) * lam ** self.window * old_outer
+                self.rows[self.head] = row
+                self.head = (self.head + 1) % self.window
+            else:
+                self.rows[(self.head + self.n) % self.window] = row
+                self.n += 1
+        self.end = dates[-1]
+        self.last_closes = closes[-1].copy()
+        self.version = version
+        self.slides += len(dates)
+
+    def estimate(self, method: str) -> tuple[np.ndarray, float | None]:
+        """(covariance matrix, shrinkage intensity for ledoit_wolf else None)."""
+        n, p = self.n, self.rows.shape[1]
+        if n < 2:
+            return np.zeros((p, p)), None
+        if method == "sample":
+            mean = self.total / n
+            return (self.cross - n * np.outer(mean, mean)) / (n - 1), None
+        if method == "ewma":
+            return self.decayed / (1 - self.lam ** n), None
+        s = self.cross / n
+        mu = float(np.trace(s)) / p
+        target = mu * np.eye(p)
+        delta = float(((s - target) ** 2).sum())
+        beta = max((self.quartic / n - float((s ** 2).sum())) / n, 0.0)
+        shrinkage = min(beta, delta) / delta if delta > 0 else 1.0
+        return shrinkage * target + (1 - shrinkage) * s, shrinkage
+
+
+def _slidable(state: _Window | None, universe: tuple[str, ...], as_of: np.datetime64 | None) -> bool:
+    """Whether ``state`` can reach ``as_of`` by sliding: nothing at or before its end has changed."""
+    if state is None or state.end is None or as_of is None or as_of < state.end or state.slides >= _REBUILD_EVERY:
+        return False
+    changed = price_store.changed_since(state.version, universe)
+    return changed is None or changed > state.end
+
+
+def _window_for(universe: tuple[str, ...], window: int, lam: float, as_of: str) -> _Window:
+    """
+    The window for ``universe`` ending at ``as_of``: the cached one slid forward over
+    only the days after its end when possible, else a rebuild from the price store.
+    """
+    key = (universe, window, lam)
+    target = np.datetime64(as_of, "D") if as_of else None
+    with _lock:
+        state = _windows.get(key)
+        slidable = _slidable(state, universe, target)
+        if slidable:
+            end, base = state.end, state.version
+    if slidable:
+        version = price_store.version()
+        start = str(end + np.timedelta64(1, "D"))
+        dates, closes = price_store.aligned_closes(list(universe), window, as_of, start=start)
+        with _lock:
+            if _windows.get(key) is state and state.end == end and state.version == base:
+                if len(dates) < window:
+                    if len(dates):
+                        state.advance(dates, closes, version)
+                    return state
+            elif _windows.get(key) is not None and _windows[key].end == target:
+                return _windows[key]  # another request got there first
+    version = price_store.version()
+    dates, closes = price_store.aligned_closes(list(universe), window + 1, as_of)
+    fresh = _Window(window, lam, closes, dates, version)
+    with _lock:
+        state = _windows.get(key)
+        if state is None or state.end is None or (fresh.end is not None and fresh.end >= state.end):
+            _windows[key] = fresh
+    return fresh
+
+
+def estimate(
+    symbols: list[str],
+    window: int = DEFAULT_WINDOW,
+    method: str = "ledoit_wolf",
+    as_of: str | None = None,
+    lam: float = DEFAULT_DECAY,
+) -> dict[str, Any]:
+    """
+    Covariance of daily log returns for ``symbols`` (normalised, deduplicated and
+    sorted; the matrix follows the returned ``symbols`` order).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    if window < 2 or not 0 < lam < 1:
+        raise ValueError("Expected window >= 2 and 0 < lam < 1")
+    universe = tuple(sorted({price_store.normalize_symbol(s) for s in symbols if s}))
+    as_of = as_of[:10] if as_of else price_store.as_of_date()
+    key = (universe, window, as_of, method, lam if method == "ewma" else None, price_store.version())
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    state = _window_for(universe, window, lam, as_of)
+    with _lock:
+        matrix, shrinkage = state.estimate(method)
+        observations = state.n
+    result = {
+        "symbols": list(universe),
+        "as_of": as_of,
+        "window": window,
+        "observations": observations,
+        "method": method,
+        "shrinkage": shrinkage,
+        "matrix": matrix,
+    }
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def matrix_for(symbols: list[str], **kwargs: Any) -> np.ndarray:
+    """``estimate(...)["matrix"]`` reordered to follow ``symbols`` (rows/columns of zeros for blanks)."""
+    result = estimate(symbols, **kwargs)
+    index = {s: i for i, s in enumerate(result["symbols"])}
+    pos = np.array([index.get(price_store.normalize_symbol(s), -1) for s in symbols], dtype=np.int64)
+    out = np.zeros((len(symbols), len(symbols)))
+    known = np.flatnonzero(pos >= 0)
+    out[np.ix_(known, known)] = result["matrix"][np.ix_(pos[known], pos[known])]
+    return out
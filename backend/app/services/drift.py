@@ -0,0 +1,214 @@
+"""Drift monitor for wealth client accounts."""
+import heapq
+import itertools
+import threading
+from typing import Any
+
+from app.db import csv_store, price_store
+from app.services import rebalance, securities
+
+_lock = threading.RLock()
+_ready = False
+_accounts: dict[str, dict[str, Any]] = {}  # account_id -> client_accounts row
+_by_portfolio: dict[str, set[str]] = {}
+_by_model: dict[str, set[str]] = {}
+_holdings: dict[str, dict[str, dict[str, Any]]] = {}  # portfolio_id -> holding id -> row
+_holders: dict[str, set[str]] = {}  # symbol -> portfolio ids holding it
+_dirty: dict[str, set[str]] = {}  # user_id -> account ids to recompute
+_entries: dict[str, dict[str, Any]] = {}  # account_id -> latest report (with "seq")
+_heaps: dict[str, list[tuple[float, int, str]]] = {}  # user_id -> (-max drift, seq, account_id)
+_live: dict[str, int] = {}  # user_id -> current entries
+_price_version = 0
+_securities_version: int | None = None
+_seq = itertools.count()
+
+
+def _mark(account_id: str) -> None:
+    row = _accounts.get(account_id)
+    if row is not None:
+        _dirty.setdefault(row.get("user_id") or "", set()).add(account_id)
+
+
+def _drop(account_id: str) -> None:
+    entry = _entries.pop(account_id, None)
+    if entry is not None:
+        _live[entry["user_id"]] -= 1
+
+
+def _index(row: dict[str, Any]) -> None:
+    _accounts[row["id"]] = row
+    _by_portfolio.setdefault(row.get("portfolio_id") or "", set()).add(row["id"])
+    _by_model.setdefault(row.get("model_id") or "", set()).add(row["id"])
+    _mark(row["id"])
+
+
+def _unindex(row: dict[str, Any]) -> None:
+    _accounts.pop(row["id"], None)
+    _by_portfolio.get(row.get("portfolio_id") or "", set()).discard(row["id"])
+    _by_model.get(row.get("model_id") or "", set()).discard(row["id"])
+    _drop(row["id"])
+
+
+def _mark_all() -> None:
+    for account_id in _accounts:
+        _mark(account_id)
+
+
+def _mark_portfolio(portfolio_id: str) -> None:
+    for account_id in _by_portfolio.get(portfolio_id, ()):
+        _mark(account_id)
+
+
+def _add_holding(row: dict[str, Any]) -> None:
+    pid = row.get("portfolio_id") or ""
+    _holdings.setdefault(pid, {})[row["id"]] = row
+    _holders.setdefault(price_store.normalize_symbol(row.get("symbol") or ""), set()).add(pid)
+
+
+def _remove_holding(row: dict[str, Any]) -> None:
+    pid = row.get("portfolio_id") or ""
+    rows = _holdings.get(pid, {})
+    rows.pop(row["id"], None)
+    symbol = price_store.normalize_symbol(row.get("symbol") or "")
+    if not any(price_store.normalize_symbol(r.get("symbol") or "") == symbol for r in rows.values()):
+        _holders.get(symbol, set()).discard(pid)
+
+
+def _rebuild() -> None:
+    global _ready, _price_version, _securities_version
+    _accounts.clear()
+    _by_portfolio.clear()
+    _by_model.clear()
+    _holdings.clear()
+    _holders.clear()
+    _dirty.clear()
+    _entries.clear()
+    _heaps.clear()
+    _live.clear()
+    _price_version, _securities_version = price_store.version(), securities.version()
+    for row in csv_store.read_table("holdings"):
+        _add_holding(row)
+    for row in csv_store.read_table("client_accounts"):
+        _index(row)
+    _ready = True
+
+
+def _on_holdings_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _ready
+    with _lock:
+        if not _ready:
+            return
+        if op == "reset":
+            _ready = False
+            return
+        if old is not None:
+            _remove_holding(old)
+            _mark_portfolio(old.get("portfolio_id") or "")
+        if new is not None:
+            _remove_holding(new)  # a rebuild after the write may already hold it
+            _add_holding(new)
+            _mark_portfolio(new.get("portfolio_id") or "")
+
+
+def _on_accounts_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _ready
+    with _lock:
+        if not _ready:
+            return
+        if op == "reset":
+            _ready = False
+            return
+        if old is not None:
+            _unindex(old)
+        if new is not None:
+            _index(new)
+
+
+def _on_models_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    with _lock:
+        if not _ready:
+            return
+        if op == "reset":
+            _mark_all()
+            return
+        for row in (old, new):
+            if row is not None:
+                for account_id in _by_model.get(row.get("id") or "", ()):
+                    _mark(account_id)
+
+
+csv_store.add_mutation_hook("holdings", _on_holdings_change)
+csv_store.add_mutation_hook("client_accounts", _on_accounts_change)
+csv_store.add_mutation_hook("model_portfolios", _on_models_change)
+
+
+def _push(user_id: str, report: dict[str, Any]) -> None:
+    seq = next(_seq)
+    if report["account_id"] not in _entries:
+        _live[user_id] = _live.get(user_id, 0) + 1
+    _entries[report["account_id"]] = {**report, "user_id": user_id, "seq": seq}
+    heapq.heappush(_heaps.setdefault(user_id, []), (-report["max_drift_pct"], seq, report["account_id"]))
+
+
+def _current(item: tuple[float, int, str]) -> bool:
+    entry = _entries.get(item[2])
+    return entry is not None and entry["seq"] == item[1]
+
+
+def refresh(user_id: str) -> int:
+    """Recompute the user's dirty accounts; returns how many were recomputed."""
+    global _price_version, _securities_version
+    with _lock:
+        if not _ready:
+            _rebuild()
+        if securities.version() != _securities_version:
+            _securities_version = securities.version()
+            _mark_all()
+        current = price_store.version()
+        if current != _price_version:
+            changed = price_store.changed_symbols(_price_version)
+            _price_version = current
+            if changed is None:
+                _mark_all()
+            else:
+                for symbol in changed:
+                    for pid in _holders.get(symbol, ()):
+                        _mark_portfolio(pid)
+        dirty = _dirty.pop(user_id, set())
+        portfolios = {_accounts[a].get("portfolio_id") or "" for a in dirty if a in _accounts}
+        holdings = [row for pid in portfolios for row in _holdings.get(pid, {}).values()]
+    if not dirty:
+        return 0
+    # Marks made while this runs land in a fresh dirty set and are picked up next time.
+    reports, _, _ = rebalance.assess(user_id, account_ids=dirty, errors=[], holdings=holdings)
+    with _lock:
+        for account_id in dirty:
+            _drop(account_id)
+        for report in reports:
+            if report["account_id"] in _accounts:
+                _push(user_id, report)
+        heap = _heaps.get(user_id, [])
+        if len(heap) > 2 * _live.get(user_id, 0) + 64:
+            heap[:] = [item for item in heap if _current(item)]
+            heapq.heapify(heap)
+    return len(dirty)
+
+
+def top(user_id: str, limit: int = 20, model_id: str | None = None) -> list[dict[str, Any]]:
+    """The user's most drifted accounts, largest max sleeve drift first."""
+    refresh(user_id)
+    out: list[dict[str, Any]] = []
+    with _lock:
+        heap = _heaps.get(user_id, [])
+        kept = []
+        while heap and len(out) < limit:
+            item = heapq.heappop(heap)
+            if not _current(item):
+                continue
+            kept.append(item)
+            entry = _entries[item[2]]
+            if model_id is None or entry["model_id"] == model_id:
+                out.append({k: v for k, v in entry.items() if k not in ("seq", "user_id", "orders")})
+        for item in kept:
+            heapq.heappush(heap, item)
+    return out
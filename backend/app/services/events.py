@@ -0,0 +1,148 @@
+"""In-process pub/sub of per-user change notifications."""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+from typing import Any
+
+from app.db import csv_store
+
+BUFFER_SIZE = 1000
+
+_lock = threading.Lock()
+_subscribers: dict[str, set["Subscription"]] = {}
+_ids = itertools.count(1)
+
+
+class Subscription:
+    def __init__(self, user_id: str, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._lock = threading.Lock()
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._pending: dict[tuple, dict[str, Any]] = {}
+        self.dropped = 0
+
+    def push(self, event: dict[str, Any], key: tuple | None) -> None:
+        """Buffer an event (any thread)."""
+        with self._lock:
+            pending = self._pending.get(key) if key is not None else None
+            if pending is not None:
+                pending.update(id=event["id"], data=event["data"], count=pending["count"] + 1)
+            else:
+                if len(self._buffer) >= BUFFER_SIZE:
+                    old = self._buffer.popleft()
+                    self._pending.pop(old.get("key"), None)
+                    self.dropped += 1
+                event = {**event, "count": 1, "key": key}
+                self._buffer.append(event)
+                if key is not None:
+                    self._pending[key] = event
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # loop already closed; the stream is going away
+
+    def drain(self) -> list[dict[str, Any]]:
+        with self._lock:
+            events = list(self._buffer)
+            self._buffer.clear()
+            self._pending.clear()
+            if self.dropped:
+                events.insert(0, {"id": next(_ids), "type": "resync", "data": {"dropped": self.dropped}, "count": 1})
+                self.dropped = 0
+        return events
+
+    async def next(self, timeout: float) -> list[dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for events; returns [] on timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        return self.drain()
+
+
+def subscribe(user_id: str) -> Subscription:
+    """Register a subscriber for ``user_id`` bound to the running event loop."""
+    sub = Subscription(user_id, asyncio.get_running_loop())
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    with _lock:
+        subs = _subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[sub.user_id]
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return sum(len(s) for s in _subscribers.values())
+
+
+def publish(user_id: str, event_type: str, data: dict[str, Any], coalesce: tuple | None = None) -> None:
+    """Send an event to every stream ``user_id`` has open (no-op without subscribers)."""
+    with _lock:
+        subs = list(_subscribers.get(user_id, ()))
+    if not subs:
+        return
+    event = {"id": next(_ids), "type": event_type, "data": data}
+    key = (event_type, *coalesce) if coalesce is not None else None
+    for sub in subs:
+        sub.push(event, key)
+
+
+def format_sse(event: dict[str, Any]) -> str:
+    payload = {**event["data"], "count": event["count"]} if event.get("count", 1) > 1 else event["data"]
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def _user_of(old: dict[str, Any] | None, new: dict[str, Any] | None) -> str:
+    return ((new or old) or {}).get("user_id") or ""
+
+
+def _on_orders(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    if op == "insert":
+        publish(new["user_id"], "order.created", {"id": new["id"], "status": new.get("status")})
+    elif op == "delete":
+        publish(old["user_id"], "order.deleted", {"id": old["id"]})
+
+
+def _on_order_events(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    if op == "insert" and new is not None and new.get("from_status") != new.get("status"):
+        publish(new["user_id"], "order.status", {"id": new["order_id"], "from": new.get("from_status"), "status": new.get("status")})
+
+
+def _on_risk_results(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    row = new or old
+    if row is None:
+        return
+    data = {"scenario_id": row.get("scenario_id"), "portfolio_id": row.get("portfolio_id"), "op": op}
+    publish(_user_of(old, new), "risk_results.changed", data, coalesce=(row.get("scenario_id"),))
+
+
+def _on_holdings(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    row = new or old
+    if row is None:
+        return
+    publish(_user_of(old, new), "holdings.changed", {"portfolio_id": row.get("portfolio_id")}, coalesce=(row.get("portfolio_id"),))
+
+
+def _on_jobs(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    if new is not None and (old or {}).get("status") != new.get("status"):
+        data = {"id": new["id"], "job_type": new.get("job_type"), "status": new.get("status"), "error": new.get("error") or None}
+        publish(new["user_id"], "job.status", data)
+
+
+csv_store.add_mutation_hook("orders", _on_orders)
+csv_store.add_mutation_hook("order_events", _on_order_events)
+csv_store.add_mutation_hook("risk_results", _on_risk_results)
+csv_store.add_mutation_hook("holdings", _on_holdings)
+csv_store.add_mutation_hook("jobs", _on_jobs)
@@ -0,0 +1,335 @@
+"""Simulated order execution."""
+import heapq
+import itertools
+import math
+from datetime import datetime, timezone
+from typing import Any
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import orders, positions, tax_lots
+from app.services.numeric import format_number, to_float
+
+ORDER_TYPES = ("MARKET", "LIMIT")
+SIDES = ("BUY", "SELL")
+_EPS = 1e-9
+
+
+class _Order:
+    __slots__ = ("id", "user_id", "portfolio_id", "symbol", "side", "limit", "quantity", "filled", "notional", "seq")
+
+    def __init__(self, row: dict[str, Any], seq: int):
+        self.id = row["id"]
+        self.user_id = row["user_id"]
+        self.portfolio_id = row["portfolio_id"]
+        self.symbol = row["symbol"]
+        self.side = row["side"]
+        self.limit = to_float(row.get("limit_price")) if row.get("order_type") == "LIMIT" else None
+        self.quantity = to_float(row.get("quantity"))
+        self.filled = to_float(row.get("filled_quantity"))
+        self.notional = self.filled * to_float(row.get("avg_fill_price"))
+        self.seq = seq
+
+    @property
+    def remaining(self) -> float:
+        return self.quantity - self.filled
+
+    def key(self) -> tuple[float, int]:
+        """Heap priority within its side: best price first, then time."""
+        if self.limit is None:
+            return -math.inf, self.seq
+        return (-self.limit if self.side == "BUY" else self.limit), self.seq
+
+    def crosses(self, price: float) -> bool:
+        """Whether this order would trade at ``price``."""
+        if self.limit is None:
+            return True
+        return price <= self.limit + _EPS if self.side == "BUY" else price >= self.limit - _EPS
+
+    def fields(self) -> dict[str, str]:
+        if self.remaining <= _EPS:
+            status = orders.FILLED
+        else:
+            status = orders.PARTIALLY_FILLED if self.filled > _EPS else orders.NEW
+        return {
+            "status": status,
+            "filled_quantity": format_number(self.filled),
+            "avg_fill_price": format_number(self.notional / self.filled) if self.filled > _EPS else "",
+        }
+
+
+class _Book:
+    __slots__ = ("bids", "asks")
+
+    def __init__(self) -> None:
+        self.bids: list[tuple[float, int, str]] = []
+        self.asks: list[tuple[float, int, str]] = []
+
+    def side(self, side: str) -> list[tuple[float, int, str]]:
+        return self.bids if side == "BUY" else self.asks
+
+    def push(self, order: _Order) -> None:
+        heapq.heappush(self.side(order.side), (*order.key(), order.id))
+
+    def top(self, side: str) -> _Order | None:
+        """Best live resting order on ``side`` (discarding dead heap entries)."""
+        heap = self.side(side)
+        while heap:
+            order_id = heap[0][2]
+            order = _resting.get(order_id)
+            if order is not None and order_id not in _dead and order.remaining > _EPS:
+                return order
+            heapq.heappop(heap)
+            _dead.discard(order_id)
+            _resting.pop(order_id, None)
+        return None
+
+    def pop(self, side: str) -> None:
+        _, _, order_id = heapq.heappop(self.side(side))
+        _resting.pop(order_id, None)
+
+
+_books: dict[tuple[str, str], _Book] | None = None
+_resting: dict[str, _Order] = {}
+_dead: set[str] = set()  # resting order ids closed outside the engine
+_seq = itertools.count()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _ensure_loaded() -> dict[tuple[str, str], _Book]:
+    global _books
+    if _books is None:
+        _resting.clear()
+        _dead.clear()
+        books: dict[tuple[str, str], _Book] = {}
+        for row in orders.open_orders():
+            if row.get("order_type") not in ORDER_TYPES:
+                continue
+            order = _Order(row, next(_seq))
+            if order.remaining > _EPS:
+                _resting[order.id] = order
+                books.setdefault((order.user_id, order.symbol), _Book()).push(order)
+        _books = books
+    return _books
+
+
+def _on_orders_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _books
+    if op in ("reset", "update"):
+        _books = None
+    elif op == "delete" and old is not None and old.get("id") in _resting:
+        _dead.add(old["id"])
+
+
+def _on_order_events_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _books
+    if op != "insert":
+        _books = None
+    elif new is not None and new.get("order_id") in _resting and new.get("status") not in orders.OPEN:
+        _dead.add(new["order_id"])
+
+
+csv_store.add_mutation_hook("orders", _on_orders_change)
+csv_store.add_mutation_hook("order_events", _on_order_events_change)
+
+
+def normalize_order(order: dict[str, Any]) -> dict[str, Any]:
+    """Validated, canonical order fields; raises ValueError."""
+    side = str(order.get("side") or "").upper()
+    order_type = str(order.get("order_type") or "MARKET").upper()
+    quantity = to_float(order.get("quantity"))
+    limit = to_float(order.get("limit_price"))
+    if side not in SIDES:
+        raise ValueError(f"side must be one of {', '.join(SIDES)}")
+    if order_type not in ORDER_TYPES:
+        raise ValueError(f"order_type must be one of {', '.join(ORDER_TYPES)}")
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    if order_type == "LIMIT" and limit <= 0:
+        raise ValueError("LIMIT orders need a positive limit_price")
+    return {
+        "portfolio_id": order.get("portfolio_id") or "",
+        "symbol": price_store.normalize_symbol(order.get("symbol") or ""),
+        "side": side,
+        "quantity": format_number(quantity),
+        "order_type": order_type,
+        "limit_price": format_number(limit) if order_type == "LIMIT" else "",
+    }
+
+
+class _Batch:
+    """
+    Fills and row changes accumulated while matching, written back by ``flush``.
+    Fills of one order at the same price and time are merged into one.
+    """
+
+    def __init__(self) -> None:
+        self.fills: list[dict[str, Any]] = []
+        self.initial: dict[str, dict[str, str]] = {}  # state of touched orders before the batch
+        self._fill_at: dict[tuple[str, float, str], dict[str, Any]] = {}
+        self.touched: dict[str, _Order] = {}
+        self.lot_methods: dict[str, str] = {}
+        self.closes: dict[str, float | None] = {}
+
+    def close(self, symbol: str) -> float | None:
+        if symbol not in self.closes:
+            point = price_store.latest(symbol)
+            self.closes[symbol] = point[1] if point is not None else None
+        return self.closes[symbol]
+
+    def touch(self, order: _Order) -> None:
+        if order.id not in self.touched:
+            self.initial[order.id] = order.fields()
+            self.touched[order.id] = order
+
+    def trade(self, order: _Order, quantity: float, price: float, executed_at: str) -> None:
+        self.touch(order)
+        order.filled += quantity
+        order.notional += quantity * price
+        merged = self._fill_at.get((order.id, price, executed_at))
+        if merged is not None:
+            merged["quantity"] += quantity
+            return
+        if order.user_id not in self.lot_methods:
+            self.lot_methods[order.user_id] = tax_lots.preferred_method(order.user_id)
+        self._fill_at[(order.id, price, executed_at)] = fill = {
+            "user_id": order.user_id,
+            "portfolio_id": order.portfolio_id,
+            "order_id": order.id,
+            "symbol": order.symbol,
+            "side": order.side,
+            "quantity": quantity,
+            "price": price,
+            "executed_at": executed_at,
+            "lot_method": self.lot_methods[order.user_id],
+        }
+        self.fills.append(fill)
+
+    def flush(
+        self,
+        new_rows: list[dict[str, Any]],
+        at: dict[str, str] | None = None,
+        changes: list[dict[str, Any]] | None = None,
+    ) -> None:
+        """Append new orders (as created), ``changes`` plus one state change per order that moved, and the fills."""
+        csv_store.append_rows("orders", new_rows)
+        changes = list(changes or [])
+        for order_id, order in self.touched.items():
+            fields = order.fields()
+            if fields != self.initial.get(order_id):
+                changes.append({"order_id": order_id, **fields, "at": (at or {}).get(order_id) or _now()})
+        orders.record(changes)
+        positions.apply_fills(self.fills)
+
+
+def _match(book: _Book, order: _Order, batch: _Batch, executed_at: str) -> None:
+    contra = "SELL" if order.side == "BUY" else "BUY"
+    while order.remaining > _EPS:
+        top = book.top(contra)
+        if top is None:
+            break
+        # Trade at the resting order's limit; a resting MARKET order takes the incoming limit or the close.
+        price = top.limit if top.limit is not None else (order.limit if order.limit is not None else batch.close(order.symbol))
+        if price is None or not order.crosses(price):
+            break
+        quantity = min(order.remaining, top.remaining)
+        batch.trade(order, quantity, price, executed_at)
+        batch.trade(top, quantity, price, executed_at)
+        if top.remaining <= _EPS:
+            book.pop(contra)
+    close = batch.close(order.symbol)
+    if order.remaining > _EPS and close is not None and order.crosses(close):
+        batch.trade(order, order.remaining, close, executed_at)
+
+
+def submit(
+    user_id: str,
+    items: list[dict[str, Any]],
+    rejections: dict[int, str] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Create and execute orders in sequence (each item as accepted by ``normalize_order``,
+    optionally with ``submitted_at`` for replays). Items whose index is in ``rejections``
+    are created and immediately REJECTED with that reason. Returns the orders' current rows.
+    Caller checks portfolio ownership; raises ValueError naming the first invalid item.
+    """
+    rows = []
+    for i, item in enumerate(items):
+        try:
+            fields = normalize_order(item)
+        except ValueError as e:
+            raise ValueError(f"Order {i}: {e}") from None
+        rows.append({
+            "id": csv_store.generate_id(),
+            "user_id": user_id,
+            **fields,
+            "status": "NEW",
+            "created_at": item.get("submitted_at") or _now(),
+            "filled_quantity": "0",
+            "avg_fill_price": "",
+        })
+    rejections = rejections or {}
+    rejected = [
+        {"order_id": rows[i]["id"], "status": orders.REJECTED, "reason": reason, "at": rows[i]["created_at"]}
+        for i, reason in sorted(rejections.items())
+    ]
+    with orders.lock:
+        if not settings.simulate_execution:
+            csv_store.append_rows("orders", rows)
+            orders.record(rejected)
+            return [orders.get(user_id, r["id"]) for r in rows]
+        books = _ensure_loaded()
+        batch = _Batch()
+        for i, row in enumerate(rows):
+            if i in rejections:
+                continue
+            order = _Order(row, next(_seq))
+            batch.touch(order)
+            book = books.setdefault((user_id, order.symbol), _Book())
+            _match(book, order, batch, row["created_at"])
+            if order.remaining > _EPS:
+                _resting[order.id] = order
+                book.push(order)
+        batch.flush(rows, {r["id"]: r["created_at"] for r in rows}, rejected)
+        return [orders.get(user_id, r["id"]) for r in rows]
+
+
+def sweep(user_id: str, symbols: list[str] | None = None) -> dict[str, Any]:
+    """Fill the user's resting orders that the latest closes have moved through."""
+    wanted = {price_store.normalize_symbol(s) for s in symbols} if symbols else None
+    executed_at = _now()
+    with orders.lock:
+        books = _ensure_loaded()
+        batch = _Batch()
+        for (owner, symbol), book in books.items():
+            if owner != user_id or (wanted is not None and symbol not in wanted):
+                continue
+            close = batch.close(symbol)
+            if close is None:
+                continue
+            for side in SIDES:
+                while (top := book.top(side)) is not None and top.crosses(close):
+                    batch.trade(top, top.remaining, close, executed_at)
+                    book.pop(side)
+        batch.flush([])
+    return {"orders_filled": len(batch.touched), "fills": len(batch.fills)}
+
+
+def depth(user_id: str, symbol: str) -> dict[str, Any]:
+    """Aggregated resting quantity per price level (MARKET orders at ``price`` None)."""
+    symbol = price_store.normalize_symbol(symbol)
+    out: dict[str, Any] = {"symbol": symbol}
+    with orders.lock:
+        book = _ensure_loaded().get((user_id, symbol)) or _Book()
+        for side, name in (("BUY", "bids"), ("SELL", "asks")):
+            levels: dict[float | None, list[float]] = {}
+            live = [_resting[e[2]] for e in sorted(book.side(side)) if e[2] in _resting and e[2] not in _dead]
+            for order in live:
+                level = levels.setdefault(order.limit, [0.0, 0])
+                level[0] += order.remaining
+                level[1] += 1
+            out[name] = [{"price": p, "quantity": q, "orders": n} for p, (q, n) in levels.items()]
+    return out
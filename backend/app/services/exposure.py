@@ -0,0 +1,169 @@
+"""Firm-wide exposure by symbol, asset class and currency across a user's portfolios."""
+import threading
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import fx, securities
+from app.services.numeric import group_sum, to_float
+
+BucketKey = tuple[str, str, str]  # (symbol, asset_class, currency)
+
+_lock = threading.RLock()
+_ready = False
+# user_id -> bucket -> [quantity, cost_value]
+_buckets: dict[str, dict[BucketKey, list[float]]] = {}
+# holding_id -> (user_id, portfolio_id, bucket, quantity, cost_value) as last applied,
+# so removals subtract exactly what was added
+_contributions: dict[str, tuple[str, str, BucketKey, float, float]] = {}
+_portfolio_currency: dict[str, str] = {}
+_portfolio_holdings: dict[str, set[str]] = {}
+
+
+def _add(user_id: str, key: BucketKey, qty: float, cost: float) -> None:
+    user = _buckets.setdefault(user_id, {})
+    bucket = user.setdefault(key, [0.0, 0.0])
+    bucket[0] += qty
+    bucket[1] += cost
+    if abs(bucket[0]) < 1e-9 and abs(bucket[1]) < 1e-6:
+        del user[key]
+
+
+def _contribute(hid: str, user_id: str, pid: str, key: BucketKey, qty: float, cost: float) -> None:
+    _contributions[hid] = (user_id, pid, key, qty, cost)
+    _portfolio_holdings.setdefault(pid, set()).add(hid)
+    _add(user_id, key, qty, cost)
+
+
+def _apply_holding(row: dict[str, Any]) -> None:
+    pid = row.get("portfolio_id") or ""
+    qty = to_float(row.get("quantity"))
+    key = (
+        price_store.normalize_symbol(row.get("symbol") or ""),
+        row.get("asset_class") or "unclassified",
+        _portfolio_currency.get(pid, ""),
+    )
+    _contribute(row.get("id") or "", row.get("user_id") or "", pid, key, qty, qty * to_float(row.get("avg_cost")))
+
+
+def _remove_holding(hid: str) -> None:
+    previous = _contributions.pop(hid, None)
+    if previous is None:
+        return
+    user_id, pid, key, qty, cost = previous
+    _add(user_id, key, -qty, -cost)
+    _portfolio_holdings.get(pid, set()).discard(hid)
+
+
+def _rebuild() -> None:
+    global _ready
+    _buckets.clear()
+    _contributions.clear()
+    _portfolio_holdings.clear()
+    _portfolio_currency.clear()
+    for p in csv_store.read_table("portfolios"):
+        _portfolio_currency[p.get("id") or ""] = p.get("currency") or ""
+    for h in csv_store.read_table("holdings"):
+        _apply_holding(h)
+    _ready = True
+
+
+def _on_holdings_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _ready
+    with _lock:
+        if not _ready:
+            return
+        if op == "reset":
+            _ready = False
+            return
+        if old is not None:
+            _remove_holding(old.get("id") or "")
+        if new is not None:
+            # A rebuild that ran after the write may already hold this row; replace, don't add twice.
+            _remove_holding(new.get("id") or "")
+            _apply_holding(new)
+
+
+def _on_portfolios_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _ready
+    with _lock:
+        if not _ready:
+            return
+        if op == "reset":
+            _ready = False
+            return
+        if new is None:
+            # Keep the currency mapping: the portfolio's holdings are deleted after the row.
+            return
+        pid = new.get("id") or ""
+        currency = new.get("currency") or ""
+        if _portfolio_currency.get(pid) == currency:
+            return
+        _portfolio_currency[pid] = currency
+        # Currency moved: re-bucket this portfolio's holdings under the new currency.
+        for hid in list(_portfolio_holdings.get(pid, ())):
+            user_id, _, (symbol, asset_class, _), qty, cost = _contributions[hid]
+            _remove_holding(hid)
+            _contribute(hid, user_id, pid, (symbol, asset_class, currency), qty, cost)
+
+
+csv_store.add_mutation_hook("holdings", _on_holdings_change)
+csv_store.add_mutation_hook("portfolios", _on_portfolios_change)
+
+
+def _breakdown(labels: list[str], mv: np.ndarray, qty: np.ndarray | None, gross_total: float) -> list[dict[str, Any]]:
+    long_mv = np.where(mv > 0, mv, 0.0)
+    short_mv = np.where(mv < 0, mv, 0.0)
+    extra = [qty] if qty is not None else []
+    keys, sums = group_sum(labels, mv, long_mv, short_mv, *extra)
+    net, long_, short = sums[0], sums[1], sums[2]
+    out = []
+    for i, k in enumerate(keys):
+        row = {
+            "key": k,
+            "net": float(net[i]),
+            "long": float(long_[i]),
+            "short": float(short[i]),
+            "gross": float(long_[i] - short[i]),
+            "weight_pct": float(net[i] / gross_total * 100.0) if gross_total else 0.0,
+        }
+        if qty is not None:
+            row["quantity"] = float(sums[3][i])
+        out.append(row)
+    out.sort(key=lambda r: r["gross"], reverse=True)
+    return out
+
+
+def user_exposure(user_id: str, currency: str | None = None) -> dict[str, Any]:
+    """
+    Exposure at latest prices (cost where unpriced) by symbol, asset class and currency,
+    converted into ``currency`` if given (else summed in each bucket's own currency).
+    """
+    with _lock:
+        if not _ready:
+            _rebuild()
+        items = list(_buckets.get(user_id, {}).items())
+    symbols = [k[0] for k, _ in items]
+    # Buckets keep each holding's own asset_class; the security master overrides it here.
+    _, class_ids = securities.classify(symbols, [k[1] for k, _ in items])
+    class_labels = securities.asset_class_labels()
+    asset_classes = [class_labels[c] for c in class_ids]
+    currencies = [k[2] for k, _ in items]
+    qty = np.array([v[0] for _, v in items], dtype=np.float64)
+    cost = np.array([v[1] for _, v in items], dtype=np.float64)
+    prices = price_store.latest_prices(symbols)
+    mv = np.where(np.isnan(prices), cost, qty * prices)
+    if currency:
+        mv = fx.convert(mv, currencies, currency)
+    gross_total = float(np.abs(mv).sum())
+    return {
+        "price_date": price_store.as_of_date(),
+        "currency": fx.normalize(currency) or None,
+        "buckets": len(items),
+        "net": float(mv.sum()),
+        "gross": gross_total,
+        "by_symbol": _breakdown(symbols, mv, qty, gross_total),
+        "by_asset_class": _breakdown(asset_classes, mv, None, gross_total),
+        "by_currency": _breakdown(currencies, mv, None, gross_total),
+    }
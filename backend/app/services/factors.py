@@ -0,0 +1,149 @@
+"""Factor exposure and risk decomposition."""
+import threading
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store
+from app.services import scenarios, securities
+from app.services.numeric import to_float
+from app.services.valuation import price_holdings
+
+FACTORS = scenarios.FACTORS
+
+# Annualised factor volatilities (decimal yield/spread changes for rates and
+# credit, returns for equity and fx) and correlations.
+FACTOR_VOLS = np.array([0.01, 0.16, 0.008, 0.08])
+FACTOR_CORR = np.array([
+    [1.0, 0.1, -0.2, 0.0],
+    [0.1, 1.0, -0.5, 0.1],
+    [-0.2, -0.5, 1.0, -0.1],
+    [0.0, 0.1, -0.1, 1.0],
+])
+FACTOR_COV = FACTOR_CORR * np.outer(FACTOR_VOLS, FACTOR_VOLS)
+
+_lock = threading.Lock()
+_loadings: tuple[int, dict[str, tuple[np.ndarray, float]]] | None = None
+
+
+def symbol_loadings() -> dict[str, tuple[np.ndarray, float]]:
+    """symbol -> (factor loadings, specific vol) from the factor_loadings table (cached per table version)."""
+    global _loadings
+    version = csv_store.table_version("factor_loadings")
+    with _lock:
+        if _loadings is not None and _loadings[0] == version:
+            return _loadings[1]
+    table = {
+        (r.get("symbol") or "").strip().upper(): (
+            np.array([to_float(r.get(f)) for f in FACTORS]),
+            to_float(r.get("specific_vol")),
+        )
+        for r in csv_store.read_table("factor_loadings")
+    }
+    with _lock:
+        _loadings = (version, table)
+    return table
+
+
+def loadings_matrix(holdings: list[dict[str, Any]], symbols: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """(holdings x factors loadings, specific vols) with asset-class fallback."""
+    table = symbol_loadings()
+    fallback = scenarios.loadings_for(securities.asset_classes(holdings))
+    loadings = fallback.copy()
+    specific = np.zeros(len(holdings))
+    for i, s in enumerate(symbols):
+        known = table.get(s)
+        if known is not None:
+            loadings[i], specific[i] = known
+    return loadings, specific
+
+
+def _share(part: float, total: float) -> float:
+    return float(part / total * 100.0) if total > 0 else 0.0
+
+
+def decompose(
+    holdings: list[dict[str, Any]],
+    portfolio_ids: list[str],
+    include_holdings: bool = True,
+) -> list[dict[str, Any]]:
+    """Factor exposures and risk contributions for every portfolio in one pass."""
+    symbols, qty, _, px, _ = price_holdings(holdings)
+    mv = qty * px
+    loadings, specific = loadings_matrix(holdings, symbols)
+    index = {pid: i for i, pid in enumerate(portfolio_ids)}
+    p_idx = np.array([index.get(h.get("portfolio_id"), -1) for h in holdings], dtype=np.int64)
+    keep = p_idx >= 0
+    n_p = len(portfolio_ids)
+
+    values = np.bincount(p_idx[keep], weights=mv[keep], minlength=n_p)
+    exposures = np.zeros((n_p, len(FACTORS)))
+    np.add.at(exposures, p_idx[keep], loadings[keep] * mv[keep, None])
+    rows = np.flatnonzero(keep)
+    # Net market value per (portfolio, symbol) before squaring: lots of a symbol are one exposure.
+    _, sym_code = np.unique(np.array([symbols[i] for i in rows], dtype=object), return_inverse=True)
+    stride = max(len(rows), 1)
+    groups, group_of = np.unique(p_idx[rows] * stride + sym_code, return_inverse=True)
+    group_mv = np.bincount(group_of, weights=mv[rows], minlength=len(groups))
+    group_spec = np.zeros(len(groups))
+    group_spec[group_of] = specific[rows]
+    spec_var = np.bincount(groups // stride, weights=(group_mv * group_spec) ** 2, minlength=n_p)
+    xf = exposures @ FACTOR_COV  # portfolios x factors
+    factor_var = np.einsum("pk,pk->p", xf, exposures)
+    sigma = np.sqrt(factor_var + spec_var)
+    safe = np.where(sigma > 0, sigma, 1.0)
+    marginal = xf / safe[:, None]
+    component = exposures * marginal
+    specific_component = spec_var / safe
+
+    if include_holdings:
+        h_p = p_idx[rows]
+        h_marginal = ((loadings[rows] * xf[h_p]).sum(axis=1) + group_mv[group_of] * specific[rows] ** 2) / safe[h_p]
+        h_component = mv[rows] * h_marginal
+        per_portfolio: list[list[dict[str, Any]]] = [[] for _ in range(n_p)]
+        for j, i in enumerate(rows):
+            per_portfolio[h_p[j]].append({
+                "holding_id": holdings[i].get("id"),
+                "symbol": symbols[i],
+                "market_value": float(mv[i]),
+                "marginal": float(h_marginal[j]),
+                "component": float(h_component[j]),
+                "component_pct": _share(h_component[j], sigma[h_p[j]]),
+            })
+
+    out = []
+    for p, pid in enumerate(portfolio_ids):
+        total = float(sigma[p])
+        result = {
+            "portfolio_id": pid,
+            "market_value": float(values[p]),
+            "total_risk": total,
+            "total_risk_pct": float(total / values[p] * 100.0) if values[p] else 0.0,
+            "factor_risk": float(np.sqrt(factor_var[p])),
+            "specific_risk": float(np.sqrt(spec_var[p])),
+            "factors": [
+                {
+                    "factor": f,
+                    "exposure": float(exposures[p, k]),
+                    "marginal": float(marginal[p, k]),
+                    "component": float(component[p, k]),
+                    "component_pct": _share(component[p, k], total),
+                }
+                for k, f in enumerate(FACTORS)
+            ],
+            "specific": {"component": float(specific_component[p]), "component_pct": _share(specific_component[p], total)},
+        }
+        if include_holdings:
+            result["holdings"] = sorted(per_portfolio[p], key=lambda r: r["component"], reverse=True)
+        out.append(result)
+    return out
+
+
+def upsert_loadings(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Insert or replace loadings by symbol."""
+    cleaned = [
+        {"symbol": (r.get("symbol") or "").strip().upper(), **{k: str(to_float(r.get(k))) for k in (*FACTORS, "specific_vol")}}
+        for r in rows
+        if (r.get("symbol") or "").strip()
+    ]
+    return csv_store.upsert_rows("factor_loadings", ["symbol"], cleaned)
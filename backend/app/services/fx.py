@@ -0,0 +1,92 @@
+"""FX conversion."""
+import threading
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+from app.db import csv_store
+from app.services.numeric import to_float
+
+_lock = threading.Lock()
+_cached: tuple[tuple[int, str], "RateMatrix"] | None = None
+
+
+class RateMatrix:
+    def __init__(self, base: str, to_base: dict[str, float]):
+        self.base = base
+        self.currencies = sorted(to_base)
+        self.index = {c: i for i, c in enumerate(self.currencies)}
+        vector = np.array([to_base[c] for c in self.currencies])
+        self.matrix = vector[:, None] / vector[None, :]
+
+    def factors(self, currencies: list[str], target: str) -> np.ndarray:
+        """Per-row multipliers converting amounts in ``currencies`` into ``target``."""
+        target = normalize(target) or self.base
+        if target not in self.index:
+            raise ValueError(f"No FX rate for {target}")
+        labels = np.array([normalize(c) or self.base for c in currencies], dtype=object)
+        codes, inverse = np.unique(labels, return_inverse=True)
+        unknown = [c for c in codes if c not in self.index]
+        if unknown:
+            raise ValueError(f"No FX rate for {', '.join(sorted(unknown))}")
+        column = self.matrix[np.array([self.index[c] for c in codes], dtype=np.int64), self.index[target]]
+        return column[inverse]
+
+
+def normalize(currency: str | None) -> str:
+    return (currency or "").strip().upper()
+
+
+def version() -> tuple[int, str]:
+    return csv_store.table_version("fx_rates"), normalize(settings.base_currency)
+
+
+def rates() -> RateMatrix:
+    """Cross-rate matrix for the current fx_rates table (cached per table version)."""
+    global _cached
+    key = version()
+    with _lock:
+        if _cached is not None and _cached[0] == key:
+            return _cached[1]
+    base = key[1]
+    to_base = {base: 1.0}
+    for r in csv_store.read_table("fx_rates"):
+        code, rate = normalize(r.get("currency")), to_float(r.get("rate"))
+        if code and code != base and rate > 0:
+            to_base[code] = rate
+    matrix = RateMatrix(base, to_base)
+    with _lock:
+        _cached = (key, matrix)
+    return matrix
+
+
+def convert(amounts: np.ndarray, currencies: list[str], target: str) -> np.ndarray:
+    """Convert a column of amounts (one currency code per row) into ``target``."""
+    return np.asarray(amounts, dtype=np.float64) * rates().factors(currencies, target)
+
+
+def convert_known(amounts: np.ndarray, currencies: list[str], target: str) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    ``convert`` for the rows whose currency has a rate: (converted amounts, 0 where unknown;
+    known-row mask; the currencies without a rate). An unknown ``target`` still raises ValueError.
+    """
+    r = rates()
+    labels = [normalize(c) or r.base for c in currencies]
+    known = np.array([c in r.index for c in labels], dtype=bool)
+    out = np.zeros(len(labels))
+    out[known] = np.asarray(amounts, dtype=np.float64)[known] * r.factors([c for c, k in zip(labels, known) if k], target)
+    return out, known, sorted({c for c, k in zip(labels, known) if not k})
+
+
+def upsert_rates(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Insert or replace rates (units of base currency per unit of ``currency``)."""
+    now = datetime.now(timezone.utc).date().isoformat()
+    cleaned = []
+    for r in rows:
+        code, rate = normalize(r.get("currency")), to_float(r.get("rate"))
+        if not code or rate <= 0:
+            raise ValueError("Each rate needs a currency and a positive rate")
+        cleaned.append({"currency": code, "rate": str(rate), "as_of": r.get("as_of") or now})
+    return csv_store.upsert_rows("fx_rates", ["currency"], cleaned)
@@ -0,0 +1,284 @@
+"""Background jobs for long-running work (large risk runs, reports, bulk imports)."""
+import json
+import logging
+import queue
+import threading
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import events, reconciliation, scenarios, valuation
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "QUEUED", "RUNNING", "SUCCEEDED", "FAILED", "CANCELLED"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class _Interrupted(Exception):
+    """Raised inside a handler when the app shuts down; the job is requeued."""
+
+
+class JobContext:
+    def __init__(self, job: dict[str, Any]):
+        self.id = job["id"]
+        self.user_id = job["user_id"]
+        self.params: dict[str, Any] = json.loads(job.get("params_json") or "{}")
+
+    def progress(self, fraction: float) -> None:
+        """Record progress (0..1); raises if the job was cancelled or the app is stopping."""
+        if _stopping.is_set():
+            raise _Interrupted()
+        if self.id in _cancel_requested:
+            raise JobCancelled()
+        _progress[self.id] = max(0.0, min(1.0, fraction))
+        events.publish(self.user_id, "job.progress", {"id": self.id, "progress": _progress[self.id]}, coalesce=(self.id,))
+
+
+Handler = Callable[[JobContext], Any]
+_handlers: dict[str, Handler] = {}
+
+_queue: "queue.Queue[str | None]" = queue.Queue()
+_threads: list[threading.Thread] = []
+_stopping = threading.Event()
+_cancel_requested: set[str] = set()
+_progress: dict[str, float] = {}
+_start_lock = threading.Lock()
+_claim_lock = threading.Lock()
+
+
+def register(job_type: str) -> Callable[[Handler], Handler]:
+    def decorator(handler: Handler) -> Handler:
+        _handlers[job_type] = handler
+        return handler
+    return decorator
+
+
+def job_types() -> list[str]:
+    return sorted(_handlers)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _result_path(job_id: str) -> Path:
+    path = Path(settings.data_dir) / "job_results"
+    path.mkdir(parents=True, exist_ok=True)
+    return path / f"{job_id}.json"
+
+
+def _find(job_id: str) -> dict[str, Any] | None:
+    return next((j for j in csv_store.read_table("jobs") if j.get("id") == job_id), None)
+
+
+def _view(job: dict[str, Any]) -> dict[str, Any]:
+    view = dict(job)
+    if job.get("status") == RUNNING and job["id"] in _progress:
+        view["progress"] = f"{_progress[job['id']]:.4f}"
+    return view
+
+
+def submit(user_id: str, job_type: str, params: dict[str, Any]) -> dict[str, Any]:
+    if job_type not in _handlers:
+        raise ValueError(f"Unknown job_type; expected one of {', '.join(job_types())}")
+    row = {
+        "id": csv_store.generate_id(),
+        "user_id": user_id,
+        "job_type": job_type,
+        "status": QUEUED,
+        "params_json": json.dumps(params),
+        "progress": "0",
+        "error": "",
+        "cancel_requested": "",
+        "created_at": _now(),
+        "started_at": "",
+        "finished_at": "",
+    }
+    csv_store.append_row("jobs", row)
+    _queue.put(row["id"])
+    return row
+
+
+def get(user_id: str, job_id: str) -> dict[str, Any] | None:
+    job = _find(job_id)
+    if job is None or job.get("user_id") != user_id:
+        return None
+    return _view(job)
+
+
+def list_jobs(user_id: str) -> list[dict[str, Any]]:
+    jobs = [_view(j) for j in csv_store.get_by_user("jobs", user_id)]
+    jobs.sort(key=lambda j: j.get("created_at") or "", reverse=True)
+    return jobs
+
+
+def cancel(user_id: str, job_id: str) -> dict[str, Any] | None:
+    """Cancel a queued job now, or ask a running one to stop at its next progress report."""
+    # Under the claim lock a worker cannot move the job from QUEUED to RUNNING between the check and the write.
+    with _claim_lock:
+        job = _find(job_id)
+        if job is None or job.get("user_id") != user_id:
+            return None
+        if job["status"] in FINISHED:
+            raise ValueError(f"Job already {job['status']}")
+        if job["status"] == QUEUED:
+            csv_store.update_row("jobs", "id", job_id, {"status": CANCELLED, "finished_at": _now()})
+        else:
+            _cancel_requested.add(job_id)
+            csv_store.update_row("jobs", "id", job_id, {"cancel_requested": "1"})
+    return get(user_id, job_id)
+
+
+def result(job_id: str) -> Any:
+    """Stored result of a SUCCEEDED job (caller checks ownership and status)."""
+    with open(_result_path(job_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _claim(job_id: str) -> dict[str, Any] | None:
+    """Mark a QUEUED job RUNNING; None if it was cancelled or another worker has it."""
+    with _claim_lock:
+        job = _find(job_id)
+        if job is None or job.get("status") != QUEUED:
+            return None
+        csv_store.update_row("jobs", "id", job_id, {"status": RUNNING, "started_at": _now()})
+        return job
+
+
+def _execute(job_id: str) -> None:
+    job = _claim(job_id)
+    if job is None:
+        return
+    handler = _handlers.get(job.get("job_type") or "")
+    _progress[job_id] = 0.0
+    if job.get("cancel_requested"):
+        _cancel_requested.add(job_id)
+    updates: dict[str, Any]
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for job_type {job.get('job_type')!r}")
+        ctx = JobContext(job)
+        ctx.progress(0.0)
+        output = handler(ctx)
+        with open(_result_path(job_id), "w", encoding="utf-8") as f:
+            json.dump(output, f, default=str)
+        updates = {"status": SUCCEEDED, "progress": "1"}
+    except JobCancelled:
+        updates = {"status": CANCELLED}
+    except _Interrupted:
+        csv_store.update_row("jobs", "id", job_id, {"status": QUEUED, "started_at": ""})
+        return
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, job.get("job_type"))
+        updates = {"status": FAILED, "error": str(e)}
+    finally:
+        _progress.pop(job_id, None)
+        _cancel_requested.discard(job_id)
+    csv_store.update_row("jobs", "id", job_id, {**updates, "finished_at": _now()})
+
+
+def _worker() -> None:
+    while True:
+        job_id = _queue.get()
+        if job_id is None or _stopping.is_set():
+            return
+        try:
+            _execute(job_id)
+        except Exception:
+            logger.exception("Job worker error for %s", job_id)
+
+
+def recover() -> int:
+    """Requeue jobs left QUEUED or RUNNING by a previous process. Returns the number requeued."""
+    jobs = [j for j in csv_store.read_table("jobs") if j.get("status") in (QUEUED, RUNNING)]
+    jobs.sort(key=lambda j: j.get("created_at") or "")
+    interrupted = {j["id"]: {"status": QUEUED, "started_at": ""} for j in jobs if j["status"] == RUNNING}
+    csv_store.update_rows("jobs", "id", interrupted)
+    for j in jobs:
+        _queue.put(j["id"])
+    return len(jobs)
+
+
+def start(workers: int | None = None) -> None:
+    with _start_lock:
+        if _threads:
+            return
+        _stopping.clear()
+        recover()
+        for i in range(workers or settings.job_workers):
+            t = threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _threads.append(t)
+
+
+def stop(timeout: float = 5.0) -> None:
+    """Stop workers; running jobs are interrupted at their next progress report and requeued."""
+    with _start_lock:
+        _stopping.set()
+        for _ in _threads:
+            _queue.put(None)
+        for t in _threads:
+            t.join(timeout)
+        _threads.clear()
+        while not _queue.empty():
+            _queue.get_nowait()  # unclaimed ids are requeued from the table on the next start
+
+
+@register("risk_run")
+def _risk_run(ctx: JobContext) -> dict[str, Any]:
+    """params: scenario_ids, portfolio_ids (empty = all of the user's)."""
+    user_scenarios = csv_store.get_by_user("risk_scenarios", ctx.user_id)
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", ctx.user_id)]
+    wanted_s, wanted_p = set(ctx.params.get("scenario_ids") or []), set(ctx.params.get("portfolio_ids") or [])
+    if wanted_s - {s["id"] for s in user_scenarios} or wanted_p - set(owned):
+        raise ValueError("Scenario or portfolio not found")
+    chosen = [s for s in user_scenarios if not wanted_s or s["id"] in wanted_s]
+    pids = [pid for pid in owned if not wanted_p or pid in wanted_p]
+    step = max(1, settings.job_risk_chunk)
+    summary: dict[str, Any] = {
+        "scenarios": len(chosen),
+        "portfolios": len(pids),
+        "results": 0,
+        "cache": {"hits": 0, "misses": 0},
+        "ignored_params": {},
+    }
+    for start_at in range(0, len(chosen), step):
+        out = scenarios.run_scenarios(ctx.user_id, chosen[start_at:start_at + step], pids)
+        summary["results"] += len(out["results"])
+        summary["ignored_params"].update(out["ignored_params"])
+        for k in ("hits", "misses"):
+            summary["cache"][k] += out["cache"][k]
+        ctx.progress((start_at + step) / len(chosen))
+    summary["run_at"] = _now()
+    return summary
+
+
+@register("price_import")
+def _price_import(ctx: JobContext) -> dict[str, Any]:
+    """params: csv (symbol,date,close text)."""
+    return {"loaded": price_store.load_csv_text(ctx.params.get("csv") or "")}
+
+
+@register("valuation_report")
+def _valuation_report(ctx: JobContext) -> dict[str, Any]:
+    """params: portfolio_ids (empty = all of the user's)."""
+    owned = [p["id"] for p in csv_store.get_by_user("portfolios", ctx.user_id)]
+    wanted = set(ctx.params.get("portfolio_ids") or [])
+    if wanted - set(owned):
+        raise ValueError("Portfolio not found")
+    return valuation.value_portfolios(ctx.user_id, [pid for pid in owned if not wanted or pid in wanted])
+
+
+@register("reconciliation")
+def _reconciliation(ctx: JobContext) -> dict[str, Any]:
+    """params: quantity_tolerance, cash_tolerance (optional)."""
+    tolerances = {k: float(ctx.params[k]) for k in ("quantity_tolerance", "cash_tolerance") if k in ctx.params}
+    return reconciliation.run(ctx.user_id, progress=ctx.progress, **tolerances)
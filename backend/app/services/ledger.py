@@ -0,0 +1,218 @@
+"""Account ledger: per-account transactions in date order with running balances."""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any
+
+from app.db import csv_store
+from app.services.numeric import to_float
+
+_END = "\uffff"  # sorts after every id, so (date, _END) bounds a whole day
+_BLOCK_SIZE = 64
+
+_lock = threading.RLock()
+_ledgers: dict[str, "_Ledger"] | None = None
+
+
+def _day(value: str) -> str:
+    """ISO day of a stored date or datetime; its first 10 characters if it does not parse."""
+    try:
+        return datetime.fromisoformat(value.strip()).date().isoformat()
+    except ValueError:
+        return value[:10]
+
+
+def parse_day(value: str) -> str:
+    """ISO day of a date or datetime parameter; raises ValueError if it is neither."""
+    try:
+        return datetime.fromisoformat(value.strip()).date().isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}; expected YYYY-MM-DD") from None
+
+
+def _key(row: dict[str, Any]) -> tuple[str, str]:
+    return _day(row.get("date") or ""), row.get("id") or ""
+
+
+class _Block:
+    __slots__ = ("keys", "rows", "amounts", "total")
+
+    def __init__(self, keys: list[tuple[str, str]], rows: list[dict[str, Any]]) -> None:
+        self.keys = keys
+        self.rows = rows
+        self.amounts = [to_float(r.get("amount")) for r in rows]
+        self.total = sum(self.amounts)
+
+
+class _Ledger:
+    __slots__ = ("blocks", "firsts", "sums", "counts")
+
+    def __init__(self, keys: list[tuple[str, str]] | None = None, rows: list[dict[str, Any]] | None = None) -> None:
+        keys, rows = keys or [], rows or []
+        self.blocks = [
+            _Block(keys[i:i + _BLOCK_SIZE], rows[i:i + _BLOCK_SIZE]) for i in range(0, len(keys), _BLOCK_SIZE)
+        ]
+        self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the block index and the Fenwick trees from the blocks."""
+        self.firsts = [b.keys[0] for b in self.blocks]
+        n = len(self.blocks)
+        self.sums = [0.0] * (n + 1)
+        self.counts = [0] * (n + 1)
+        for i, block in enumerate(self.blocks, 1):
+            self.sums[i] += block.total
+            self.counts[i] += len(block.keys)
+            parent = i + (i & -i)
+            if parent <= n:
+                self.sums[parent] += self.sums[i]
+                self.counts[parent] += self.counts[i]
+
+    def _update(self, b: int, amount: float, count: int) -> None:
+        i = b + 1
+        while i < len(self.sums):
+            self.sums[i] += amount
+            self.counts[i] += count
+            i += i & -i
+
+    def _before(self, b: int) -> tuple[float, int]:
+        """(sum, count) of the entries in blocks before ``b``."""
+        total, count = 0.0, 0
+        while b > 0:
+            total += self.sums[b]
+            count += self.counts[b]
+            b -= b & -b
+        return total, count
+
+    def insert(self, row: dict[str, Any]) -> None:
+        key = _key(row)
+        if not self.blocks:
+            self.blocks.append(_Block([key], [row]))
+            self._reindex()
+            return
+        b = max(bisect_right(self.firsts, key) - 1, 0)
+        block = self.blocks[b]
+        i = bisect_right(block.keys, key)
+        amount = to_float(row.get("amount"))
+        block.keys.insert(i, key)
+        block.rows.insert(i, row)
+        block.amounts.insert(i, amount)
+        block.total += amount
+        if len(block.keys) > 2 * _BLOCK_SIZE:
+            half = len(block.keys) // 2
+            self.blocks[b:b + 1] = [
+                _Block(block.keys[:half], block.rows[:half]), _Block(block.keys[half:], block.rows[half:])
+            ]
+            self._reindex()
+            return
+        self.firsts[b] = block.keys[0]
+        self._update(b, amount, 1)
+
+    def remove(self, row: dict[str, Any]) -> None:
+        key = _key(row)
+        b = bisect_right(self.firsts, key) - 1
+        if b < 0:
+            return
+        block = self.blocks[b]
+        i = bisect_left(block.keys, key)
+        if i == len(block.keys) or block.keys[i] != key:
+            return
+        amount = block.amounts[i]
+        del block.keys[i], block.rows[i], block.amounts[i]
+        if not block.keys:
+            del self.blocks[b]
+            self._reindex()
+            return
+        block.total -= amount
+        self.firsts[b] = block.keys[0]
+        self._update(b, -amount, -1)
+
+    def _locate(self, key: tuple[str, str]) -> tuple[int, int]:
+        """(block, offset in block) of the first entry after ``key``."""
+        b = max(bisect_right(self.firsts, key) - 1, 0)
+        return b, bisect_right(self.blocks[b].keys, key)
+
+    def balance_through(self, key: tuple[str, str]) -> tuple[float, int]:
+        """(sum, count) of the entries sorting at or before ``key``."""
+        if not self.blocks:
+            return 0.0, 0
+        b, i = self._locate(key)
+        total, count = self._before(b)
+        return total + sum(self.blocks[b].amounts[:i]), count + i
+
+    def between(self, start: tuple[str, str], end: tuple[str, str]) -> tuple[float, float, list[dict[str, Any]]]:
+        """(opening, closing, rows with running balance) for entries after ``start`` through ``end``."""
+        opening, _ = self.balance_through(start)
+        running = opening
+        out = []
+        if self.blocks and end > start:
+            b, i = self._locate(start)
+            for block in self.blocks[b:]:
+                for k in range(i, len(block.keys)):
+                    if block.keys[k] > end:
+                        return opening, running, out
+                    running += block.amounts[k]
+                    out.append({**block.rows[k], "balance": running})
+                i = 0
+        return opening, running, out
+
+
+def _ensure_loaded() -> dict[str, _Ledger]:
+    global _ledgers
+    if _ledgers is None:
+        grouped: dict[str, tuple[list, list]] = {}
+        for row in sorted(csv_store.read_table("transactions"), key=_key):
+            keys, rows = grouped.setdefault(row.get("account_id") or "", ([], []))
+            keys.append(_key(row))
+            rows.append(dict(row))
+        _ledgers = {account_id: _Ledger(keys, rows) for account_id, (keys, rows) in grouped.items()}
+    return _ledgers
+
+
+def _on_transactions_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _ledgers
+    with _lock:
+        if _ledgers is None:
+            return
+        if op == "reset":
+            _ledgers = None
+            return
+        if old is not None and old.get("account_id") in _ledgers:
+            _ledgers[old["account_id"]].remove(old)
+        if new is not None:
+            _ledgers.setdefault(new.get("account_id") or "", _Ledger()).insert(dict(new))
+
+
+csv_store.add_mutation_hook("transactions", _on_transactions_change)
+
+
+def balance(account_id: str, as_of: str | None = None) -> tuple[float, int]:
+    """(balance, number of transactions) for the account through ``as_of`` (inclusive; default all)."""
+    with _lock:
+        ledger = _ensure_loaded().get(account_id)
+        if ledger is None:
+            return 0.0, 0
+        return ledger.balance_through((parse_day(as_of) if as_of is not None else _END, _END))
+
+
+def entries(account_id: str, start: str | None = None, end: str | None = None) -> dict[str, Any]:
+    """
+    The account's transactions dated ``start`` through ``end`` (inclusive, either open),
+    oldest first, each with the running balance after it, plus opening and closing balances.
+    """
+    lo = (parse_day(start), "") if start else ("", "")
+    hi = (parse_day(end), _END) if end else (_END, _END)
+    with _lock:
+        ledger = _ensure_loaded().get(account_id) or _Ledger()
+        opening, closing, rows = ledger.between(lo, hi)
+    return {"opening_balance": opening, "closing_balance": closing, "entries": rows}
+
+
+def transactions(user_id: str, account_id: str, start: str | None = None, end: str | None = None) -> list[dict[str, Any]]:
+    """The account's transaction rows as stored, optionally only those dated ``start`` through ``end``."""
+    lo = parse_day(start) if start else ""
+    hi = parse_day(end) if end else _END
+    return [
+        t for t in csv_store.get_by_user("transactions", user_id)
+        if t.get("account_id") == account_id and lo <= _day(t.get("date") or "") <= hi
+    ]
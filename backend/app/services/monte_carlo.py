@@ -0,0 +1,227 @@
+"""Monte Carlo VaR and Expected Shortfall."""
+import json
+import math
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import covariance, pool, var
+from app.services.numeric import to_float
+
+DEFAULT_PATHS = 100_000
+MIN_BLOCKS = 10  # batch means need several blocks even for small runs
+
+Block = tuple[int, np.random.SeedSequence]
+
+
+def parse_params(params_json: str) -> tuple[int, float, int, int, int, str]:
+    """(lookback_days, confidence, horizon_days, paths, seed, covariance method) from params_json."""
+    lookback, confidence, horizon = var.parse_params(params_json)
+    params = json.loads(params_json or "{}")
+    paths = int(to_float(params.get("paths"), DEFAULT_PATHS))
+    seed = int(to_float(params.get("seed"), 0))
+    method = str(params.get("covariance") or "ledoit_wolf")
+    if not 1 <= paths <= settings.mc_max_paths or seed < 0:
+        raise ValueError(f"Expected 1 <= paths <= {settings.mc_max_paths} and seed >= 0")
+    if method not in covariance.METHODS:
+        raise ValueError(f"covariance must be one of {', '.join(covariance.METHODS)}")
+    return lookback, confidence, horizon, paths, seed, method
+
+
+def cov_factor(cov: np.ndarray) -> np.ndarray:
+    """A matrix ``F`` with ``F @ F.T == cov``; tolerates singular (e.g. short-history) matrices."""
+    w, v = np.linalg.eigh(cov)
+    return v * np.sqrt(np.clip(w, 0.0, None))
+
+
+def tail_size(paths: int, confidence: float) -> int:
+    return max(1, math.ceil((1.0 - confidence) * paths))
+
+
+def _worst(pnl: np.ndarray, k: int) -> np.ndarray:
+    return pnl if len(pnl) <= k else np.partition(pnl, k - 1, axis=0)[:k]
+
+
+class _Tail:
+    """The worst ``k`` values seen per column, kept in a fixed ``2k``-row buffer."""
+
+    def __init__(self, k: int, columns: int):
+        self.k = k
+        self.buf = np.empty((2 * k, columns), order="F")
+        self.n = np.zeros(columns, dtype=np.int64)
+        self.cut = np.full(columns, np.inf)  # k-th worst as of the last compaction
+
+    def add(self, pnl: np.ndarray) -> None:
+        k, cap = self.k, 2 * self.k
+        for j in range(pnl.shape[1]):
+            cand = pnl[:, j]
+            cand = cand[cand < self.cut[j]]
+            while len(cand):
+                n = self.n[j]
+                take = min(cap - n, len(cand))
+                self.buf[n:n + take, j] = cand[:take]
+                self.n[j] = n + take
+                cand = cand[take:]
+                if self.n[j] == cap:
+                    self.buf[:, j].partition(k - 1)
+                    self.n[j] = k
+                    self.cut[j] = self.buf[k - 1, j]
+                    cand = cand[cand < self.cut[j]]
+
+    def worst(self) -> np.ndarray:
+        """(min(k, values seen) x columns) array of the worst values, unordered."""
+        rows = min(self.k, int(self.n.min()) if len(self.n) else 0)
+        out = np.empty((rows, self.buf.shape[1]))
+        for j in range(self.buf.shape[1]):
+            out[:, j] = _worst(self.buf[: self.n[j], j], rows)
+        return out
+
+
+def _simulate_blocks(
+    inputs: dict[str, np.ndarray],
+    blocks: list[Block],
+    horizon: int,
+    k: int,
+    confidence: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(worst k P&Ls x portfolios, per-block VaR, per-block ES) for a run of blocks."""
+    drift = inputs["mu"] * horizon
+    factor_t = inputs["factor"].T * math.sqrt(horizon)
+    values_t = inputs["values"].T
+    tail = _Tail(k, values_t.shape[1])
+    block_var, block_es = [], []
+    for size, seed in blocks:
+        z = np.random.default_rng(seed).standard_normal((size, len(drift)))
+        pnl = np.expm1(drift + z @ factor_t) @ values_t  # paths x portfolios
+        tail.add(pnl)
+        worst = _worst(pnl, tail_size(size, confidence))
+        block_var.append(-worst.max(axis=0))
+        block_es.append(-worst.mean(axis=0))
+    return tail.worst(), np.array(block_var), np.array(block_es)
+
+
+def _simulate_shared(spec: pool.ArraySpec, blocks: list[Block], horizon: int, k: int, confidence: float):
+    shm, inputs = pool.attach_arrays(spec)
+    try:
+        return _simulate_blocks(inputs, blocks, horizon, k, confidence)
+    finally:
+        del inputs
+        shm.close()
+
+
+def simulate(
+    mu: np.ndarray,
+    factor: np.ndarray,
+    values: np.ndarray,
+    horizon: int,
+    confidence: float,
+    paths: int,
+    seed: int,
+) -> dict[str, np.ndarray]:
+    """
+    VaR/ES (positive losses) and their standard errors per portfolio row of ``values``.
+    Tail and P&L buffers stay under ``settings.mc_memory_floats`` per process; raises ValueError if one portfolio can't.
+    """
+    block_paths = min(settings.mc_chunk_paths, max(1, math.ceil(paths / MIN_BLOCKS)))
+    sizes = [min(block_paths, paths - start) for start in range(0, paths, block_paths)]
+    blocks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    k = tail_size(paths, confidence)
+    workers = pool.worker_count()
+    parallel = paths >= settings.mc_parallel_min_paths and workers >= 2
+
+    per_portfolio = ((workers if parallel else 1) + 2) * k + block_paths
+    group = settings.mc_memory_floats // per_portfolio
+    if group < 1:
+        raise ValueError(
+            f"Monte Carlo run needs {per_portfolio} floats per portfolio, over the limit of "
+            f"{settings.mc_memory_floats}; use fewer paths or a higher confidence"
+        )
+    # Every group replays the same blocks (same seeds), so results don't depend on the grouping.
+    groups = [
+        _simulate_group({"mu": mu, "factor": factor, "values": values[i:i + group]}, blocks, horizon, k,
+                        confidence, workers if parallel else 1)
+        for i in range(0, len(values), group)
+    ]
+    if len(groups) == 1:
+        return groups[0]
+    return {key: np.concatenate([g[key] for g in groups]) for key in groups[0]}
+
+
+def _simulate_group(
+    inputs: dict[str, np.ndarray],
+    blocks: list[Block],
+    horizon: int,
+    k: int,
+    confidence: float,
+    workers: int,
+) -> dict[str, np.ndarray]:
+    values = inputs["values"]
+    if workers < 2:
+        parts = [_simulate_blocks(inputs, blocks, horizon, k, confidence)]
+    else:
+        shm, spec = pool.share_arrays(inputs)
+        try:
+            futures = [
+                pool.get_pool().submit(_simulate_shared, spec, blocks[part], horizon, k, confidence)
+                for part in pool.split(len(blocks), workers)
+            ]
+            parts = [f.result() for f in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    if len(parts) == 1:
+        tail = parts[0][0]
+    else:
+        merged = _Tail(k, len(values))
+        for part_tail, _, _ in parts:
+            merged.add(part_tail)
+        tail = merged.worst()
+    block_var = np.concatenate([p[1] for p in parts])
+    block_es = np.concatenate([p[2] for p in parts])
+    n = len(blocks)
+    return {
+        "var": -tail.max(axis=0),
+        "es": -tail.mean(axis=0),
+        "var_stderr": block_var.std(axis=0, ddof=1) / math.sqrt(n) if n > 1 else np.zeros(len(values)),
+        "es_stderr": block_es.std(axis=0, ddof=1) / math.sqrt(n) if n > 1 else np.zeros(len(values)),
+    }
+
+
+def mc_results(
+    user_id: str,
+    scenario: dict[str, Any],
+    portfolio_ids: list[str],
+    holdings: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    """risk_results rows (VaR/ES, amounts and standard errors) for one Monte Carlo scenario."""
+    lookback, confidence, horizon, paths, seed, method = parse_params(scenario.get("params_json") or "{}")
+    symbols, values = var.position_matrix(holdings, portfolio_ids)
+    cov = covariance.matrix_for(symbols, window=lookback, method=method)
+    est = simulate(np.zeros(len(symbols)), cov_factor(cov), values, horizon, confidence, paths, seed)
+    totals = values.sum(axis=1)
+    pct = np.divide(
+        -np.vstack([est["var"], est["es"]]) * 100.0, totals, out=np.zeros((2, len(totals))), where=totals != 0
+    )
+    level = f"{confidence * 100:g}".replace(".", "_")
+    var_name, es_name = f"MC_VaR_{level}_{horizon}d", f"MC_Expected_Shortfall_{level}_{horizon}d"
+    rows = []
+    for i, pid in enumerate(portfolio_ids):
+        for metric, value in (
+            (var_name, f"{pct[0, i]:.2f}%"),
+            (f"{var_name}_amount", f"{-est['var'][i]:.2f}"),
+            (f"{var_name}_stderr", f"{est['var_stderr'][i]:.2f}"),
+            (es_name, f"{pct[1, i]:.2f}%"),
+            (f"{es_name}_amount", f"{-est['es'][i]:.2f}"),
+            (f"{es_name}_stderr", f"{est['es_stderr'][i]:.2f}"),
+            ("MC_Paths", str(paths)),
+        ):
+            rows.append({
+                "user_id": user_id,
+                "scenario_id": scenario["id"],
+                "portfolio_id": pid,
+                "metric": metric,
+                "value": value,
+            })
+    return rows
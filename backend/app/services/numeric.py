@@ -0,0 +1,40 @@
+"""Helpers for turning CSV string columns into NumPy arrays."""
+from collections.abc import Iterable
+from typing import Any
+
+import numpy as np
+
+
+def to_float(value: Any, default: float = 0.0) -> float:
+    """Parse a CSV cell as float (``"1,250.5"`` and ``"-1.2%"`` accepted); ``default`` if blank or invalid."""
+    if value is None:
+        return default
+    try:
+        return float(str(value).replace(",", "").rstrip("%").strip())
+    except ValueError:
+        return default
+
+
+def format_number(value: float, places: int = 6) -> str:
+    """Render a float for a CSV cell without trailing zeros (``150.0`` -> ``"150"``)."""
+    text = f"{value:.{places}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def float_column(rows: Iterable[dict[str, Any]], key: str, default: float = 0.0) -> np.ndarray:
+    """Column of ``rows`` as a float64 array."""
+    return np.array([to_float(r.get(key), default) for r in rows], dtype=np.float64)
+
+
+def group_sum(labels: list[str], *values: np.ndarray) -> tuple[list[str], list[np.ndarray]]:
+    """Sum each value array by label. Returns (unique labels, one summed array per input)."""
+    if not labels:
+        return [], [np.zeros(0) for _ in values]
+    keys, inverse = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+    return keys.tolist(), [np.bincount(inverse, weights=v, minlength=len(keys)) for v in values]
+
+
+def group_sum_ids(ids: np.ndarray, labels: list[str], *values: np.ndarray) -> tuple[list[str], list[np.ndarray]]:
+    """``group_sum`` for integer-coded labels (``labels[id]``); only ids present in ``ids`` are returned."""
+    present = np.flatnonzero(np.bincount(ids, minlength=len(labels)))
+    return [labels[i] for i in present], [np.bincount(ids, weights=v, minlength=len(labels))[present] for v in values]
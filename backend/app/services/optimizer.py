@@ -0,0 +1,298 @@
+"""Mean-variance optimizer for model portfolios."""
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import covariance, securities
+from app.services.rebalance import parse_allocation
+
+TRADING_DAYS = 252
+DEFAULT_RISK_AVERSION = 4.0
+DEFAULT_RANGE = (0.5, 500.0)
+MAX_FRONTIER_POINTS = 200
+_TOL = 1e-8
+_MAX_ITER = 5000
+
+
+def _budget(
+    v: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    center: np.ndarray | None,
+    kappa: np.ndarray | None,
+    nu: np.ndarray | None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    ``clip(center + soft_threshold(v - nu - center, kappa), lo, hi)`` per column, with the
+    budget multiplier ``nu`` chosen so each column sums to one. Returns (w, nu).
+    """
+    n, m = v.shape
+    lo_c, hi_c = lo[:, None], hi[:, None]
+    prox = kappa is not None
+    c, k = (center[:, None], kappa) if prox else (0.0, np.zeros(m))
+    # At ``low`` every weight sits on its upper bound, at ``high`` on its lower bound.
+    low = (v - hi_c).min(axis=0) - k - 1.0
+    high = (v - lo_c).max(axis=0) + k + 1.0
+    gap_low = np.full(m, hi.sum() - 1.0)
+    gap_high = np.full(m, lo.sum() - 1.0)
+    nu = np.clip(np.zeros(m) if nu is None else nu, low, high)
+    for _ in range(100):
+        if prox:
+            u = v - nu - c
+            w = np.clip(c + np.sign(u) * np.maximum(np.abs(u) - k, 0.0), lo_c, hi_c)
+            free = ((w > lo_c) & (w < hi_c) & (np.abs(u) > k)).sum(axis=0)
+        else:
+            w = np.clip(v - nu, lo_c, hi_c)
+            free = ((w > lo_c) & (w < hi_c)).sum(axis=0)
+        gap = w.sum(axis=0) - 1.0
+        if np.abs(gap).max() <= 1e-12 * n:
+            break
+        above = gap > 0
+        low, gap_low = np.where(above, nu, low), np.where(above, gap, gap_low)
+        high, gap_high = np.where(above, high, nu), np.where(above, gap_high, gap)
+        step = nu + gap / np.maximum(free, 1)
+        # Newton on the piecewise-linear budget gap; false position when it leaves the bracket.
+        secant = low + gap_low * (high - low) / np.where(gap_low > gap_high, gap_low - gap_high, 1.0)
+        nu = np.where((free > 0) & (step > low) & (step < high), step, secant)
+    return w, nu
+
+
+def project(
+    v: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    center: np.ndarray | None = None,
+    radius: float | None = None,
+    nu: np.ndarray | None = None,
+    kappa: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Euclidean projection of each column of ``v`` onto ``{lo <= w <= hi, sum(w) = 1}``,
+    intersected with ``|w - center|_1 <= radius`` if given. ``nu``/``kappa`` (budget and
+    L1 multipliers from a previous call) warm-start the search. Returns (w, nu, kappa).
+    """
+    m = v.shape[1]
+    w, nu = _budget(v, lo, hi, None, None, nu)
+    kappa_out = np.zeros(m)
+    if radius is None:
+        return w, nu, kappa_out
+    over = np.flatnonzero(np.abs(w - center[:, None]).sum(axis=0) > radius + 1e-12)
+    if not len(over):
+        return w, nu, kappa_out
+    # The L1 multiplier: turnover falls as kappa grows and is zero once kappa spans v - center.
+    sub = v[:, over]
+    spread = sub - center[:, None]
+    k_low, f_low = np.zeros(len(over)), np.abs(w[:, over] - center[:, None]).sum(axis=0) - radius
+    k_high = spread.max(axis=0) - spread.min(axis=0) + 1e-12
+    f_high = np.full(len(over), -radius)
+    w_high = np.repeat(center[:, None], len(over), axis=1)
+    k = kappa[over] if kappa is not None else k_high / 2
+    k = np.where((k > k_low) & (k < k_high), k, k_high / 2)
+    sub_nu = nu[over]
+    side = np.zeros(len(over), dtype=np.int8)  # Illinois: halve the stale end's value
+    for _ in range(100):
+        trial, sub_nu = _budget(sub, lo, hi, center, k, sub_nu)
+        f = np.abs(trial - center[:, None]).sum(axis=0) - radius
+        fits = f <= 1e-10
+        k_high, f_high = np.where(fits, k, k_high), np.where(fits, f, f_high)
+        w_high = np.where(fits, trial, w_high)
+        k_low, f_low = np.where(fits, k_low, k), np.where(fits, f_low, f)
+        f_low = np.where(fits & (side == 1), f_low / 2, f_low)
+        f_high = np.where(~fits & (side == -1), f_high / 2, f_high)
+        side = np.where(fits, 1, -1).astype(np.int8)
+        if np.all((np.abs(f) <= 1e-10) | (k_high - k_low <= 1e-14)):
+            break
+        # Newton: on the free weights d|w - c|_1/dk = -n + (sum of signs)^2 / n, the budget
+        # multiplier moving to keep the sum fixed; false position when it leaves the bracket.
+        u = sub - sub_nu - center[:, None]
+        free = (trial > lo[:, None]) & (trial < hi[:, None]) & (np.abs(u) > k)
+        n_free = free.sum(axis=0)
+        signs = np.where(free, np.sign(u), 0.0).sum(axis=0)
+        slope = -n_free + signs ** 2 / np.maximum(n_free, 1)
+        newton = k - f / np.where(slope < 0, slope, -1.0)
+        secant = k_low + f_low * (k_high - k_low) / np.where(f_low > f_high, f_low - f_high, 1.0)
+        k = np.where((slope < 0) & (newton > k_low) & (newton < k_high), newton, secant)
+    w[:, over] = w_high  # the feasible side of each bracket
+    nu[over] = sub_nu
+    kappa_out[over] = k_high
+    return w, nu, kappa_out
+
+
+def solve(
+    mu: np.ndarray,
+    cov: np.ndarray,
+    gammas: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    start: np.ndarray,
+    w0: np.ndarray | None = None,
+    max_turnover: float | None = None,
+) -> tuple[np.ndarray, int]:
+    """
+    Optimal weights (assets x len(gammas)) and the iterations used, starting every column
+    from ``start``; ``max_turnover`` caps the L1 distance from ``w0``.
+    """
+    m = len(gammas)
+    step = 1.0 / (max(float(np.linalg.eigvalsh(cov)[-1]), 1e-12) * gammas)
+    w, nu, kappa = project(np.repeat(start[:, None], m, axis=1), lo, hi, w0, max_turnover)
+    out = w.copy()
+    # Columns still iterating; converged columns are written to ``out`` and dropped.
+    live = np.arange(m)
+    y, t = w.copy(), np.ones(m)
+    for iteration in range(1, _MAX_ITER + 1):
+        grad = (cov @ y) * gammas[live] - mu[:, None]
+        w_next, nu, kappa = project(y - grad * step[live], lo, hi, w0, max_turnover, nu, kappa)
+        moved = np.abs(w_next - w).max(axis=0)
+        t = np.where(((y - w_next) * (w_next - w)).sum(axis=0) > 0, 1.0, t)  # momentum uphill: restart
+        t_next = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        y = w_next + ((t - 1.0) / t_next) * (w_next - w)
+        w, t = w_next, t_next
+        done = moved < _TOL
+        if done.any():
+            out[:, live[done]] = w[:, done]
+            keep = ~done
+            live, w, y, t, nu, kappa = live[keep], w[:, keep], y[:, keep], t[keep], nu[keep], kappa[keep]
+            if not len(live):
+                break
+    out[:, live] = w
+    return out, iteration
+
+
+def allocation_json(symbols: list[str], weights: np.ndarray) -> str:
+    """Weights as an allocation_json of percentages (4 dp) that sum exactly to 100."""
+    units = np.clip(weights, 0.0, None) * 1_000_000
+    floor = np.floor(units)
+    short = int(round(1_000_000 - floor.sum()))
+    if short > 0:
+        floor[np.argsort(floor - units)[:short]] += 1
+    return "{" + ", ".join(
+        f'"{s}": {int(u) / 10_000:g}' for s, u in zip(symbols, floor) if u > 0
+    ) + "}"
+
+
+def _bounds(
+    symbols: list[str], min_weight: float, max_weight: float, bounds: dict[str, list[float]], long_only: bool,
+) -> tuple[np.ndarray, np.ndarray]:
+    lo = np.full(len(symbols), float(min_weight))
+    hi = np.full(len(symbols), float(max_weight))
+    index = {s: i for i, s in enumerate(symbols)}
+    for symbol, pair in bounds.items():
+        i = index.get(price_store.normalize_symbol(symbol))
+        if i is None:
+            raise ValueError(f"Bounds given for {symbol}, which is not in the universe")
+        if len(pair) != 2:
+            raise ValueError(f"Bounds for {symbol} must be [min, max]")
+        lo[i], hi[i] = float(pair[0]), float(pair[1])
+    if long_only:
+        lo = np.maximum(lo, 0.0)
+    if (lo > hi).any() or lo.sum() > 1.0 + 1e-9 or hi.sum() < 1.0 - 1e-9:
+        raise ValueError("Weight bounds leave no fully invested portfolio")
+    return lo, hi
+
+
+def _point(gamma: float, w: np.ndarray, mu: np.ndarray, cov: np.ndarray, w0: np.ndarray | None, symbols: list[str]) -> dict[str, Any]:
+    return {
+        "risk_aversion": gamma,
+        "expected_return": float(mu @ w),
+        "volatility": float(np.sqrt(max(w @ cov @ w, 0.0))),
+        "turnover": float(np.abs(w - w0).sum()) if w0 is not None else None,
+        "weights": {s: float(x) for s, x in zip(symbols, w) if abs(x) > 1e-6},
+    }
+
+
+def optimize(
+    user_id: str,
+    symbols: list[str],
+    model_id: str | None = None,
+    expected_returns: dict[str, float] | None = None,
+    risk_aversion: float = DEFAULT_RISK_AVERSION,
+    min_weight: float = 0.0,
+    max_weight: float = 1.0,
+    bounds: dict[str, list[float]] | None = None,
+    long_only: bool = True,
+    max_turnover: float | None = None,
+    frontier_points: int = 0,
+    risk_aversion_range: tuple[float, float] = DEFAULT_RANGE,
+    method: str = "ledoit_wolf",
+    window: int = covariance.DEFAULT_WINDOW,
+    save: bool = False,
+) -> dict[str, Any]:
+    """
+    Optimal allocation for ``symbols`` (default: the model's symbols), optionally with an
+    efficient frontier. With ``model_id`` the model's allocation is the warm start and the
+    turnover reference; ``save`` writes the result back as its allocation_json.
+    """
+    model = None
+    if model_id is not None:
+        model = next((m for m in csv_store.get_by_user("model_portfolios", user_id) if m.get("id") == model_id), None)
+        if model is None:
+            raise ValueError("Model portfolio not found")
+    current = parse_allocation(model.get("allocation_json") or "{}") if model else {}
+    # Class names as rebalance resolves them: the security master's and the user's holdings'.
+    classes = {r.get("asset_class") for r in securities.master().values()} | {
+        h.get("asset_class") for h in csv_store.get_by_user("holdings", user_id)
+    }
+    class_keys = sorted(k for k in current if k in classes)
+    if class_keys:
+        # Class sleeves have no price series to optimize, and saving would replace them with symbols.
+        raise ValueError(f"Model has asset-class sleeves ({', '.join(class_keys)}); the optimizer needs a symbol model")
+    current = {price_store.normalize_symbol(k): v for k, v in current.items()}
+    universe = list(dict.fromkeys(price_store.normalize_symbol(s) for s in (symbols or list(current)) if s))
+    if len(universe) < 2:
+        raise ValueError("Need at least two symbols to optimize")
+    if risk_aversion <= 0 or min(risk_aversion_range) <= 0:
+        raise ValueError("Risk aversion must be positive")
+    if not 0 <= frontier_points <= MAX_FRONTIER_POINTS:
+        raise ValueError(f"frontier_points must be between 0 and {MAX_FRONTIER_POINTS}")
+    if max_turnover is not None and (model is None or max_turnover < 0):
+        raise ValueError("max_turnover needs a model_id to measure turnover from and must be non-negative")
+
+    estimate = covariance.estimate(universe, window=window, method=method)
+    cov = covariance.matrix_for(universe, window=window, method=method) * TRADING_DAYS
+    if expected_returns is not None:
+        given = {price_store.normalize_symbol(k): float(v) for k, v in expected_returns.items()}
+        missing = [s for s in universe if s not in given]
+        if missing:
+            raise ValueError(f"No expected return for {', '.join(missing)}")
+        mu = np.array([given[s] for s in universe])
+    else:
+        _, returns = covariance.log_returns(universe, window)
+        if len(returns) < 2:
+            raise ValueError("Not enough price history to estimate expected returns")
+        mu = returns.mean(axis=0) * TRADING_DAYS
+    lo, hi = _bounds(universe, min_weight, max_weight, bounds or {}, long_only)
+
+    w0 = None
+    if model is not None and any(s in current for s in universe):
+        w0 = project(np.array([[current.get(s, 0.0)] for s in universe]), lo, hi)[0][:, 0]
+    start = w0 if w0 is not None else np.full(len(universe), 1.0 / len(universe))
+
+    gammas = np.array([risk_aversion], dtype=np.float64)
+    if frontier_points:
+        low_g, high_g = sorted(risk_aversion_range)
+        gammas = np.append(gammas, np.geomspace(high_g, low_g, frontier_points))
+    weights, iterations = solve(mu, cov, gammas, lo, hi, start, w0, max_turnover if w0 is not None else None)
+
+    chosen = weights[:, 0]
+    result = {
+        "symbols": universe,
+        "as_of": estimate["as_of"],
+        "method": method,
+        "observations": estimate["observations"],
+        "iterations": iterations,
+        "warm_start": w0 is not None,
+        "portfolio": {
+            **_point(float(gammas[0]), chosen, mu, cov, w0, universe),
+            # Models hold long-only targets; a long/short result has no allocation_json.
+            "allocation_json": allocation_json(universe, chosen) if chosen.min() > -1e-9 else None,
+        },
+        "frontier": [_point(float(g), weights[:, j + 1], mu, cov, w0, universe) for j, g in enumerate(gammas[1:])],
+        "saved": False,
+    }
+    if save:
+        if model is None or result["portfolio"]["allocation_json"] is None:
+            raise ValueError("save needs a model_id and a long-only result")
+        csv_store.update_row("model_portfolios", "id", model["id"], {"allocation_json": result["portfolio"]["allocation_json"]})
+        result["saved"] = True
+    return result
@@ -0,0 +1,164 @@
+"""Order lifecycle: state machine, append-only event log and in-memory index."""
+import threading
+from datetime import datetime, timezone
+from typing import Any
+
+from app.db import csv_store
+
+NEW, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED = "NEW", "PARTIALLY_FILLED", "FILLED", "CANCELLED", "REJECTED"
+STATUSES = (NEW, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED)
+OPEN = (NEW, PARTIALLY_FILLED)
+TRANSITIONS: dict[str, frozenset[str]] = {
+    NEW: frozenset({PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED}),
+    PARTIALLY_FILLED: frozenset({PARTIALLY_FILLED, FILLED, CANCELLED}),
+    FILLED: frozenset(),
+    CANCELLED: frozenset(),
+    REJECTED: frozenset(),
+}
+STATE_FIELDS = ("status", "filled_quantity", "avg_fill_price")
+
+# Serialises validate-then-append; the execution engine holds it while matching.
+lock = threading.RLock()
+_current: dict[str, dict[str, Any]] | None = None
+_by_user: dict[str, dict[str, None]] = {}  # user_id -> order ids in creation order
+_history: dict[str, list[dict[str, Any]]] = {}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _index(row: dict[str, Any]) -> None:
+    assert _current is not None
+    _current[row["id"]] = dict(row)
+    _by_user.setdefault(row.get("user_id") or "", {})[row["id"]] = None
+
+
+def _apply(event: dict[str, Any]) -> None:
+    assert _current is not None
+    _history.setdefault(event.get("order_id") or "", []).append(event)
+    row = _current.get(event.get("order_id") or "")
+    if row is not None:
+        row.update({k: event.get(k) or "" for k in STATE_FIELDS})
+
+
+def _ensure_loaded() -> dict[str, dict[str, Any]]:
+    global _current
+    if _current is None:
+        _current = {}
+        _by_user.clear()
+        _history.clear()
+        for row in csv_store.read_table("orders"):
+            _index(row)
+        for event in csv_store.read_table("order_events"):  # file order is append order
+            _apply(event)
+    return _current
+
+
+def _on_orders_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _current
+    if _current is None:
+        return
+    if op == "insert" and new is not None:
+        _index(new)
+    elif op == "delete" and old is not None:
+        _current.pop(old["id"], None)
+        _history.pop(old["id"], None)
+        _by_user.get(old.get("user_id") or "", {}).pop(old["id"], None)
+    else:
+        _current = None
+
+
+def _on_events_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _current
+    if _current is None:
+        return
+    if op == "insert" and new is not None:
+        _apply(new)
+    else:
+        _current = None  # the log is append-only; anything else forces a reload
+
+
+csv_store.add_mutation_hook("orders", _on_orders_change)
+csv_store.add_mutation_hook("order_events", _on_events_change)
+
+
+def get(user_id: str, order_id: str) -> dict[str, Any] | None:
+    """Current state of one of the user's orders."""
+    with lock:
+        row = _ensure_loaded().get(order_id)
+        return dict(row) if row is not None and row.get("user_id") == user_id else None
+
+
+def list_orders(user_id: str) -> list[dict[str, Any]]:
+    with lock:
+        current = _ensure_loaded()
+        return [dict(current[i]) for i in _by_user.get(user_id, ())]
+
+
+def open_orders() -> list[dict[str, Any]]:
+    """Every NEW or PARTIALLY_FILLED order, oldest first."""
+    with lock:
+        rows = [dict(r) for r in _ensure_loaded().values() if r.get("status") in OPEN]
+    rows.sort(key=lambda r: r.get("created_at") or "")
+    return rows
+
+
+def history(user_id: str, order_id: str) -> list[dict[str, Any]] | None:
+    """Creation state followed by every recorded change, oldest first."""
+    with lock:
+        row = _ensure_loaded().get(order_id)
+        if row is None or row.get("user_id") != user_id:
+            return None
+        events = _history.get(order_id, [])
+        created = events[0].get("from_status") if events else row.get("status")
+        return [{"status": created, "at": row.get("created_at"), "reason": "created"}] + [
+            {"from_status": e.get("from_status"), **{k: e.get(k) for k in STATE_FIELDS}, "reason": e.get("reason"), "at": e.get("at")}
+            for e in events
+        ]
+
+
+def check_transition(current: str, status: str) -> None:
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status {status!r}; expected one of {', '.join(STATUSES)}")
+    if status not in TRANSITIONS.get(current, frozenset()):
+        raise InvalidTransition(f"Cannot move order from {current} to {status}")
+
+
+def record(changes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Append state changes (order_id, status and optionally filled_quantity, avg_fill_price,
+    reason, at) as one batch after validating every transition. Changes to the same
+    order apply in sequence. Returns the orders' new current rows.
+    """
+    with lock:
+        current = _ensure_loaded()
+        state: dict[str, dict[str, Any]] = {}
+        rows = []
+        for change in changes:
+            order = current.get(change["order_id"])
+            if order is None:
+                raise ValueError(f"Order {change['order_id']} not found")
+            before = state.get(order["id"]) or {k: order.get(k) or "" for k in STATE_FIELDS}
+            status = str(change["status"]).upper()
+            check_transition(before["status"] if before["status"] in TRANSITIONS else NEW, status)
+            after = {k: str(change.get(k, before[k]) or "") for k in STATE_FIELDS}
+            after["status"] = status
+            state[order["id"]] = after
+            rows.append({
+                "id": csv_store.generate_id(),
+                "order_id": order["id"],
+                "user_id": order.get("user_id") or "",
+                "from_status": before["status"],
+                "from_filled_quantity": before["filled_quantity"],
+                "from_avg_fill_price": before["avg_fill_price"],
+                **after,
+                "reason": change.get("reason") or "",
+                "at": change.get("at") or _now(),
+            })
+        csv_store.append_rows("order_events", rows)
+        return [dict(current[i]) for i in state]
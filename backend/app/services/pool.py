@@ -0,0 +1,69 @@
+"""Shared process pool for CPU-bound risk work."""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+
+
+def worker_count() -> int:
+    return settings.risk_workers or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def split(n: int, parts: int) -> list[slice]:
+    """Split range(n) into at most ``parts`` contiguous, non-empty slices."""
+    bounds = [round(i * n / parts) for i in range(parts + 1)]
+    return [slice(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+ArraySpec = tuple[str, list[tuple[str, tuple[int, ...], int]]]
+
+
+def share_arrays(arrays: dict[str, np.ndarray]) -> tuple[shared_memory.SharedMemory, ArraySpec]:
+    """
+    Copy float64 ``arrays`` into one shared-memory block. The caller owns the block
+    (``close()`` and ``unlink()`` it when the workers are done); pass the spec to workers.
+    """
+    layout, offset = [], 0
+    for name, a in arrays.items():
+        layout.append((name, a.shape, offset))
+        offset += a.size * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+    for (name, shape, start), a in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=start)[...] = a
+    return shm, (shm.name, layout)
+
+
+def attach_arrays(spec: ArraySpec) -> tuple[shared_memory.SharedMemory, dict[str, np.ndarray]]:
+    """Read-only views onto a block from ``share_arrays``; ``close()`` the block after use."""
+    name, layout = spec
+    shm = shared_memory.SharedMemory(name=name)
+    views = {}
+    for key, shape, start in layout:
+        view = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=start)
+        view.flags.writeable = False
+        views[key] = view
+    return shm, views
@@ -0,0 +1,335 @@
+"""Event-sourced position keeping."""
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from typing import Any
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import securities
+from app.services.numeric import format_number, to_float
+
+Position = tuple[float, float]  # (quantity, avg_cost)
+Opening = tuple[float, float, str]  # (quantity, avg_cost, recorded_at) held before the first fill
+
+
+def apply_trade(position: Position, side: str, quantity: float, price: float) -> Position:
+    """Apply one fill to a (quantity, avg_cost) position. Shorts are negative quantities."""
+    qty, avg = position
+    signed = quantity if side.upper() == "BUY" else -quantity
+    new_qty = qty + signed
+    if abs(new_qty) < 1e-12:
+        return 0.0, 0.0
+    if qty == 0 or (qty > 0) == (signed > 0):
+        return new_qty, (qty * avg + signed * price) / new_qty
+    if (qty > 0) == (new_qty > 0):
+        return new_qty, avg  # reducing: cost of what remains is unchanged
+    return new_qty, price  # flipped through zero: remainder opened at the fill price
+
+
+def upper_bound(as_of: str) -> str:
+    """Inclusive timestamp bound for ``as_of`` (a bare date covers the whole day)."""
+    return f"{as_of}T23:59:59.999999+00:00" if len(as_of) == 10 else as_of
+
+
+class _PortfolioLog:
+    """Time-sorted events of one portfolio plus snapshots at event counts."""
+
+    __slots__ = ("times", "events", "snapshot_counts", "snapshots", "symbols", "opening")
+
+    def __init__(self) -> None:
+        self.times: list[str] = []
+        self.events: list[dict[str, Any]] = []
+        self.snapshot_counts: list[int] = []
+        self.snapshots: list[tuple[str, dict[str, Position]]] = []
+        self.symbols: set[str] = set()  # symbols with at least one event
+        self.opening: dict[str, Opening] = {}
+
+    def add(self, event: dict[str, Any]) -> None:
+        self.symbols.add(event.get("symbol") or "")
+        ts = event.get("executed_at") or ""
+        i = bisect_right(self.times, ts)
+        self.times.insert(i, ts)
+        self.events.insert(i, event)
+        if i < len(self.times) - 1:
+            # Back-dated event: snapshots taken after it no longer describe history.
+            keep = bisect_right(self.snapshot_counts, i)
+            del self.snapshot_counts[keep:]
+            del self.snapshots[keep:]
+
+    def add_snapshot(self, count: int, as_of: str, positions: dict[str, Position]) -> None:
+        i = bisect_right(self.snapshot_counts, count)
+        self.snapshot_counts.insert(i, count)
+        self.snapshots.insert(i, (as_of, positions))
+
+    def add_opening(self, symbol: str, opening: Opening) -> None:
+        # The symbol has no events yet, so every snapshot held exactly the opening position.
+        self.opening[symbol] = opening
+        for _, positions in self.snapshots:
+            positions[symbol] = opening[:2]
+
+    def rebuild(self, end: int) -> tuple[dict[str, Position], int, str | None]:
+        """Positions after the first ``end`` events: (positions, events replayed, snapshot as_of)."""
+        s = bisect_right(self.snapshot_counts, end) - 1
+        start, snap_as_of = 0, None
+        positions = {symbol: opening[:2] for symbol, opening in self.opening.items()}
+        if s >= 0:
+            start = self.snapshot_counts[s]
+            snap_as_of, snap = self.snapshots[s]
+            positions = dict(snap)
+        for event in self.events[start:end]:
+            symbol = event["symbol"]
+            positions[symbol] = apply_trade(
+                positions.get(symbol, (0.0, 0.0)),
+                event.get("side") or "",
+                to_float(event.get("quantity")),
+                to_float(event.get("price")),
+            )
+            if positions[symbol][0] == 0.0:
+                del positions[symbol]
+        return positions, end - start, snap_as_of
+
+    def since_snapshot(self) -> int:
+        return len(self.events) - (self.snapshot_counts[-1] if self.snapshot_counts else 0)
+
+
+_lock = threading.RLock()
+_logs: dict[str, _PortfolioLog] | None = None
+
+
+def _ensure_loaded() -> dict[str, _PortfolioLog]:
+    global _logs
+    if _logs is None:
+        logs: dict[str, _PortfolioLog] = {}
+        events = sorted(csv_store.read_table("position_events"), key=lambda e: e.get("executed_at") or "")
+        for e in events:
+            log = logs.setdefault(e.get("portfolio_id") or "", _PortfolioLog())
+            log.times.append(e.get("executed_at") or "")
+            log.events.append(e)
+            log.symbols.add(e.get("symbol") or "")
+        for snap in csv_store.read_table("position_snapshots"):
+            count = int(to_float(snap.get("event_count")))
+            positions = {s: (float(q), float(a)) for s, (q, a) in json.loads(snap.get("positions_json") or "{}").items()}
+            if count == 0:  # opening positions, recorded just before a symbol's first fill
+                log = logs.setdefault(snap.get("portfolio_id") or "", _PortfolioLog())
+                log.opening.update({s: (q, a, snap.get("as_of") or "") for s, (q, a) in positions.items()})
+                continue
+            log = logs.get(snap.get("portfolio_id") or "")
+            if log is None or not 0 < count <= len(log.events) or log.times[count - 1] != snap.get("as_of"):
+                continue  # stale snapshot (history changed since it was taken)
+            log.add_snapshot(count, snap.get("as_of") or "", positions)
+        for log in logs.values():
+            # Snapshots taken before an opening was recorded lack it; their symbol had no events yet.
+            first: dict[str, int] = {}
+            for i, e in enumerate(log.events):
+                first.setdefault(e.get("symbol") or "", i)
+            for count, (_, positions) in zip(log.snapshot_counts, log.snapshots):
+                for symbol, opening in log.opening.items():
+                    if first.get(symbol, count) >= count:
+                        positions.setdefault(symbol, opening[:2])
+        _logs = logs
+    return _logs
+
+
+def _on_events_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _logs
+    with _lock:
+        if _logs is None:
+            return
+        if op == "insert" and new is not None:
+            _logs.setdefault(new.get("portfolio_id") or "", _PortfolioLog()).add(new)
+        else:
+            _logs = None  # events are append-only; anything else forces a reload
+
+
+csv_store.add_mutation_hook("position_events", _on_events_change)
+
+
+def _take_snapshots(portfolio_ids: set[str]) -> list[dict[str, Any]]:
+    rows = []
+    with _lock:
+        logs = _ensure_loaded()
+        for pid in portfolio_ids:
+            log = logs.get(pid)
+            if log is None or log.since_snapshot() < settings.position_snapshot_interval:
+                continue
+            count = len(log.events)
+            positions, _, _ = log.rebuild(count)
+            log.add_snapshot(count, log.times[-1], positions)
+            rows.append({
+                "id": csv_store.generate_id(),
+                "user_id": log.events[-1].get("user_id"),
+                "portfolio_id": pid,
+                "as_of": log.times[-1],
+                "event_count": str(count),
+                "positions_json": json.dumps({s: [q, a] for s, (q, a) in positions.items()}),
+            })
+    return rows
+
+
+def _index_holdings(holdings: list[dict[str, Any]]) -> tuple[dict[tuple[str, str], dict[str, Any]], dict[str, str]]:
+    """((portfolio_id, symbol) -> holding row, symbol -> a known asset class)."""
+    by_key: dict[tuple[str, str], dict[str, Any]] = {}
+    asset_class_of: dict[str, str] = {}
+    for h in holdings:
+        symbol = price_store.normalize_symbol(h.get("symbol") or "")
+        by_key.setdefault((h.get("portfolio_id") or "", symbol), h)
+        if h.get("asset_class"):
+            asset_class_of.setdefault(symbol, h["asset_class"])
+    return by_key, asset_class_of
+
+
+def _record_openings(fills: list[dict[str, Any]], by_key: dict[tuple[str, str], dict[str, Any]], now: str) -> None:
+    """Store the holding each fill's (portfolio, symbol) had before its first-ever fill."""
+    with _lock:
+        logs = _ensure_loaded()
+        fresh = {
+            (f["portfolio_id"], f["symbol"]): f["user_id"] for f in fills
+            if f["portfolio_id"] not in logs
+            or f["symbol"] not in logs[f["portfolio_id"]].symbols | logs[f["portfolio_id"]].opening.keys()
+        }
+    by_portfolio: dict[str, dict[str, Position]] = {}
+    user_of: dict[str, str] = {}
+    for (pid, symbol), user_id in fresh.items():
+        row = by_key.get((pid, symbol))
+        if row is not None and to_float(row.get("quantity")) != 0:
+            by_portfolio.setdefault(pid, {})[symbol] = (to_float(row.get("quantity")), to_float(row.get("avg_cost")))
+            user_of[pid] = user_id
+    if not by_portfolio:
+        return
+    csv_store.append_rows("position_snapshots", [
+        {
+            "id": csv_store.generate_id(),
+            "user_id": user_of[pid],
+            "portfolio_id": pid,
+            "as_of": now,
+            "event_count": "0",
+            "positions_json": json.dumps({s: [q, a] for s, (q, a) in positions.items()}),
+        }
+        for pid, positions in by_portfolio.items()
+    ])
+    with _lock:
+        logs = _ensure_loaded()
+        for pid, positions in by_portfolio.items():
+            log = logs.setdefault(pid, _PortfolioLog())
+            for symbol, (q, a) in positions.items():
+                if symbol not in log.opening:  # a reload may already have picked up the row
+                    log.add_opening(symbol, (q, a, now))
+
+
+def _apply_to_holdings(events: list[dict[str, Any]], holdings: list[dict[str, Any]]) -> None:
+    """Fold events into holdings rows: one rewrite for updates/deletes, one append for new rows."""
+    by_key, asset_class_of = _index_holdings(holdings)
+    touched: dict[tuple[str, str], dict[str, Any]] = {}
+    new_keys: set[tuple[str, str]] = set()
+    for e in events:
+        key = (e["portfolio_id"], e["symbol"])
+        row = touched.get(key) or by_key.get(key)
+        if row is None:
+            row = {
+                "id": csv_store.generate_id(),
+                "portfolio_id": e["portfolio_id"],
+                "user_id": e["user_id"],
+                "symbol": e["symbol"],
+                "asset_class": (securities.lookup(e["symbol"]) or {}).get("asset_class")
+                or asset_class_of.get(e["symbol"], "unclassified"),
+                "quantity": "0",
+                "avg_cost": "0",
+            }
+            new_keys.add(key)
+        else:
+            row = dict(row)
+        qty, avg = apply_trade(
+            (to_float(row.get("quantity")), to_float(row.get("avg_cost"))),
+            e["side"],
+            to_float(e["quantity"]),
+            to_float(e["price"]),
+        )
+        row["quantity"], row["avg_cost"] = format_number(qty), format_number(avg)
+        touched[key] = row
+    inserts = [r for k, r in touched.items() if k in new_keys and to_float(r["quantity"]) != 0]
+    updates = {
+        r["id"]: {"quantity": r["quantity"], "avg_cost": r["avg_cost"]}
+        for k, r in touched.items()
+        if k not in new_keys and to_float(r["quantity"]) != 0
+    }
+    deletes = {r["id"] for k, r in touched.items() if k not in new_keys and to_float(r["quantity"]) == 0}
+    csv_store.update_rows("holdings", "id", updates)
+    csv_store.delete_rows("holdings", "id", deletes)
+    csv_store.append_rows("holdings", inserts)
+
+
+def apply_fills(fills: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Record fills as position events and apply them to holdings.
+    Each fill needs user_id, portfolio_id, symbol, side, quantity and price;
+    order_id, executed_at (default now) and lot_method (tax lot relief) are optional. Returns the stored events.
+    """
+    if not fills:
+        return []
+    now = datetime.now(timezone.utc).isoformat()
+    fills = [{**f, "symbol": price_store.normalize_symbol(f["symbol"])} for f in fills]
+    # Holdings are read, folded and written back under their table lock so a concurrent edit isn't lost.
+    with csv_store.table_lock("holdings"):
+        holdings = csv_store.read_table("holdings")
+        _record_openings(fills, _index_holdings(holdings)[0], now)
+        events = csv_store.append_rows("position_events", [
+            {
+                "id": csv_store.generate_id(),
+                "user_id": f["user_id"],
+                "portfolio_id": f["portfolio_id"],
+                "order_id": f.get("order_id", ""),
+                "symbol": f["symbol"],
+                "side": str(f["side"]).upper(),
+                "quantity": format_number(to_float(f["quantity"])),
+                "price": format_number(to_float(f["price"])),
+                "executed_at": f.get("executed_at") or now,
+                "lot_method": f.get("lot_method", ""),
+            }
+            for f in fills
+        ])
+        snapshots = _take_snapshots({e["portfolio_id"] for e in events})
+        csv_store.append_rows("position_snapshots", snapshots)
+        _apply_to_holdings(events, holdings)
+    return events
+
+
+def positions_as_of(portfolio_id: str, as_of: str | None = None) -> dict[str, Any]:
+    """Event-derived positions at ``as_of`` (timestamp or date; default: all events)."""
+    with _lock:
+        log = _ensure_loaded().get(portfolio_id) or _PortfolioLog()
+        end = bisect_right(log.times, upper_bound(as_of)) if as_of else len(log.times)
+        positions, replayed, snap_as_of = log.rebuild(end)
+    return {
+        "portfolio_id": portfolio_id,
+        "as_of": as_of,
+        "events": end,
+        "replayed_events": replayed,
+        "snapshot_as_of": snap_as_of,
+        "positions": [
+            {"symbol": s, "quantity": q, "avg_cost": a}
+            for s, (q, a) in sorted(positions.items())
+        ],
+    }
+
+
+def opening_positions(portfolio_ids: Iterable[str]) -> dict[tuple[str, str], Opening]:
+    """(portfolio_id, symbol) -> position held before the symbol's first recorded fill."""
+    with _lock:
+        logs = _ensure_loaded()
+        return {
+            (pid, symbol): opening
+            for pid in portfolio_ids if pid in logs
+            for symbol, opening in logs[pid].opening.items()
+        }
+
+
+def portfolio_events(portfolio_id: str, start: str | None = None, end: str | None = None) -> list[dict[str, Any]]:
+    """Events for a portfolio in time order, optionally limited to [start, end]."""
+    with _lock:
+        log = _ensure_loaded().get(portfolio_id) or _PortfolioLog()
+        lo = bisect_left(log.times, start) if start else 0
+        hi = bisect_right(log.times, upper_bound(end)) if end else len(log.times)
+        return list(log.events[lo:hi])
@@ -0,0 +1,283 @@
+"""Private markets analytics: IRR, TVPI, DPI and RVPI per fund and roll-up."""
+import threading
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+from app.db import csv_store
+from app.services import fx
+from app.services.numeric import float_column
+
+CALL, DISTRIBUTION, NAV = "call", "distribution", "nav"
+FLOW_TYPES = (CALL, DISTRIBUTION, NAV)
+GROUP_BY = ("fund", "strategy", "vintage")
+
+_NEWTON_STEPS = 50
+_BISECT_STEPS = 200
+_TOL = 1e-10
+_LOWER = -0.9999  # IRR floor: (1 + r) stays positive
+_UPPER = 1e6
+
+_lock = threading.Lock()
+_versions: dict[str, int] = {}  # fund_id -> cash flow / commitment change count
+_epoch = 0  # bumped by whole-table rewrites
+_cache: dict[str, tuple[tuple, dict[str, Any]]] = {}  # fund_id -> (key, entry)
+
+
+def _on_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _epoch
+    with _lock:
+        if op == "reset":
+            _epoch += 1
+            _cache.clear()
+            return
+        for row in (old, new):
+            if row is not None:
+                fund_id = row.get("fund_id") or ""
+                _versions[fund_id] = _versions.get(fund_id, 0) + 1
+                _cache.pop(fund_id, None)
+
+
+csv_store.add_mutation_hook("fund_cash_flows", _on_change)
+csv_store.add_mutation_hook("commitments", _on_change)
+
+
+def validate_cash_flow(row: dict[str, Any]) -> dict[str, Any]:
+    """Normalise a cash flow's type, amount and date; raises ValueError if any is invalid."""
+    kind = (row.get("flow_type") or "").strip().lower()
+    if kind not in FLOW_TYPES:
+        raise ValueError(f"flow_type must be one of {', '.join(FLOW_TYPES)}")
+    try:
+        amount = float(row.get("amount"))
+    except (TypeError, ValueError):
+        amount = -1.0
+    if not np.isfinite(amount) or amount < 0:
+        raise ValueError("amount must be a non-negative number")
+    try:
+        np.datetime64((row.get("date") or "")[:10], "D")
+    except ValueError:
+        raise ValueError(f"Invalid date: {row.get('date')!r}")
+    return {**row, "flow_type": kind, "date": (row.get("date") or "")[:10]}
+
+
+def _npv(rate: np.ndarray, amounts: np.ndarray, years: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """NPV and its derivative per row at ``rate`` (one rate per row)."""
+    discount = (1.0 + rate)[:, None] ** -years
+    value = (amounts * discount).sum(axis=1)
+    slope = (-years * amounts * discount / (1.0 + rate)[:, None]).sum(axis=1)
+    return value, slope
+
+
+def irr(amounts: np.ndarray, years: np.ndarray, guess: float = 0.1) -> np.ndarray:
+    """
+    Annual IRR of each row of ``amounts`` (flows at ``years`` from the row's first flow;
+    pad with zero amounts). NaN where there is no sign change or no root is found.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+    k = amounts.shape[0]
+    rate = np.full(k, np.nan)
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+    active = np.flatnonzero(solvable)
+    r = np.full(len(active), guess)
+    done = np.zeros(len(active), dtype=bool)
+    with np.errstate(all="ignore"):
+        for _ in range(_NEWTON_STEPS):
+            todo = np.flatnonzero(~done)
+            if not len(todo):
+                break
+            rows = active[todo]
+            value, slope = _npv(r[todo], amounts[rows], years[rows])
+            step = value / slope
+            nxt = r[todo] - step
+            bad = ~np.isfinite(nxt) | (nxt <= _LOWER) | (nxt > _UPPER)
+            r[todo] = np.where(bad, np.nan, nxt)
+            done[todo] = bad | (np.abs(step) < _TOL * np.maximum(1.0, np.abs(nxt)))
+        value, _ = _npv(r, amounts[active], years[active])
+        scale = np.abs(amounts[active]).sum(axis=1)
+        ok = np.isfinite(r) & (np.abs(value) <= 1e-8 * scale)
+    rate[active[ok]] = r[ok]
+
+    # Bisection for the rest: widen the upper end until the NPV changes sign.
+    rest = active[~ok]
+    if len(rest):
+        lo = np.full(len(rest), _LOWER)
+        hi = np.full(len(rest), 1.0)
+        with np.errstate(all="ignore"):
+            f_lo, _ = _npv(lo, amounts[rest], years[rest])
+            f_hi, _ = _npv(hi, amounts[rest], years[rest])
+            while True:
+                widen = np.sign(f_lo) == np.sign(f_hi)
+                widen &= hi < _UPPER
+                if not widen.any():
+                    break
+                hi[widen] *= 10.0
+                f_hi[widen], _ = _npv(hi[widen], amounts[rest[widen]], years[rest[widen]])
+            bracketed = np.sign(f_lo) != np.sign(f_hi)
+            for _ in range(_BISECT_STEPS):
+                mid = 0.5 * (lo + hi)
+                f_mid, _ = _npv(mid, amounts[rest], years[rest])
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo, f_lo = np.where(left, mid, lo), np.where(left, f_mid, f_lo)
+                hi = np.where(left, hi, mid)
+                if np.all(hi - lo < _TOL):
+                    break
+        rate[rest[bracketed]] = (0.5 * (lo + hi))[bracketed]
+    return rate
+
+
+def _pad(series: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    """Stack (day numbers, amounts) series into padded amount and year matrices."""
+    width = max((len(d) for d, _ in series), default=0)
+    amounts = np.zeros((len(series), max(width, 1)))
+    years = np.zeros_like(amounts)
+    for i, (days, values) in enumerate(series):
+        if len(days):
+            amounts[i, :len(days)] = values
+            years[i, :len(days)] = (days - days.min()) / 365.0
+    return amounts, years
+
+
+def _net_series(days: np.ndarray, amounts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Net signed amounts per distinct day."""
+    if not len(days):
+        return days, amounts
+    unique, inverse = np.unique(days, return_inverse=True)
+    return unique, np.bincount(inverse, weights=amounts, minlength=len(unique))
+
+
+def _ratios(paid_in: float, distributed: float, nav: float) -> dict[str, float | None]:
+    if paid_in <= 0:
+        return {"dpi": None, "rvpi": None, "tvpi": None}
+    return {"dpi": distributed / paid_in, "rvpi": nav / paid_in, "tvpi": (distributed + nav) / paid_in}
+
+
+def _fund_entry(flows: list[dict[str, Any]], committed: float, base: str) -> tuple[dict[str, Any], tuple]:
+    """Metrics (IRR filled in by the caller) and the fund's net IRR series."""
+    amounts = fx.convert(float_column(flows, "amount"), [f.get("currency") or "" for f in flows], base)
+    days = np.array([(f.get("date") or "")[:10] for f in flows], dtype="datetime64[D]").astype(np.int64)
+    kinds = np.array([f.get("flow_type") for f in flows], dtype=object)
+    calls, dists, navs = kinds == CALL, kinds == DISTRIBUTION, kinds == NAV
+    paid_in, distributed = float(amounts[calls].sum()), float(amounts[dists].sum())
+    nav, nav_date = 0.0, None
+    if navs.any():
+        last = np.flatnonzero(navs)[np.argmax(days[navs])]
+        nav, nav_date = float(amounts[last]), str(np.datetime64(int(days[last]), "D"))
+    keep = calls | dists
+    signed = np.where(calls, -amounts, amounts)[keep]
+    flow_days = days[keep]
+    if nav_date is not None:
+        signed = np.append(signed, nav)
+        flow_days = np.append(flow_days, days[last])
+    metrics = {
+        "committed": committed,
+        "paid_in": paid_in,
+        "distributed": distributed,
+        "nav": nav,
+        "nav_date": nav_date,
+        "unfunded": max(committed - paid_in, 0.0),
+        **_ratios(paid_in, distributed, nav),
+        "irr": None,
+        "flows": len(flows),
+    }
+    return metrics, _net_series(flow_days, signed)
+
+
+def _entries(user_id: str, funds: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """fund_id -> cached {"metrics", "series"} for the given funds, computing the misses in one batch."""
+    base = fx.normalize(settings.base_currency)
+    fx_version = fx.version()
+    out: dict[str, dict[str, Any]] = {}
+    keys: dict[str, tuple] = {}
+    with _lock:
+        for f in funds:
+            keys[f["id"]] = (_versions.get(f["id"], 0), _epoch, fx_version)
+            hit = _cache.get(f["id"])
+            if hit is not None and hit[0] == keys[f["id"]]:
+                out[f["id"]] = hit[1]
+    missing = [f["id"] for f in funds if f["id"] not in out]
+    if not missing:
+        return out
+    wanted = set(missing)
+    flows: dict[str, list[dict[str, Any]]] = {fid: [] for fid in missing}
+    for row in csv_store.get_by_user("fund_cash_flows", user_id):
+        if row.get("fund_id") in wanted:
+            flows[row["fund_id"]].append(row)
+    commitments = [c for c in csv_store.get_by_user("commitments", user_id) if c.get("fund_id") in wanted]
+    committed_amounts = fx.convert(float_column(commitments, "amount"), [c.get("currency") or "" for c in commitments], base)
+    committed: dict[str, float] = {}
+    for c, amount in zip(commitments, committed_amounts):
+        committed[c["fund_id"]] = committed.get(c["fund_id"], 0.0) + float(amount)
+    built = [_fund_entry(flows[fid], committed.get(fid, 0.0), base) for fid in missing]
+    rates = irr(*_pad([series for _, series in built]))
+    with _lock:
+        for fid, (metrics, series), rate in zip(missing, built, rates):
+            metrics["irr"] = None if np.isnan(rate) else float(rate)
+            entry = {"metrics": metrics, "series": series}
+            out[fid] = entry
+            # Skip caching if the fund changed while this was computed.
+            if keys[fid] == (_versions.get(fid, 0), _epoch, fx_version):
+                _cache[fid] = (keys[fid], entry)
+    return out
+
+
+def fund_analytics(user_id: str, fund: dict[str, Any]) -> dict[str, Any]:
+    """IRR, multiples and paid-in/distributed/NAV for one fund, in the base currency."""
+    metrics = _entries(user_id, [fund])[fund["id"]]["metrics"]
+    return {
+        "fund_id": fund["id"],
+        "name": fund.get("name"),
+        "strategy": fund.get("strategy") or "",
+        "vintage_year": fund.get("vintage_year") or "",
+        "currency": fx.normalize(settings.base_currency),
+        **metrics,
+    }
+
+
+def rollup(user_id: str, group_by: str = "fund") -> dict[str, Any]:
+    """Analytics per fund, strategy or vintage and for the whole program; raises ValueError for bad ``group_by``."""
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    funds = csv_store.get_by_user("funds", user_id)
+    entries = _entries(user_id, funds)
+    field = {"fund": "id", "strategy": "strategy", "vintage": "vintage_year"}[group_by]
+    members: dict[str, list[str]] = {}
+    for f in funds:
+        members.setdefault(f.get(field) or "", []).append(f["id"])
+    labels = list(members)
+    groups = [members[label] for label in labels] + [[f["id"] for f in funds]]  # last: the whole program
+
+    pooled, totals = [], []
+    for ids in groups:
+        days = [entries[fid]["series"][0] for fid in ids]
+        amounts = [entries[fid]["series"][1] for fid in ids]
+        pooled.append(_net_series(np.concatenate(days or [np.zeros(0, dtype=np.int64)]),
+                                  np.concatenate(amounts or [np.zeros(0)])))
+        sums = {k: sum(entries[fid]["metrics"][k] for fid in ids) for k in ("committed", "paid_in", "distributed", "nav")}
+        totals.append(sums)
+    rates = irr(*_pad(pooled))
+
+    def summary(i: int) -> dict[str, Any]:
+        t = totals[i]
+        return {
+            "funds": len(groups[i]),
+            **t,
+            "unfunded": max(t["committed"] - t["paid_in"], 0.0),
+            **_ratios(t["paid_in"], t["distributed"], t["nav"]),
+            "irr": None if np.isnan(rates[i]) else float(rates[i]),
+        }
+
+    names = {f["id"]: f.get("name") for f in funds}
+    rows = []
+    for i, label in enumerate(labels):
+        row = {group_by if group_by != "fund" else "fund_id": label, **summary(i)}
+        if group_by == "fund":
+            row["name"] = names.get(label)
+        rows.append(row)
+    return {
+        "currency": fx.normalize(settings.base_currency),
+        "group_by": group_by,
+        "groups": rows,
+        "total": summary(len(labels)),
+    }
@@ -0,0 +1,279 @@
+"""Model-driven rebalancing for wealth client accounts."""
+import json
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import compliance, pool, securities
+from app.services.numeric import format_number
+from app.services.valuation import price_holdings
+
+OTHER = "other"
+DEFAULT_TOLERANCE_PCT = 1.0
+_EPS = 1e-9
+
+
+def parse_allocation(allocation_json: str) -> dict[str, float]:
+    """Sleeve key -> target weight as a fraction (``allocation_json`` holds percentages)."""
+    try:
+        raw = json.loads(allocation_json or "{}")
+    except json.JSONDecodeError:
+        raise ValueError("allocation_json must be valid JSON") from None
+    if not isinstance(raw, dict):
+        raise ValueError("allocation_json must be a JSON object")
+    weights: dict[str, float] = {}
+    for key, value in raw.items():
+        try:
+            weight = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Weight for {key!r} must be a number") from None
+        if weight < 0 or not np.isfinite(weight):
+            raise ValueError(f"Weight for {key!r} must be non-negative")
+        weights[str(key).strip()] = weight / 100.0
+    if sum(weights.values()) > 1.0 + 1e-6:
+        raise ValueError("Target weights add up to more than 100%")
+    return weights
+
+
+def plan(
+    qty: np.ndarray,
+    mv: np.ndarray,
+    price: np.ndarray,
+    sleeve_of: np.ndarray,
+    target: np.ndarray,
+    by_class: np.ndarray,
+    tradeable: np.ndarray,
+    tolerance: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trades for a block of accounts. ``qty``/``mv`` are (accounts x securities), ``price``
+    and ``sleeve_of`` (-1 = cash) are per security, ``target``/``by_class``/``tradeable``
+    per sleeve. Returns (signed share deltas, current sleeve weights, out-of-band mask).
+    """
+    n_s, n_k = len(sleeve_of), len(target)
+    member = np.zeros((n_s, n_k))
+    in_sleeve = sleeve_of >= 0
+    member[np.flatnonzero(in_sleeve), sleeve_of[in_sleeve]] = 1.0
+    nav = mv.sum(axis=1)
+    current = (mv @ member) / np.where(nav > _EPS, nav, np.inf)[:, None]
+    out = (np.abs(current - target) > tolerance + _EPS) & tradeable & (nav > _EPS)[:, None]
+
+    k = np.where(in_sleeve, sleeve_of, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(current > _EPS, target / current, np.nan)
+        desired = np.where(by_class[k], mv * scale[:, k], target[k] * nav[:, None])
+        delta = np.where(desired <= _EPS, -qty, np.fix(desired / price - qty))
+    move = out[:, k] & in_sleeve & ~np.isnan(desired) & (price > 0)
+    return np.where(move, delta, 0.0), current, out
+
+
+def _plan_parallel(*args: Any) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """``plan``, split by account rows across the process pool for large runs."""
+    qty, mv = args[0], args[1]
+    if len(qty) < settings.rebalance_parallel_min_accounts or pool.worker_count() < 2:
+        return plan(*args)
+    chunks = pool.split(len(qty), pool.worker_count())
+    futures = [pool.get_pool().submit(plan, qty[c], mv[c], *args[2:]) for c in chunks]
+    parts = [f.result() for f in futures]
+    return tuple(np.concatenate([p[i] for p in parts]) for i in range(3))  # type: ignore[return-value]
+
+
+def _run_model(
+    model: dict[str, Any],
+    accounts: list[dict[str, Any]],
+    rows_by_portfolio: dict[str, list[int]],
+    h_sec: np.ndarray,
+    h_cls: np.ndarray,
+    h_qty: np.ndarray,
+    h_px: np.ndarray,
+    known_classes: set[str],
+    tolerance: float,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Per-account drift reports and proposed orders for one model's accounts."""
+    weights = parse_allocation(model.get("allocation_json") or "{}")
+    keys = list(weights)
+    class_keys = {k for k in keys if k in known_classes}
+    symbol_keys = {price_store.normalize_symbol(k): i for i, k in enumerate(keys) if k not in class_keys}
+    class_labels = securities.asset_class_labels()
+
+    # Holdings rows of the model's accounts, with their account row.
+    row_lists = [rows_by_portfolio.get(a["portfolio_id"], []) for a in accounts]
+    rows = np.array([r for rl in row_lists for r in rl], dtype=np.int64)
+    acct = np.repeat(np.arange(len(accounts)), [len(rl) for rl in row_lists])
+
+    # Columns: held securities plus the model's symbols.
+    model_sec = securities.intern(list(symbol_keys))
+    cols, inverse = np.unique(np.concatenate([h_sec[rows], model_sec]), return_inverse=True)
+    col_of_row = inverse[:len(rows)]
+    n_a, n_s = len(accounts), len(cols)
+    flat = acct * n_s + col_of_row
+    qty = np.bincount(flat, weights=h_qty[rows], minlength=n_a * n_s).reshape(n_a, n_s)
+    mv = np.bincount(flat, weights=h_qty[rows] * h_px[rows], minlength=n_a * n_s).reshape(n_a, n_s)
+
+    symbol_labels = securities.symbol_labels()
+    col_symbols = [symbol_labels[s] for s in cols]
+    price = price_store.latest_prices(col_symbols)
+    fallback = np.full(n_s, np.nan)
+    fallback[col_of_row] = h_px[rows]
+    price = np.where(np.isnan(price), fallback, price)
+
+    # Sleeves: model keys in order, then "other" (target 0). Cash is outside every sleeve.
+    col_class = np.full(n_s, -1, dtype=np.int64)
+    col_class[col_of_row] = h_cls[rows]
+    key_index = {k: i for i, k in enumerate(keys)}
+    sleeve_of = np.empty(n_s, dtype=np.int64)
+    for j, (symbol, c) in enumerate(zip(col_symbols, col_class)):
+        label = class_labels[c] if c >= 0 else ""
+        if symbol in symbol_keys:
+            sleeve_of[j] = symbol_keys[symbol]
+        elif label in class_keys:
+            sleeve_of[j] = key_index[label]
+        elif label == compliance.CASH_CLASS:
+            sleeve_of[j] = -1
+        else:
+            sleeve_of[j] = len(keys)
+    target = np.array([weights[k] for k in keys] + [0.0])
+    by_class = np.array([k in class_keys for k in keys] + [True])
+    tradeable = np.array([k != compliance.CASH_CLASS for k in keys] + [True])
+
+    delta, current, out = _plan_parallel(qty, mv, price, sleeve_of, target, by_class, tradeable, tolerance)
+
+    nav = mv.sum(axis=1)
+    sleeve_keys = keys + [OTHER]
+    reports, proposed = [], []
+    for a, account in enumerate(accounts):
+        trades = np.flatnonzero(delta[a])
+        orders = [
+            {
+                "portfolio_id": account["portfolio_id"],
+                "symbol": col_symbols[j],
+                "side": "BUY" if delta[a, j] > 0 else "SELL",
+                "quantity": format_number(abs(float(delta[a, j]))),
+                "order_type": "MARKET",
+                "account_id": account["id"],
+            }
+            for j in trades
+        ]
+        proposed.extend(orders)
+        drift = current[a] - target
+        reports.append({
+            "account_id": account["id"],
+            "name": account.get("name") or "",
+            "model_id": model["id"],
+            "portfolio_id": account["portfolio_id"],
+            "nav": float(nav[a]),
+            "max_drift_pct": float(np.abs(drift).max() * 100),
+            "rebalance": bool(len(trades)),
+            "sleeves": [
+                {
+                    "key": sleeve_keys[k],
+                    "target_pct": float(target[k] * 100),
+                    "current_pct": float(current[a, k] * 100),
+                    "drift_pct": float(drift[k] * 100),
+                    "in_band": not bool(out[a, k]),
+                }
+                for k in range(len(sleeve_keys)) if k < len(keys) or current[a, k] > _EPS  # "other" when held
+            ],
+            "orders": orders,
+        })
+    return reports, proposed
+
+
+def assess(
+    user_id: str,
+    model_id: str | None = None,
+    account_ids: set[str] | None = None,
+    tolerance_pct: float = DEFAULT_TOLERANCE_PCT,
+    errors: list[dict[str, Any]] | None = None,
+    holdings: list[dict[str, Any]] | None = None,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    (account reports, proposed orders, skipped accounts) for the linked client accounts of
+    one model or all models, optionally only ``account_ids``. An invalid model allocation
+    raises ValueError, or is appended to ``errors`` (and its accounts left out) if given.
+    ``holdings`` may supply the linked portfolios' holdings rows instead of reading the table.
+    """
+    if tolerance_pct < 0:
+        raise ValueError("tolerance_pct must be non-negative")
+    models = csv_store.get_by_user("model_portfolios", user_id)
+    if model_id is not None:
+        models = [m for m in models if m.get("id") == model_id]
+    owned = {p["id"] for p in csv_store.get_by_user("portfolios", user_id)}
+    by_model: dict[str, list[dict[str, Any]]] = {m["id"]: [] for m in models}
+    skipped = []
+    for account in csv_store.get_by_user("client_accounts", user_id):
+        if account.get("model_id") not in by_model or (account_ids is not None and account["id"] not in account_ids):
+            continue
+        if account.get("portfolio_id") in owned:
+            by_model[account["model_id"]].append(account)
+        else:
+            skipped.append({"account_id": account["id"], "name": account.get("name") or "", "reason": "no linked portfolio"})
+
+    linked = {a["portfolio_id"] for accounts in by_model.values() for a in accounts}
+    if holdings is None:
+        holdings = csv_store.get_by_user("holdings", user_id)
+    holdings = [h for h in holdings if h.get("portfolio_id") in linked]
+    _, qty, _, px, _ = price_holdings(holdings)
+    h_sec, h_cls = securities.holding_classes(holdings)
+    rows_by_portfolio: dict[str, list[int]] = {}
+    for i, h in enumerate(holdings):
+        rows_by_portfolio.setdefault(h["portfolio_id"], []).append(i)
+    labels = securities.asset_class_labels()
+    known_classes = {labels[c] for c in h_cls} | {
+        r.get("asset_class") for r in securities.master().values() if r.get("asset_class")
+    }
+
+    reports, proposed = [], []
+    for model in models:
+        if not by_model[model["id"]]:
+            continue
+        try:
+            r, p = _run_model(
+                model, by_model[model["id"]], rows_by_portfolio, h_sec, h_cls, qty, px, known_classes, tolerance_pct / 100.0,
+            )
+        except ValueError as e:
+            if errors is None:
+                raise ValueError(f"Model {model.get('name') or model['id']}: {e}") from None
+            errors.append({"model_id": model["id"], "error": str(e)})
+            continue
+        reports.extend(r)
+        proposed.extend(p)
+    proposed.sort(key=lambda o: o["side"] != "SELL")  # sells first, so they fund the buys
+    return reports, proposed, skipped
+
+
+def rebalance(
+    user_id: str,
+    model_id: str | None = None,
+    tolerance_pct: float = DEFAULT_TOLERANCE_PCT,
+    dry_run: bool = True,
+) -> dict[str, Any]:
+    """
+    Measure every linked client account of one model (or all models) against its targets
+    and generate the minimal order set; unless ``dry_run``, submit it as one batch.
+    Across all models, a model with an invalid allocation is reported in ``errors`` and skipped.
+    """
+    errors: list[dict[str, Any]] | None = [] if model_id is None else None
+    reports, proposed, skipped = assess(user_id, model_id, tolerance_pct=tolerance_pct, errors=errors)
+    submitted = []
+    if proposed and not dry_run:
+        owned = [p["id"] for p in csv_store.get_by_user("portfolios", user_id)]
+        submitted = compliance.submit(user_id, proposed, owned)
+        for row, order in zip(submitted, proposed):
+            row["account_id"] = order["account_id"]
+    return {
+        "dry_run": dry_run,
+        "tolerance_pct": tolerance_pct,
+        "accounts": reports,
+        "skipped": skipped,
+        "errors": errors or [],
+        "orders": submitted if not dry_run else proposed,
+        "summary": {
+            "models": len({r["model_id"] for r in reports}),
+            "accounts": len(reports),
+            "rebalanced": sum(1 for r in reports if r["rebalance"]),
+            "orders": len(proposed),
+        },
+    }
@@ -0,0 +1,156 @@
+"""Three-way reconciliation of positions, fills and cash."""
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import Any
+
+from app.db import csv_store, price_store
+from app.services import orders, positions
+from app.services.numeric import format_number, to_float
+
+QUANTITY_MISMATCH = "quantity_mismatch"
+MISSING_HOLDING = "missing_holding"
+MISSING_CASH_LEG = "missing_cash_leg"
+CASH_AMOUNT_MISMATCH = "cash_amount_mismatch"
+ORPHAN_CASH_LEG = "orphan_cash_leg"
+BREAK_TYPES = (QUANTITY_MISMATCH, MISSING_HOLDING, MISSING_CASH_LEG, CASH_AMOUNT_MISMATCH, ORPHAN_CASH_LEG)
+
+DEFAULT_QUANTITY_TOLERANCE = 1e-6
+DEFAULT_CASH_TOLERANCE = 0.01
+
+
+def _filled(order: dict[str, Any]) -> float:
+    # Orders recorded before fill tracking carry FILLED with a blank filled quantity.
+    if not order.get("filled_quantity") and order.get("status") == "FILLED":
+        return to_float(order.get("quantity"))
+    return to_float(order.get("filled_quantity"))
+
+
+def _break(run_id: str, user_id: str, at: str, break_type: str, portfolio_id: str = "", symbol: str = "",
+           order_id: str = "", expected: float | None = None, actual: float | None = None) -> dict[str, Any]:
+    known = expected is not None and actual is not None
+    return {
+        "id": csv_store.generate_id(),
+        "user_id": user_id,
+        "run_id": run_id,
+        "break_type": break_type,
+        "portfolio_id": portfolio_id,
+        "symbol": symbol,
+        "order_id": order_id,
+        "expected": "" if expected is None else format_number(expected),
+        "actual": "" if actual is None else format_number(actual),
+        "difference": format_number(actual - expected) if known else "",
+        "detected_at": at,
+    }
+
+
+def run(
+    user_id: str,
+    quantity_tolerance: float = DEFAULT_QUANTITY_TOLERANCE,
+    cash_tolerance: float = DEFAULT_CASH_TOLERANCE,
+    progress: Callable[[float], None] | None = None,
+) -> dict[str, Any]:
+    """Reconcile the user's holdings, fills and cash; store and summarise the breaks."""
+    if quantity_tolerance < 0 or cash_tolerance < 0:
+        raise ValueError("Tolerances must be non-negative")
+    run_id = csv_store.generate_id()
+    at = datetime.now(timezone.utc).isoformat()
+
+    # Build side: filled orders.
+    fills: dict[str, tuple[str, str, float, float | None]] = {}  # order_id -> (pid, symbol, qty, notional)
+    net: dict[tuple[str, str], float] = {}
+    user_orders: set[str] = set()
+    for order in orders.list_orders(user_id):
+        user_orders.add(order["id"])
+        qty = _filled(order)
+        if qty <= 0:
+            continue
+        key = (order.get("portfolio_id") or "", price_store.normalize_symbol(order.get("symbol") or ""))
+        price = to_float(order.get("avg_fill_price"))
+        fills[order["id"]] = (*key, qty, qty * price if price > 0 else None)
+        net[key] = net.get(key, 0.0) + (qty if (order.get("side") or "").upper() == "BUY" else -qty)
+    # Expected position: opening (pre-fill) quantity plus net fills.
+    expected_qty = dict(net)
+    for key, (opening, _, _) in positions.opening_positions({pid for pid, _ in net}).items():
+        if key in expected_qty:
+            expected_qty[key] += opening
+    if progress:
+        progress(1 / 3)
+
+    # Probe side 1: holdings, streamed.
+    held: dict[tuple[str, str], float] = {}
+    holdings_scanned = 0
+    for uid, pid, symbol, quantity in csv_store.iter_rows("holdings", ["user_id", "portfolio_id", "symbol", "quantity"]):
+        if uid != user_id:
+            continue
+        holdings_scanned += 1
+        key = (pid, price_store.normalize_symbol(symbol))
+        if key in expected_qty:
+            held[key] = held.get(key, 0.0) + to_float(quantity)
+    if progress:
+        progress(2 / 3)
+
+    # Probe side 2: cash legs, streamed.
+    cash: dict[str, float] = {}
+    orphans: list[tuple[str, float]] = []
+    transactions_scanned = 0
+    for uid, order_id, amount in csv_store.iter_rows("transactions", ["user_id", "order_id", "amount"]):
+        if uid != user_id:
+            continue
+        transactions_scanned += 1
+        if not order_id:
+            continue
+        if order_id in user_orders:
+            cash[order_id] = cash.get(order_id, 0.0) + to_float(amount)
+        else:
+            orphans.append((order_id, to_float(amount)))
+
+    # Only portfolios linked to a cash account settle their fills in cash.
+    settled = {a.get("portfolio_id") for a in csv_store.get_by_user("accounts", user_id) if a.get("portfolio_id")}
+
+    breaks: list[dict[str, Any]] = []
+    for (pid, symbol), expected in expected_qty.items():
+        if (pid, symbol) not in held:
+            if abs(expected) > quantity_tolerance:
+                breaks.append(_break(run_id, user_id, at, MISSING_HOLDING, pid, symbol, expected=expected, actual=0.0))
+        elif abs(held[(pid, symbol)] - expected) > quantity_tolerance:
+            breaks.append(_break(run_id, user_id, at, QUANTITY_MISMATCH, pid, symbol,
+                                 expected=expected, actual=held[(pid, symbol)]))
+    for order_id, (pid, symbol, _, notional) in fills.items():
+        if order_id not in cash:
+            if pid not in settled:
+                continue
+            breaks.append(_break(run_id, user_id, at, MISSING_CASH_LEG, pid, symbol, order_id, expected=notional))
+        elif notional is not None and abs(abs(cash[order_id]) - notional) > cash_tolerance:
+            breaks.append(_break(run_id, user_id, at, CASH_AMOUNT_MISMATCH, pid, symbol, order_id,
+                                 expected=notional, actual=abs(cash[order_id])))
+    for order_id, amount in orphans:
+        breaks.append(_break(run_id, user_id, at, ORPHAN_CASH_LEG, order_id=order_id, actual=amount))
+
+    stale = {r["id"] for r in csv_store.get_by_user("reconciliation_breaks", user_id)}
+    if stale:
+        csv_store.delete_rows("reconciliation_breaks", "id", stale)
+    csv_store.append_rows("reconciliation_breaks", breaks)
+    if progress:
+        progress(1.0)
+    counts = {t: 0 for t in BREAK_TYPES}
+    for b in breaks:
+        counts[b["break_type"]] += 1
+    return {
+        "run_id": run_id,
+        "run_at": at,
+        "orders": len(user_orders),
+        "filled_orders": len(fills),
+        "holdings": holdings_scanned,
+        "transactions": transactions_scanned,
+        "breaks": len(breaks),
+        "by_type": counts,
+    }
+
+
+def list_breaks(user_id: str, break_type: str | None = None, portfolio_id: str | None = None) -> list[dict[str, Any]]:
+    """The user's breaks from the latest run, optionally filtered."""
+    return [
+        r for r in csv_store.get_by_user("reconciliation_breaks", user_id)
+        if (break_type is None or r.get("break_type") == break_type)
+        and (portfolio_id is None or r.get("portfolio_id") == portfolio_id)
+    ]
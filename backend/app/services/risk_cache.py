@@ -0,0 +1,107 @@
+"""Cache of computed risk metrics."""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import securities, versions
+
+Metrics = list[tuple[str, str]]  # (metric, value) as written to risk_results
+Stamp = tuple
+
+_lock = threading.Lock()
+_entries: "OrderedDict[tuple[str, str], tuple[Stamp, Metrics]]" = OrderedDict()
+_by_portfolio: dict[str, set[tuple[str, str]]] = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def params_key(scenario: dict[str, Any], symbols: Iterable[str] = ()) -> str:
+    """
+    Stable hash of a scenario's type and parameters (JSON key order and spacing ignored)
+    and of the symbol universe the batch runs over: covariances and simulated paths depend on every symbol.
+    """
+    raw = scenario.get("params_json") or "{}"
+    try:
+        raw = json.dumps(json.loads(raw), sort_keys=True, separators=(",", ":"))
+    except json.JSONDecodeError:
+        pass
+    universe = ",".join(sorted(set(symbols)))
+    text = f"{(scenario.get('scenario_type') or '').lower()}\0{raw}\0{universe}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stamp(portfolio_id: str) -> Stamp:
+    """Current state an entry for ``portfolio_id`` must have been computed against."""
+    return (
+        versions.holdings_version(portfolio_id),
+        price_store.as_of_date(),
+        price_store.version(),
+        securities.version(),  # asset classes feed the stress model
+    )
+
+
+def get(key: str, portfolio_id: str, current: Stamp) -> Metrics | None:
+    with _lock:
+        entry = _entries.get((key, portfolio_id))
+        if entry is None or entry[0] != current:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end((key, portfolio_id))
+        _stats["hits"] += 1
+        return entry[1]
+
+
+def put(key: str, portfolio_id: str, computed_at: Stamp, metrics: Metrics) -> None:
+    """Store metrics computed against ``computed_at`` (taken before the computation started)."""
+    with _lock:
+        if computed_at != stamp(portfolio_id):
+            return  # holdings or prices moved while computing
+        _entries[(key, portfolio_id)] = (computed_at, metrics)
+        _entries.move_to_end((key, portfolio_id))
+        _by_portfolio.setdefault(portfolio_id, set()).add((key, portfolio_id))
+        while len(_entries) > settings.risk_cache_size:
+            entry_key, _ = _entries.popitem(last=False)
+            _by_portfolio.get(entry_key[1], set()).discard(entry_key)
+            _stats["evictions"] += 1
+
+
+def _evict_portfolio(portfolio_id: str) -> None:
+    for entry_key in _by_portfolio.pop(portfolio_id, ()):
+        if _entries.pop(entry_key, None) is not None:
+            _stats["evictions"] += 1
+
+
+def stats() -> dict[str, Any]:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "entries": len(_entries),
+            "portfolios": len(_by_portfolio),
+            **_stats,
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        _by_portfolio.clear()
+
+
+def _on_holdings_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    with _lock:
+        if op == "reset":
+            _stats["evictions"] += len(_entries)
+            _entries.clear()
+            _by_portfolio.clear()
+            return
+        for row in (old, new):
+            if row is not None:
+                _evict_portfolio(row.get("portfolio_id") or "")
+
+
+csv_store.add_mutation_hook("holdings", _on_holdings_change)
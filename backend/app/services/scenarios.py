@@ -0,0 +1,210 @@
+"""Stress scenario execution."""
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import monte_carlo, risk_cache, securities, var
+from app.services.numeric import to_float
+from app.services.valuation import price_holdings
+
+FACTORS = ("rates", "equity", "credit", "fx")
+
+# Asset-class return per unit factor shock (rates/credit in decimal yield change,
+# equity/fx in decimal return): rates/credit loadings are minus (spread) duration.
+ASSET_CLASS_LOADINGS: dict[str, tuple[float, float, float, float]] = {
+    "equity": (-2.0, 1.0, -1.0, 0.3),
+    "fixed_income": (-6.0, 0.05, -4.0, 0.1),
+    "cash": (0.0, 0.0, 0.0, 0.0),
+    "real_estate": (-4.0, 0.6, -1.5, 0.2),
+    "commodity": (0.0, 0.3, 0.0, -0.4),
+    "private_equity": (-1.0, 1.2, -1.5, 0.2),
+    "alternatives": (-1.0, 0.5, -1.0, 0.1),
+}
+DEFAULT_LOADINGS = ASSET_CLASS_LOADINGS["equity"]
+
+RECESSION_SHOCKS = {"rates": -0.015, "equity": -0.30, "credit": 0.03, "fx": 0.0}
+
+# Param name -> (factor, scale from param units to the factor's decimal units)
+_FACTOR_PARAMS = {
+    "rate_change_bps": ("rates", 1e-4),
+    "drawdown_pct": ("equity", -1e-2),
+    "equity_shock_pct": ("equity", 1e-2),
+    "credit_spread_bps": ("credit", 1e-4),
+    "fx_shock_pct": ("fx", 1e-2),
+}
+
+STRESS_METRICS = ("Stress_PnL", "Stress_Return")
+
+# scenario_type -> engine(user_id, scenario, portfolio_ids, holdings) -> risk_results rows
+ENGINES = {
+    "var": var.var_results,
+    "historical_var": var.var_results,
+    "monte_carlo": monte_carlo.mc_results,
+    "monte_carlo_var": monte_carlo.mc_results,
+}
+
+
+def loadings_for(asset_classes: list[str]) -> np.ndarray:
+    """Factor loadings matrix (asset classes x factors)."""
+    rows = [ASSET_CLASS_LOADINGS.get(a, DEFAULT_LOADINGS) for a in asset_classes]
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(FACTORS))
+
+
+def parse_params(params_json: str) -> tuple[np.ndarray, dict[str, float], list[str]]:
+    """Return (factor shock vector, asset-class return overrides, ignored param names)."""
+    try:
+        params = json.loads(params_json or "{}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"params_json is not valid JSON: {e}") from e
+    if not isinstance(params, dict):
+        raise ValueError("params_json must be a JSON object")
+    shocks = np.zeros(len(FACTORS))
+    overrides: dict[str, float] = {}
+    ignored = []
+    for name, value in params.items():
+        if name in _FACTOR_PARAMS:
+            factor, scale = _FACTOR_PARAMS[name]
+            shocks[FACTORS.index(factor)] += to_float(value) * scale
+        elif name == "recession":
+            if value:
+                shocks += np.array([RECESSION_SHOCKS[f] for f in FACTORS])
+        elif name == "shocks" and isinstance(value, dict):
+            overrides.update({str(k): to_float(v) / 100.0 for k, v in value.items()})
+        else:
+            ignored.append(name)
+    return shocks, overrides, ignored
+
+
+def exposure_matrix(
+    holdings: list[dict[str, Any]],
+    portfolio_ids: list[str],
+) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """(asset classes, market value matrix portfolios x asset classes, portfolio totals)."""
+    _, qty, _, px, _ = price_holdings(holdings)
+    mv = qty * px
+    index = {pid: i for i, pid in enumerate(portfolio_ids)}
+    _, class_ids = securities.holding_classes(holdings)
+    used, cols = np.unique(class_ids, return_inverse=True)
+    labels = securities.asset_class_labels()
+    asset_classes = [labels[c] for c in used]
+    rows = np.array([index.get(h.get("portfolio_id"), -1) for h in holdings], dtype=np.int64)
+    keep = rows >= 0
+    exposures = np.zeros((len(portfolio_ids), len(asset_classes)))
+    np.add.at(exposures, (rows[keep], cols[keep]), mv[keep])
+    return asset_classes, exposures, exposures.sum(axis=1)
+
+
+def stress_results(
+    user_id: str,
+    scenarios: list[dict[str, Any]],
+    portfolio_ids: list[str],
+    holdings: list[dict[str, Any]],
+) -> tuple[list[dict[str, Any]], dict[str, list[str]]]:
+    """
+    Evaluate stress scenarios against portfolios in one pass.
+    Returns (risk_results rows, scenario_id -> ignored param names).
+    """
+    asset_classes, exposures, totals = exposure_matrix(holdings, portfolio_ids)
+    parsed = [parse_params(s.get("params_json") or "{}") for s in scenarios]
+    factor_shocks = np.array([p[0] for p in parsed]).reshape(len(scenarios), len(FACTORS))
+    returns = factor_shocks @ loadings_for(asset_classes).T  # scenarios x asset classes
+    for i, (_, overrides, _) in enumerate(parsed):
+        for j, a in enumerate(asset_classes):
+            if a in overrides:
+                returns[i, j] = overrides[a]
+    pnl = exposures @ returns.T  # portfolios x scenarios
+    pct = np.divide(pnl * 100.0, totals[:, None], out=np.zeros_like(pnl), where=totals[:, None] != 0)
+
+    rows = []
+    for s_i, scenario in enumerate(scenarios):
+        for p_i, pid in enumerate(portfolio_ids):
+            for metric, value in (("Stress_PnL", f"{pnl[p_i, s_i]:.2f}"), ("Stress_Return", f"{pct[p_i, s_i]:.2f}%")):
+                rows.append({
+                    "user_id": user_id,
+                    "scenario_id": scenario["id"],
+                    "portfolio_id": pid,
+                    "metric": metric,
+                    "value": value,
+                })
+    return rows, {s["id"]: p[2] for s, p in zip(scenarios, parsed)}
+
+
+def _compute(
+    user_id: str,
+    scenarios: list[dict[str, Any]],
+    missing: dict[str, list[str]],
+    holdings: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    """Rows for the (scenario, portfolio) pairs in ``missing`` (scenario_id -> portfolio ids)."""
+    engines = [ENGINES.get((s.get("scenario_type") or "").lower()) for s in scenarios]
+    stress = [s for s, engine in zip(scenarios, engines) if engine is None]
+    stress_pids = sorted({pid for s in stress for pid in missing[s["id"]]})
+    rows, _ = stress_results(user_id, stress, stress_pids, holdings)
+    wanted = {(s["id"], pid) for s in stress for pid in missing[s["id"]]}
+    rows = [r for r in rows if (r["scenario_id"], r["portfolio_id"]) in wanted]
+    for s, engine in zip(scenarios, engines):
+        if engine is not None:
+            rows.extend(engine(user_id, s, missing[s["id"]], holdings))
+    return rows
+
+
+def run_scenarios(
+    user_id: str,
+    scenarios: list[dict[str, Any]],
+    portfolio_ids: list[str],
+) -> dict[str, Any]:
+    """
+    Run scenarios against the user's portfolios and upsert results in one write.
+    (scenario params, portfolio) pairs already computed against the current holdings
+    and prices come from the risk cache; if nothing changed, nothing is written.
+    """
+    stamps = {pid: risk_cache.stamp(pid) for pid in portfolio_ids}
+    # VaR engines run over the symbols of all requested portfolios, so their key includes that universe;
+    # stress results depend on each portfolio's own holdings only.
+    requested = set(portfolio_ids)
+    holdings = [h for h in csv_store.get_by_user("holdings", user_id) if h.get("portfolio_id") in requested]
+    universe = {price_store.normalize_symbol(h.get("symbol") or "") for h in holdings}
+    keys = {
+        s["id"]: risk_cache.params_key(s, universe if (s.get("scenario_type") or "").lower() in ENGINES else ())
+        for s in scenarios
+    }
+    rows: list[dict[str, Any]] = []
+    missing: dict[str, list[str]] = {}
+    for s in scenarios:
+        for pid in portfolio_ids:
+            metrics = risk_cache.get(keys[s["id"]], pid, stamps[pid])
+            if metrics is None:
+                missing.setdefault(s["id"], []).append(pid)
+                continue
+            rows.extend(
+                {"user_id": user_id, "scenario_id": s["id"], "portfolio_id": pid, "metric": m, "value": v}
+                for m, v in metrics
+            )
+    hits = len(scenarios) * len(portfolio_ids) - sum(len(p) for p in missing.values())
+
+    if missing:
+        computed = _compute(user_id, [s for s in scenarios if s["id"] in missing], missing, holdings)
+        by_pair: dict[tuple[str, str], list[tuple[str, str]]] = {}
+        for r in computed:
+            by_pair.setdefault((r["scenario_id"], r["portfolio_id"]), []).append((r["metric"], r["value"]))
+        for (sid, pid), metrics in by_pair.items():
+            risk_cache.put(keys[sid], pid, stamps[pid], metrics)
+        rows.extend(computed)
+
+    ignored = {
+        s["id"]: parse_params(s.get("params_json") or "{}")[2]
+        for s in scenarios
+        if (s.get("scenario_type") or "").lower() not in ENGINES
+    }
+    stored = csv_store.upsert_rows("risk_results", ["user_id", "scenario_id", "portfolio_id", "metric"], rows)
+    return {
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "scenarios": len(scenarios),
+        "portfolios": len(portfolio_ids),
+        "cache": {"hits": hits, "misses": len(scenarios) * len(portfolio_ids) - hits},
+        "ignored_params": {k: v for k, v in ignored.items() if v},
+        "results": stored,
+    }
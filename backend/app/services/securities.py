@@ -0,0 +1,133 @@
+"""Security master and symbol interning."""
+import threading
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+
+FIELDS = ["symbol", "name", "asset_class", "currency", "sector", "isin", "cusip"]
+UNCLASSIFIED = "unclassified"
+
+_lock = threading.RLock()
+_symbol_ids: dict[str, int] = {}
+_symbols: list[str] = []
+_class_ids: dict[str, int] = {}
+_classes: list[str] = []
+_master: tuple[int, dict[str, dict[str, Any]]] | None = None
+# Asset class id per security id from the master (-1 = not listed), keyed on
+# (table version, interned symbol count) so new ids extend it.
+_class_of: tuple[tuple[int, int], np.ndarray] | None = None
+
+
+def _intern(ids: dict[str, int], labels: list[str], label: str) -> int:
+    i = ids.get(label)
+    if i is None:
+        i = ids[label] = len(labels)
+        labels.append(label)
+    return i
+
+
+def intern(symbols: list[str]) -> np.ndarray:
+    """Integer security ids for ``symbols`` (normalized; new symbols get new ids)."""
+    with _lock:
+        return np.array(
+            [_intern(_symbol_ids, _symbols, price_store.normalize_symbol(s or "")) for s in symbols],
+            dtype=np.int64,
+        )
+
+
+def symbol_labels() -> list[str]:
+    """Symbol of every interned security id (index = id)."""
+    with _lock:
+        return list(_symbols)
+
+
+def asset_class_labels() -> list[str]:
+    """Label of every interned asset class id (index = id)."""
+    with _lock:
+        return list(_classes)
+
+
+def version() -> int:
+    return csv_store.table_version("securities")
+
+
+def master() -> dict[str, dict[str, Any]]:
+    """symbol -> security master row (cached per table version)."""
+    global _master
+    current = version()
+    with _lock:
+        if _master is not None and _master[0] == current:
+            return _master[1]
+    table = {price_store.normalize_symbol(r.get("symbol") or ""): r for r in csv_store.read_table("securities")}
+    with _lock:
+        _master = (current, table)
+    return table
+
+
+def lookup(symbol: str) -> dict[str, Any] | None:
+    row = master().get(price_store.normalize_symbol(symbol or ""))
+    if row is None:
+        return None
+    return {**row, "security_id": int(intern([row["symbol"]])[0])}
+
+
+def _master_classes() -> np.ndarray:
+    global _class_of
+    table = master()
+    with _lock:
+        key = (version(), len(_symbols))
+        if _class_of is not None and _class_of[0] == key:
+            return _class_of[1]
+        for symbol in table:
+            _intern(_symbol_ids, _symbols, symbol)
+        codes = np.full(len(_symbols), -1, dtype=np.int64)
+        for symbol, row in table.items():
+            if row.get("asset_class"):
+                codes[_symbol_ids[symbol]] = _intern(_class_ids, _classes, row["asset_class"])
+        _class_of = ((key[0], len(_symbols)), codes)
+        return codes
+
+
+def classify(symbols: list[str], fallbacks: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (security ids, asset class ids) for parallel lists of symbols and per-row
+    asset classes. The master's class wins; ``fallbacks`` cover unlisted symbols.
+    """
+    ids = intern(symbols)
+    out = _master_classes()[ids]  # built after interning, so it covers every id
+    missing = np.flatnonzero(out < 0)
+    if len(missing):
+        with _lock:
+            out[missing] = [_intern(_class_ids, _classes, fallbacks[i] or UNCLASSIFIED) for i in missing]
+    return ids, out
+
+
+def holding_classes(rows: list[dict[str, Any]]) -> tuple[np.ndarray, np.ndarray]:
+    """``classify`` for holdings or orders rows."""
+    return classify([r.get("symbol") or "" for r in rows], [r.get("asset_class") or "" for r in rows])
+
+
+def asset_classes(rows: list[dict[str, Any]]) -> list[str]:
+    """Resolved asset class label per row."""
+    _, codes = holding_classes(rows)
+    labels = asset_class_labels()
+    return [labels[c] for c in codes]
+
+
+def upsert_securities(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Insert or replace master rows by symbol."""
+    cleaned = []
+    for r in rows:
+        symbol = price_store.normalize_symbol(r.get("symbol") or "")
+        if not symbol or not (r.get("asset_class") or "").strip():
+            raise ValueError("Each security needs a symbol and an asset_class")
+        cleaned.append({
+            **{k: str(r.get(k) or "").strip() for k in FIELDS},
+            "symbol": symbol,
+            "currency": str(r.get("currency") or "").strip().upper(),
+        })
+    stored = csv_store.upsert_rows("securities", ["symbol"], cleaned)
+    intern([r["symbol"] for r in stored])
+    return stored
@@ -0,0 +1,263 @@
+"""Tax lots per (portfolio, symbol), maintained from the position event stream."""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import date
+from typing import Any
+
+from app.db import csv_store
+from app.services.numeric import to_float
+from app.services.positions import Opening, opening_positions, upper_bound
+
+METHODS = ("FIFO", "LIFO", "HIFO")
+DEFAULT_METHOD = "FIFO"
+PREFERENCE_KEY = "lot_relief_method"
+LONG_TERM_DAYS = 365
+
+
+class Lot:
+    __slots__ = ("lot_id", "seq", "opened_at", "quantity", "remaining", "cost")
+
+    def __init__(self, lot_id: str, seq: int, opened_at: str, quantity: float, cost: float) -> None:
+        self.lot_id = lot_id
+        self.seq = seq
+        self.opened_at = opened_at
+        self.quantity = quantity
+        self.remaining = quantity
+        self.cost = cost
+
+
+class LotBook:
+    """Open lots of one symbol in one portfolio. ``side`` is +1 for long lots, -1 for short."""
+
+    __slots__ = ("side", "lots", "heap", "open_quantity")
+
+    def __init__(self) -> None:
+        self.side = 1
+        self.lots: deque[Lot] = deque()
+        self.heap: list[tuple[float, int, Lot]] = []
+        self.open_quantity = 0.0
+
+    def open(self, lot: Lot, side: int) -> None:
+        self.side = side
+        self.lots.append(lot)
+        # Highest cost first for longs; for shorts the lowest sale price is the costliest to cover
+        heapq.heappush(self.heap, (-lot.cost * side, lot.seq, lot))
+        self.open_quantity += lot.remaining
+
+    def _next(self, method: str) -> Lot | None:
+        if method == "HIFO":
+            while self.heap and self.heap[0][2].remaining <= 0:
+                heapq.heappop(self.heap)
+            return self.heap[0][2] if self.heap else None
+        pop, peek = (self.lots.pop, -1) if method == "LIFO" else (self.lots.popleft, 0)
+        while self.lots and self.lots[peek].remaining <= 0:
+            pop()
+        return self.lots[peek] if self.lots else None
+
+    def relieve(self, quantity: float, method: str) -> list[tuple[Lot, float]]:
+        """Take up to ``quantity`` from open lots. Returns (lot, quantity taken) pairs."""
+        taken = []
+        while quantity > 1e-12:
+            lot = self._next(method)
+            if lot is None:
+                break
+            q = min(quantity, lot.remaining)
+            lot.remaining -= q
+            self.open_quantity -= q
+            quantity -= q
+            taken.append((lot, q))
+        if self.open_quantity <= 1e-12:
+            self.lots.clear()
+            self.heap.clear()
+            self.open_quantity = 0.0
+        return taken
+
+    def open_lots(self) -> list[Lot]:
+        return [lot for lot in self.lots if lot.remaining > 0]
+
+
+class _RealizedIndex:
+    """Realizations sorted by close time with running sums of gain (total and long-term)."""
+
+    __slots__ = ("times", "records", "cum_gain", "cum_long")
+
+    def __init__(self) -> None:
+        self.times: list[str] = []
+        self.records: list[dict[str, Any]] = []
+        self.cum_gain: list[float] = [0.0]
+        self.cum_long: list[float] = [0.0]
+
+    def add(self, record: dict[str, Any]) -> None:
+        # Events are replayed in time order, so realizations only ever append.
+        self.times.append(record["closed_at"])
+        self.records.append(record)
+        self.cum_gain.append(self.cum_gain[-1] + record["gain"])
+        self.cum_long.append(self.cum_long[-1] + (record["gain"] if record["term"] == "long" else 0.0))
+
+    def window(self, start: str | None, end: str | None) -> tuple[int, int]:
+        lo = bisect_left(self.times, start) if start else 0
+        hi = bisect_right(self.times, upper_bound(end)) if end else len(self.times)
+        return lo, max(lo, hi)
+
+    def totals(self, start: str | None, end: str | None) -> dict[str, Any]:
+        lo, hi = self.window(start, end)
+        total = self.cum_gain[hi] - self.cum_gain[lo]
+        long_term = self.cum_long[hi] - self.cum_long[lo]
+        return {"realized_gain": total, "long_term": long_term, "short_term": total - long_term, "count": hi - lo}
+
+
+def _days_between(opened_at: str, closed_at: str) -> int:
+    try:
+        return (date.fromisoformat(closed_at[:10]) - date.fromisoformat(opened_at[:10])).days
+    except ValueError:
+        return 0
+
+
+class _PortfolioLots:
+    __slots__ = ("books", "realized", "realized_by_symbol", "last_time", "seq")
+
+    def __init__(self) -> None:
+        self.books: dict[str, LotBook] = {}
+        self.realized = _RealizedIndex()
+        self.realized_by_symbol: dict[str, _RealizedIndex] = {}
+        self.last_time = ""
+        self.seq = 0
+
+    def seed(self, symbol: str, opening: Opening) -> None:
+        """Open one lot for a position held before the symbol's first fill."""
+        quantity, cost, opened_at = opening
+        self.seq += 1
+        self.books.setdefault(symbol, LotBook()).open(
+            Lot(f"opening-{symbol}", self.seq, opened_at, abs(quantity), cost), 1 if quantity > 0 else -1
+        )
+
+    def apply(self, event: dict[str, Any]) -> None:
+        symbol = event.get("symbol") or ""
+        side = 1 if (event.get("side") or "").upper() == "BUY" else -1
+        quantity = to_float(event.get("quantity"))
+        price = to_float(event.get("price"))
+        ts = event.get("executed_at") or ""
+        method = (event.get("lot_method") or DEFAULT_METHOD).upper()
+        book = self.books.setdefault(symbol, LotBook())
+        self.last_time = max(self.last_time, ts)
+        if book.open_quantity > 0 and book.side != side:
+            for lot, q in book.relieve(quantity, method if method in METHODS else DEFAULT_METHOD):
+                gain = (price - lot.cost) * q * book.side
+                days = _days_between(lot.opened_at, ts)
+                record = {
+                    "symbol": symbol,
+                    "lot_id": lot.lot_id,
+                    "order_id": event.get("order_id") or "",
+                    "quantity": q,
+                    "cost": lot.cost,
+                    "price": price,
+                    "gain": gain,
+                    "opened_at": lot.opened_at,
+                    "closed_at": ts,
+                    "holding_days": days,
+                    "term": "long" if days > LONG_TERM_DAYS else "short",
+                }
+                self.realized.add(record)
+                self.realized_by_symbol.setdefault(symbol, _RealizedIndex()).add(record)
+                quantity -= q
+        if quantity > 1e-12:
+            self.seq += 1
+            book.open(Lot(f"{event.get('id')}", self.seq, ts, quantity, price), side)
+
+
+_lock = threading.RLock()
+_portfolios: dict[str, _PortfolioLots] | None = None
+
+
+def _replay(events: list[dict[str, Any]]) -> dict[str, _PortfolioLots]:
+    """Lots per portfolio: opening positions first, then the events in time order."""
+    books: dict[str, _PortfolioLots] = {}
+    for (pid, symbol), opening in opening_positions({e.get("portfolio_id") or "" for e in events}).items():
+        books.setdefault(pid, _PortfolioLots()).seed(symbol, opening)
+    for e in sorted(events, key=lambda e: e.get("executed_at") or ""):
+        books.setdefault(e.get("portfolio_id") or "", _PortfolioLots()).apply(e)
+    return books
+
+
+def _ensure_loaded() -> dict[str, _PortfolioLots]:
+    global _portfolios
+    if _portfolios is None:
+        _portfolios = _replay(csv_store.read_table("position_events"))
+    return _portfolios
+
+
+def _on_events_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _portfolios
+    with _lock:
+        if _portfolios is None:
+            return
+        if op != "insert" or new is None:
+            _portfolios = None
+            return
+        pid = new.get("portfolio_id") or ""
+        state = _portfolios.setdefault(pid, _PortfolioLots())
+        if (new.get("executed_at") or "") < state.last_time:
+            # Back-dated fill: lot relief order changed, replay this portfolio from its events.
+            events = [e for e in csv_store.read_table("position_events") if e.get("portfolio_id") == pid]
+            _portfolios[pid] = _replay(events).get(pid) or _PortfolioLots()
+        else:
+            symbol = new.get("symbol") or ""
+            if symbol not in state.books:
+                # First fill of this symbol: positions recorded any hand-entered holding just before it.
+                opening = opening_positions([pid]).get((pid, symbol))
+                if opening is not None:
+                    state.seed(symbol, opening)
+            state.apply(new)
+
+
+csv_store.add_mutation_hook("position_events", _on_events_change)
+
+
+def preferred_method(user_id: str) -> str:
+    """The user's lot relief method preference (design principles preferences), default FIFO."""
+    for table in ("design_principles_preferences", "user_preferences"):
+        for r in csv_store.get_by_user(table, user_id):
+            if r.get("key") == PREFERENCE_KEY and (r.get("value") or "").upper() in METHODS:
+                return r["value"].upper()
+    return DEFAULT_METHOD
+
+
+def open_lots(portfolio_id: str, symbol: str | None = None) -> list[dict[str, Any]]:
+    with _lock:
+        state = _ensure_loaded().get(portfolio_id) or _PortfolioLots()
+        symbols = [symbol] if symbol else sorted(state.books)
+        return [
+            {
+                "lot_id": lot.lot_id,
+                "symbol": s,
+                "side": "LONG" if state.books[s].side > 0 else "SHORT",
+                "opened_at": lot.opened_at,
+                "quantity": lot.quantity,
+                "remaining": lot.remaining,
+                "cost": lot.cost,
+            }
+            for s in symbols
+            if s in state.books
+            for lot in state.books[s].open_lots()
+        ]
+
+
+def realized_gains(
+    portfolio_id: str,
+    start: str | None = None,
+    end: str | None = None,
+    include_records: bool = False,
+) -> dict[str, Any]:
+    """Realized gain totals (and per-symbol totals) for closes in [start, end]."""
+    with _lock:
+        state = _ensure_loaded().get(portfolio_id) or _PortfolioLots()
+        result = state.realized.totals(start, end)
+        result["by_symbol"] = {
+            s: idx.totals(start, end) for s, idx in sorted(state.realized_by_symbol.items())
+        }
+        if include_records:
+            lo, hi = state.realized.window(start, end)
+            result["records"] = list(state.realized.records[lo:hi])
+    return {"portfolio_id": portfolio_id, "start": start, "end": end, **result}
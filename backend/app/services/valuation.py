@@ -0,0 +1,169 @@
+"""Portfolio valuation: market value, unrealized P&L and weights for holdings."""
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from app.db import csv_store, price_store
+from app.services import fx, securities, versions
+from app.services.numeric import float_column, group_sum_ids
+
+_CACHE_SIZE = 256
+_cache: "OrderedDict[tuple, dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _pct(numerator: np.ndarray | float, denominator: np.ndarray | float) -> np.ndarray:
+    num, den = np.asarray(numerator, dtype=np.float64), np.asarray(denominator, dtype=np.float64)
+    return np.divide(num * 100.0, den, out=np.zeros(np.broadcast(num, den).shape), where=den != 0)
+
+
+def _breakdown(
+    ids: np.ndarray, labels: list[str], mv: np.ndarray, basis: np.ndarray, total: float
+) -> list[dict[str, Any]]:
+    keys, (mv_sum, basis_sum) = group_sum_ids(ids, labels, mv, basis)
+    weights = _pct(mv_sum, total)
+    out = [
+        {
+            "key": k,
+            "market_value": float(m),
+            "cost_basis": float(b),
+            "unrealized_pnl": float(m - b),
+            "weight_pct": float(w),
+        }
+        for k, m, b, w in zip(keys, mv_sum, basis_sum, weights)
+    ]
+    out.sort(key=lambda r: r["market_value"], reverse=True)
+    return out
+
+
+def price_holdings(
+    holdings: list[dict[str, Any]],
+) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(symbols, quantity, avg_cost, price, priced mask); price falls back to avg_cost."""
+    symbols = [price_store.normalize_symbol(h.get("symbol") or "") for h in holdings]
+    qty = float_column(holdings, "quantity")
+    cost = float_column(holdings, "avg_cost")
+    prices = price_store.latest_prices(symbols)
+    priced = ~np.isnan(prices)
+    return symbols, qty, cost, np.where(priced, prices, cost), priced
+
+
+def value_holdings(
+    holdings: list[dict[str, Any]],
+    portfolio_ids: list[str],
+    include_positions: bool = True,
+    fx_factors: np.ndarray | None = None,
+) -> dict[str, Any]:
+    """
+    Value ``holdings`` in one vectorized pass. Returns totals, per-portfolio totals,
+    breakdowns by symbol and asset class and (optionally) one row per position.
+    ``fx_factors`` (one per holding) converts prices and costs into a reporting currency.
+    """
+    symbols, qty, cost, px, priced = price_holdings(holdings)
+    if fx_factors is not None:
+        cost, px = cost * fx_factors, px * fx_factors
+    security_ids, class_ids = securities.holding_classes(holdings)
+    class_labels = securities.asset_class_labels()
+
+    mv = qty * px
+    basis = qty * cost
+    pnl = mv - basis
+    total_mv = float(mv.sum())
+    total_basis = float(basis.sum())
+
+    index = {pid: i for i, pid in enumerate(portfolio_ids)}
+    p_idx = np.array([index.get(h.get("portfolio_id"), -1) for h in holdings], dtype=np.int64)
+    known = p_idx >= 0
+    p_mv = np.bincount(p_idx[known], weights=mv[known], minlength=len(portfolio_ids))
+    p_basis = np.bincount(p_idx[known], weights=basis[known], minlength=len(portfolio_ids))
+    p_count = np.bincount(p_idx[known], minlength=len(portfolio_ids))
+
+    result: dict[str, Any] = {
+        "price_date": price_store.as_of_date(),
+        "market_value": total_mv,
+        "cost_basis": total_basis,
+        "unrealized_pnl": total_mv - total_basis,
+        "unrealized_pnl_pct": float(_pct(total_mv - total_basis, total_basis)),
+        "positions_count": len(holdings),
+        "unpriced_count": int((~priced).sum()),
+        "portfolios": [
+            {
+                "portfolio_id": pid,
+                "market_value": float(p_mv[i]),
+                "cost_basis": float(p_basis[i]),
+                "unrealized_pnl": float(p_mv[i] - p_basis[i]),
+                "weight_pct": float(_pct(p_mv[i], total_mv)),
+                "positions_count": int(p_count[i]),
+            }
+            for i, pid in enumerate(portfolio_ids)
+        ],
+        "by_symbol": _breakdown(security_ids, securities.symbol_labels(), mv, basis, total_mv),
+        "by_asset_class": _breakdown(class_ids, class_labels, mv, basis, total_mv),
+    }
+    if include_positions:
+        weights = _pct(mv, total_mv)
+        pnl_pct = _pct(pnl, basis)
+        result["positions"] = [
+            {
+                "holding_id": h.get("id"),
+                "portfolio_id": h.get("portfolio_id"),
+                "security_id": int(security_ids[i]),
+                "symbol": symbols[i],
+                "asset_class": class_labels[class_ids[i]],
+                "quantity": float(qty[i]),
+                "avg_cost": float(cost[i]),
+                "price": float(px[i]),
+                "priced": bool(priced[i]),
+                "market_value": float(mv[i]),
+                "cost_basis": float(basis[i]),
+                "unrealized_pnl": float(pnl[i]),
+                "unrealized_pnl_pct": float(pnl_pct[i]),
+                "weight_pct": float(weights[i]),
+            }
+            for i, h in enumerate(holdings)
+        ]
+    return result
+
+
+def value_portfolios(
+    user_id: str,
+    portfolio_ids: list[str],
+    include_positions: bool = True,
+    currency: str | None = None,
+) -> dict[str, Any]:
+    """
+    Cached valuation of the given portfolios (caller checks ownership), in ``currency``
+    if given (else each holding's own currency). Raises ValueError for unknown currencies.
+    """
+    key = (
+        tuple(portfolio_ids),
+        include_positions,
+        fx.normalize(currency),
+        # A portfolio currency change bumps no holdings version, so key on portfolios too.
+        (fx.version(), csv_store.table_version("portfolios")) if currency else None,
+        tuple(versions.holdings_version(pid) for pid in portfolio_ids),
+        price_store.version(),
+        price_store.as_of_date(),
+        securities.version(),
+    )
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    wanted = set(portfolio_ids)
+    holdings = [h for h in csv_store.get_by_user("holdings", user_id) if h.get("portfolio_id") in wanted]
+    factors = None
+    if currency:
+        currencies = {p["id"]: p.get("currency") or "" for p in csv_store.get_by_user("portfolios", user_id)}
+        factors = fx.rates().factors([currencies.get(h.get("portfolio_id"), "") for h in holdings], currency)
+    result = value_holdings(holdings, portfolio_ids, include_positions, factors)
+    if currency:
+        result = {**result, "currency": fx.normalize(currency)}
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
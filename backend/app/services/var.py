@@ -0,0 +1,113 @@
+"""Historical-simulation VaR and Expected Shortfall."""
+import json
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+from app.db import price_store
+from app.services import pool
+from app.services.numeric import to_float
+from app.services.valuation import price_holdings
+
+DEFAULT_LOOKBACK_DAYS = 250
+DEFAULT_CONFIDENCE = 0.95
+
+
+def parse_params(params_json: str) -> tuple[int, float, int]:
+    """(lookback_days, confidence, horizon_days) from a scenario's params_json."""
+    try:
+        params = json.loads(params_json or "{}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"params_json is not valid JSON: {e}") from e
+    if not isinstance(params, dict):
+        raise ValueError("params_json must be a JSON object")
+    lookback = int(to_float(params.get("lookback_days"), DEFAULT_LOOKBACK_DAYS))
+    confidence = to_float(params.get("confidence"), DEFAULT_CONFIDENCE)
+    if confidence > 1:
+        confidence /= 100.0
+    horizon = int(to_float(params.get("horizon_days"), 1))
+    if lookback < 2 or not 0.5 <= confidence < 1 or horizon < 1:
+        raise ValueError("Expected lookback_days >= 2, 0.5 <= confidence < 1 and horizon_days >= 1")
+    return lookback, confidence, horizon
+
+
+def position_matrix(
+    holdings: list[dict[str, Any]],
+    portfolio_ids: list[str],
+) -> tuple[list[str], np.ndarray]:
+    """(symbols, market values portfolios x symbols) at latest prices."""
+    symbols, qty, _, px, _ = price_holdings(holdings)
+    universe = sorted(set(symbols))
+    s_index = {s: j for j, s in enumerate(universe)}
+    p_index = {pid: i for i, pid in enumerate(portfolio_ids)}
+    rows = np.array([p_index.get(h.get("portfolio_id"), -1) for h in holdings], dtype=np.int64)
+    cols = np.array([s_index[s] for s in symbols], dtype=np.int64)
+    keep = rows >= 0
+    values = np.zeros((len(portfolio_ids), len(universe)))
+    np.add.at(values, (rows[keep], cols[keep]), (qty * px)[keep])
+    return universe, values
+
+
+def daily_returns(symbols: list[str], lookback: int, end: str | None = None) -> np.ndarray:
+    """(days x symbols) simple returns; days without data for a symbol count as 0."""
+    _, closes = price_store.aligned_closes(symbols, lookback + 1, end)
+    if len(closes) < 2:
+        return np.zeros((0, len(symbols)))
+    returns = closes[1:] / closes[:-1] - 1.0
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def var_es(returns: np.ndarray, values: np.ndarray, confidence: float) -> tuple[np.ndarray, np.ndarray]:
+    """VaR and ES (positive losses) per portfolio row of ``values``."""
+    pnl = returns @ values.T  # days x portfolios
+    if not len(pnl):
+        return np.zeros(len(values)), np.zeros(len(values))
+    cutoff = np.quantile(pnl, 1.0 - confidence, axis=0)
+    tail = pnl <= cutoff
+    es = (pnl * tail).sum(axis=0) / np.maximum(tail.sum(axis=0), 1)
+    return -cutoff, -es
+
+
+def compute(returns: np.ndarray, values: np.ndarray, confidence: float) -> tuple[np.ndarray, np.ndarray]:
+    """var_es, split across the process pool for large portfolio batches."""
+    if len(values) < settings.risk_parallel_min_portfolios or pool.worker_count() < 2:
+        return var_es(returns, values, confidence)
+    chunks = pool.split(len(values), pool.worker_count())
+    futures = [pool.get_pool().submit(var_es, returns, values[c], confidence) for c in chunks]
+    parts = [f.result() for f in futures]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def var_results(
+    user_id: str,
+    scenario: dict[str, Any],
+    portfolio_ids: list[str],
+    holdings: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    """risk_results rows (VaR/ES as % of value and as amounts) for one VaR scenario."""
+    lookback, confidence, horizon = parse_params(scenario.get("params_json") or "{}")
+    symbols, values = position_matrix(holdings, portfolio_ids)
+    returns = daily_returns(symbols, lookback)
+    var, es = compute(returns, values, confidence)
+    scale = np.sqrt(horizon)
+    var, es = var * scale, es * scale
+    totals = values.sum(axis=1)
+    pct = np.divide(-np.vstack([var, es]) * 100.0, totals, out=np.zeros((2, len(totals))), where=totals != 0)
+    level = f"{confidence * 100:g}".replace(".", "_")
+    rows = []
+    for i, pid in enumerate(portfolio_ids):
+        for metric, value in (
+            (f"VaR_{level}_{horizon}d", f"{pct[0, i]:.2f}%"),
+            (f"Expected_Shortfall_{level}_{horizon}d", f"{pct[1, i]:.2f}%"),
+            (f"VaR_{level}_{horizon}d_amount", f"{-var[i]:.2f}"),
+            (f"Expected_Shortfall_{level}_{horizon}d_amount", f"{-es[i]:.2f}"),
+        ):
+            rows.append({
+                "user_id": user_id,
+                "scenario_id": scenario["id"],
+                "portfolio_id": pid,
+                "metric": metric,
+                "value": value,
+            })
+    return rows
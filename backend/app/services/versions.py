@@ -0,0 +1,28 @@
+"""Per-portfolio holdings versions."""
+import threading
+from typing import Any
+
+from app.db import csv_store
+
+_lock = threading.Lock()
+_epoch = 0  # bumped on whole-table rewrites
+_counters: dict[str, int] = {}
+
+
+def holdings_version(portfolio_id: str) -> tuple[int, int]:
+    return _epoch, _counters.get(portfolio_id, 0)
+
+
+def _on_holdings_change(op: str, old: dict[str, Any] | None, new: dict[str, Any] | None) -> None:
+    global _epoch
+    with _lock:
+        if op == "reset":
+            _epoch += 1
+            return
+        for row in (old, new):
+            if row is not None:
+                pid = row.get("portfolio_id") or ""
+                _counters[pid] = _counters.get(pid, 0) + 1
+
+
+csv_store.add_mutation_hook("holdings", _on_holdings_change)
@@ -0,0 +1,28 @@
+"""
+Bulk load daily closes into the local price store.
+Run from backend directory: python -m scripts.load_prices <file-or-dir> [...]
+CSV columns: symbol,date,close (symbol may be omitted; the file name is used).
+"""
+import sys
+from pathlib import Path
+
+backend = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend))
+
+from app.db import price_store
+
+
+def main(paths: list[str]) -> None:
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    for p in paths:
+        path = Path(p)
+        loaded = price_store.load_csv_dir(path) if path.is_dir() else price_store.load_csv(path)
+        for symbol, length in sorted(loaded.items()):
+            print(f"{symbol}: {length} closes")
+    print(f"Price store as of {price_store.as_of_date()}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
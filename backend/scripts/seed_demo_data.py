@@ -7,12 +7,15 @@ import sys
 from datetime import datetime, timezone
 from pathlib import Path
 
+import numpy as np
+
 backend = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(backend))
 
 from app.core.config import settings
 from app.core.auth import hash_password
-from app.db import csv_store
+from app.db import csv_store, price_store
+from app.services import fx, securities
 
 
 DEMO_USERNAME = "demo"
@@ -37,9 +40,10 @@ def ensure_demo_user() -> str:
 def clear_demo_data(user_id: str) -> None:
     """Remove all rows belonging to the demo user from feature tables."""
     tables_with_user = [
-        "holdings", "portfolios", "risk_results", "risk_scenarios", "orders",
+        "holdings", "portfolios", "risk_results", "risk_scenarios", "orders", "order_events",
         "transactions", "accounts", "commitments", "funds", "saved_reports",
         "portfolio_esg", "client_accounts", "model_portfolios", "integrations",
+        "reconciliation_breaks", "fund_cash_flows",
     ]
     for table in tables_with_user:
         rows = csv_store.read_table(table)
@@ -74,6 +78,24 @@ def seed_portfolios(user_id: str) -> list[str]:
     return ids
 
 
+DEMO_SECURITIES = [
+    ("VTI", "Vanguard Total Stock Market ETF", "equity", "US Equity"),
+    ("VEA", "Vanguard FTSE Developed Markets ETF", "equity", "International Equity"),
+    ("QQQ", "Invesco QQQ Trust", "equity", "US Equity"),
+    ("VWO", "Vanguard FTSE Emerging Markets ETF", "equity", "Emerging Markets Equity"),
+    ("BND", "Vanguard Total Bond Market ETF", "fixed_income", "Aggregate Bond"),
+    ("IUSB", "iShares Core Total USD Bond Market ETF", "fixed_income", "Aggregate Bond"),
+    ("SCHD", "Schwab US Dividend Equity ETF", "equity", "US Equity"),
+]
+
+
+def seed_securities() -> None:
+    securities.upsert_securities([
+        {"symbol": s, "name": n, "asset_class": a, "currency": "USD", "sector": sector}
+        for s, n, a, sector in DEMO_SECURITIES
+    ])
+
+
 def seed_holdings(user_id: str, portfolio_ids: list[str]) -> None:
     # US Growth: equity-heavy
     holdings_data = [
@@ -103,6 +125,38 @@ def seed_holdings(user_id: str, portfolio_ids: list[str]) -> None:
         })
 
 
+# Symbol -> (last close, annualised drift, annualised volatility)
+DEMO_PRICE_PARAMS = {
+    "VTI": (268.40, 0.08, 0.17),
+    "VEA": (51.30, 0.06, 0.16),
+    "QQQ": (455.20, 0.11, 0.23),
+    "VWO": (43.80, 0.05, 0.20),
+    "BND": (72.90, 0.02, 0.06),
+    "IUSB": (46.10, 0.02, 0.05),
+    "SCHD": (80.60, 0.07, 0.14),
+}
+
+
+def seed_prices(days: int = 504) -> None:
+    """Write ~2 years of business-day closes per demo symbol (seeded random walk)."""
+    rng = np.random.default_rng(42)
+    end = np.datetime64(datetime.now(timezone.utc).date(), "D")
+    dates = np.busday_offset(end, -np.arange(days)[::-1], roll="backward")
+    for symbol, (last, mu, sigma) in DEMO_PRICE_PARAMS.items():
+        log_returns = rng.normal(mu / 252 - 0.5 * sigma**2 / 252, sigma / np.sqrt(252), days - 1)
+        path = np.exp(np.concatenate([[0.0], np.cumsum(log_returns)]))
+        closes = np.round(last * path / path[-1], 2)
+        price_store.upsert_series(symbol, dates, closes)
+
+
+# Units of the base currency (USD) per unit of each currency.
+DEMO_FX_RATES = {"EUR": 1.08, "GBP": 1.27, "JPY": 0.0067, "CHF": 1.12, "CAD": 0.73}
+
+
+def seed_fx_rates() -> None:
+    fx.upsert_rates([{"currency": c, "rate": r} for c, r in DEMO_FX_RATES.items()])
+
+
 def seed_risk_scenarios(user_id: str) -> list[str]:
     scenarios = [
         {"name": "Fed Rate Shock", "scenario_type": "stress", "params_json": '{"rate_change_bps": 100}'},
@@ -377,8 +431,14 @@ def main() -> None:
     clear_demo_data(user_id)
     print("Seeding portfolios...")
     portfolio_ids = seed_portfolios(user_id)
+    print("Seeding security master...")
+    seed_securities()
     print("Seeding holdings...")
     seed_holdings(user_id, portfolio_ids)
+    print("Seeding market data prices...")
+    seed_prices()
+    print("Seeding FX rates...")
+    seed_fx_rates()
     print("Seeding risk scenarios and results...")
     scenario_ids = seed_risk_scenarios(user_id)
     seed_risk_results(user_id, scenario_ids, portfolio_ids)
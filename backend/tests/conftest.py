@@ -54,3 +54,38 @@ def other_user_token(client):
     )
     assert login.status_code == 200
     return login.json()["access_token"]
+
+
+@pytest.fixture
+def register_user(client):
+    """Factory: register a new user by name and return (user_id, auth headers)."""
+    def _register(username):
+        response = client.post(
+            "/api/v1/auth/register",
+            json={"username": username, "password": "pass", "display_name": username},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        return body["user_id"], {"Authorization": f"Bearer {body['access_token']}"}
+    return _register
+
+
+@pytest.fixture
+def register(register_user):
+    """Factory: register a new user by name and return auth headers."""
+    return lambda username: register_user(username)[1]
+
+
+@pytest.fixture
+def create_portfolio(client):
+    """Factory: create a portfolio, optionally with (symbol, asset_class, quantity, avg_cost) holdings; returns its id."""
+    def _create(headers, name="Test", currency="USD", holdings=()):
+        pid = client.post("/api/v1/portfolios", headers=headers, json={"name": name, "currency": currency}).json()["id"]
+        for symbol, asset_class, quantity, avg_cost in holdings:
+            client.post(
+                f"/api/v1/portfolios/{pid}/holdings",
+                headers=headers,
+                json={"symbol": symbol, "asset_class": asset_class, "quantity": quantity, "avg_cost": avg_cost},
+            )
+        return pid
+    return _create
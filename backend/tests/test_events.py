@@ -0,0 +1,70 @@
+"""Tests for the per-user event pub/sub and SSE stream."""
+import asyncio
+
+from app.api.v1.events import event_stream
+from app.services import events
+
+
+def test_order_writes_publish_to_subscriber(client, register_user, create_portfolio):
+    user_id, headers = register_user("eventuser")
+    pid = create_portfolio(headers, "Ev")
+
+    async def scenario():
+        sub = events.subscribe(user_id)
+        try:
+            order = await asyncio.to_thread(
+                lambda: client.post(
+                    "/api/v1/trading/orders",
+                    headers=headers,
+                    json={"portfolio_id": pid, "symbol": "EVT", "side": "BUY", "quantity": "1"},
+                ).json()
+            )
+            await asyncio.to_thread(
+                lambda: client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "CANCELLED"})
+            )
+            received = []
+            while len(received) < 2:
+                batch = await sub.next(2)
+                assert batch, "timed out waiting for events"
+                received.extend(batch)
+            return order, received
+        finally:
+            events.unsubscribe(sub)
+
+    order, received = asyncio.run(scenario())
+    assert [e["type"] for e in received] == ["order.created", "order.status"]
+    assert received[1]["data"] == {"id": order["id"], "from": "NEW", "status": "CANCELLED"}
+    assert events.subscriber_count() == 0
+
+
+def test_bulk_events_coalesce_and_stream_format():
+    class FakeRequest:
+        def __init__(self):
+            self.polls = 0
+
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls > 1
+
+    async def scenario():
+        unstarted = event_stream(FakeRequest(), "coalesce-user")
+        assert events.subscriber_count() == 0
+        del unstarted
+        stream = event_stream(FakeRequest(), "coalesce-user")
+        first = await stream.__anext__()  # subscribes
+        for i in range(500):
+            events.publish("coalesce-user", "risk_results.changed", {"scenario_id": "s1", "n": i}, coalesce=("s1",))
+        events.publish("coalesce-user", "order.created", {"id": "o1"})
+        return [first] + [chunk async for chunk in stream]
+
+    chunks = asyncio.run(scenario())
+    assert chunks[0] == "retry: 3000\n\n"
+    assert len(chunks) == 3
+    assert "event: risk_results.changed" in chunks[1] and '"n": 499' in chunks[1] and '"count": 500' in chunks[1]
+    assert "event: order.created" in chunks[2]
+    assert events.subscriber_count() == 0
+
+
+def test_stream_requires_auth(client):
+    assert client.get("/api/v1/events/stream").status_code == 401
+    assert client.get("/api/v1/events/stream", params={"token": "bad"}).status_code == 401
@@ -0,0 +1,73 @@
+"""Tests for the background job queue."""
+import threading
+import time
+
+from app.db import csv_store
+from app.services import jobs
+
+
+def _wait(client, headers, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/v1/jobs/{job_id}", headers=headers).json()
+        if job["status"] in jobs.FINISHED:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_price_import_job_runs_and_returns_result(client, register):
+    headers = register("jobuser")
+    response = client.post(
+        "/api/v1/jobs",
+        headers=headers,
+        json={"job_type": "price_import", "params": {"csv": "symbol,date,close\nJOBSYM,2024-01-02,10\nJOBSYM,2024-01-03,11\n"}},
+    )
+    assert response.status_code == 200
+    job = _wait(client, headers, response.json()["id"])
+    assert job["status"] == "SUCCEEDED"
+    assert client.get(f"/api/v1/jobs/{job['id']}/result", headers=headers).json() == {"loaded": {"JOBSYM": 2}}
+
+    other = register("jobsnoop")
+    assert client.get(f"/api/v1/jobs/{job['id']}", headers=other).status_code == 404
+    assert client.post("/api/v1/jobs", headers=headers, json={"job_type": "nope"}).status_code == 400
+
+
+def test_running_job_reports_progress_and_cancels(client, register):
+    headers = register("jobcancel")
+    started, release = threading.Event(), threading.Event()
+
+    @jobs.register("test_slow")
+    def _slow(ctx):
+        ctx.progress(0.5)
+        started.set()
+        release.wait(5)
+        ctx.progress(0.75)
+        return {"done": True}
+
+    job_id = client.post("/api/v1/jobs", headers=headers, json={"job_type": "test_slow"}).json()["id"]
+    assert started.wait(5)
+    running = client.get(f"/api/v1/jobs/{job_id}", headers=headers).json()
+    assert running["status"] == "RUNNING" and running["progress"] == "0.5000"
+    assert client.get(f"/api/v1/jobs/{job_id}/result", headers=headers).status_code == 409
+    client.post(f"/api/v1/jobs/{job_id}/cancel", headers=headers)
+    release.set()
+    assert _wait(client, headers, job_id)["status"] == "CANCELLED"
+    assert client.post(f"/api/v1/jobs/{job_id}/cancel", headers=headers).status_code == 409
+
+
+def test_interrupted_jobs_are_requeued(client, register_user):
+    user_id, headers = register_user("jobrestart")
+    row = {
+        "id": csv_store.generate_id(),
+        "user_id": user_id,
+        "job_type": "price_import",
+        "status": "RUNNING",
+        "params_json": '{"csv": "symbol,date,close\\nJOBRST,2024-01-02,5\\n"}',
+        "progress": "0.3",
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "started_at": "2024-01-01T00:00:01+00:00",
+    }
+    csv_store.append_row("jobs", row)  # as left behind by a process that died mid-job
+    assert jobs.recover() >= 1
+    assert _wait(client, headers, row["id"])["status"] == "SUCCEEDED"
@@ -0,0 +1,103 @@
+"""Tests for the price store and market-data endpoints."""
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from app.db import price_store
+
+
+def test_upsert_and_range_slice():
+    """Upserted closes are merged by date and range slices are inclusive."""
+    price_store.upsert_series("tst1", ["2025-01-02", "2025-01-03", "2025-01-06"], [10.0, 11.0, 12.0])
+    price_store.upsert_series("TST1", ["2025-01-03", "2025-01-07"], [11.5, 13.0])
+
+    dates, closes = price_store.get_series("TST1", "2025-01-03", "2025-01-06")
+    assert dates.astype(str).tolist() == ["2025-01-03", "2025-01-06"]
+    assert closes.tolist() == [11.5, 12.0]
+    assert price_store.latest("tst1") == ("2025-01-07", 13.0)
+    assert price_store.price_as_of("TST1", "2025-01-05") == 11.5
+    assert "TST1" in price_store.symbols()
+
+
+def test_writes_from_another_process_are_seen():
+    """The version lives in the data dir, so a write made by another process invalidates cached maps."""
+    price_store.upsert_series("XPROC", ["2025-02-03"], [5.0])
+    assert price_store.latest("XPROC") == ("2025-02-03", 5.0)
+    before = price_store.version()
+    code = "from app.db import price_store; price_store.upsert_series('XPROC', ['2025-02-03'], [7.0])"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[1])
+
+    assert price_store.version() > before
+    assert price_store.latest("XPROC") == ("2025-02-03", 7.0)
+    assert price_store.changed_symbols(before) is None  # written elsewhere: unknown which symbols
+
+
+def test_latest_prices_missing_symbol_is_nan():
+    price_store.upsert_series("TST2", ["2025-01-02"], [5.0])
+    prices = price_store.latest_prices(["TST2", "NOPE"])
+    assert prices[0] == 5.0
+    assert np.isnan(prices[1])
+
+
+def test_load_csv_text():
+    loaded = price_store.load_csv_text(
+        "symbol,date,close\nTST3,2025-02-03,1.5\nTST4,2025-02-03,2.5\nTST3,2025-02-04,1.6\n"
+    )
+    assert loaded == {"TST3": 2, "TST4": 1}
+
+
+def test_price_endpoints(client, auth_headers):
+    """Import prices through the API, then read the series and latest close."""
+    response = client.post(
+        "/api/v1/market-data/prices",
+        headers=auth_headers,
+        json={"prices": [
+            {"symbol": "APIX", "date": "2025-03-03", "close": 100.0},
+            {"symbol": "APIX", "date": "2025-03-04", "close": 101.0},
+        ]},
+    )
+    assert response.status_code == 200
+    assert response.json()["loaded"] == {"APIX": 2}
+
+    series = client.get("/api/v1/market-data/prices/apix?start=2025-03-04", headers=auth_headers)
+    assert series.status_code == 200
+    assert series.json()["closes"] == [101.0]
+    assert client.get("/api/v1/market-data/prices/APIX?start=garbage", headers=auth_headers).status_code == 400
+
+    latest = client.get("/api/v1/market-data/prices/APIX/latest", headers=auth_headers)
+    assert latest.json() == {"symbol": "APIX", "date": "2025-03-04", "close": 101.0}
+
+    missing = client.get("/api/v1/market-data/prices/NOPE/latest", headers=auth_headers)
+    assert missing.status_code == 404
+
+
+def test_security_master(client, auth_headers, create_portfolio):
+    """Master rows intern to stable integer ids and supply holdings' asset class."""
+    resp = client.post("/api/v1/market-data/securities", headers=auth_headers, json={"securities": [
+        {"symbol": "secm1", "asset_class": "equity", "currency": "usd", "sector": "Tech"},
+        {"symbol": "SECM2", "asset_class": "fixed_income"},
+    ]})
+    assert resp.status_code == 200
+    first = client.get("/api/v1/market-data/securities/SECM1", headers=auth_headers).json()
+    assert first["currency"] == "USD"
+    assert client.get("/api/v1/market-data/securities/secm1", headers=auth_headers).json()["security_id"] == first["security_id"]
+    assert client.get("/api/v1/market-data/securities/NOPE", headers=auth_headers).status_code == 404
+
+    pid = create_portfolio(auth_headers, "Master")
+    holding = client.post(f"/api/v1/portfolios/{pid}/holdings", headers=auth_headers, json={
+        "symbol": "SECM1", "quantity": "2", "avg_cost": "10",
+    })
+    assert holding.json()["asset_class"] == "equity"
+    missing = client.post(f"/api/v1/portfolios/{pid}/holdings", headers=auth_headers, json={
+        "symbol": "SECM3", "quantity": "1", "avg_cost": "1",
+    })
+    assert missing.status_code == 400
+    # Hand-typed classes are overridden by the master in analytics.
+    client.post(f"/api/v1/portfolios/{pid}/holdings", headers=auth_headers, json={
+        "symbol": "SECM2", "asset_class": "equity", "quantity": "3", "avg_cost": "10",
+    })
+    valuation = client.get(f"/api/v1/portfolios/{pid}/valuation", headers=auth_headers).json()
+    assert {r["key"]: r["market_value"] for r in valuation["by_asset_class"]} == {"equity": 20.0, "fixed_income": 30.0}
+    assert {p["symbol"]: p["security_id"] for p in valuation["positions"]}["SECM1"] == first["security_id"]
@@ -0,0 +1,146 @@
+"""Tests for operations: accounts, transactions and the balance ledger."""
+import pytest
+
+
+def test_ledger_balances_and_ranges(client, register):
+    headers = register("ledgeruser")
+    acct = client.post("/api/v1/operations/accounts", headers=headers, json={"name": "Cash"}).json()["id"]
+    base = f"/api/v1/operations/accounts/{acct}"
+
+    def post(amount, date):
+        return client.post("/api/v1/operations/transactions", headers=headers, json={
+            "account_id": acct, "type": "deposit", "amount": amount, "date": date,
+        }).json()["id"]
+
+    post("100", "2024-01-05")
+    post("-30", "2024-01-10")
+    late = post("50", "2024-01-20")
+    backdated = post("10", "2024-01-01")  # lands before everything else
+
+    assert client.get(f"{base}/balance", headers=headers).json()["balance"] == pytest.approx(130)
+    as_of = client.get(f"{base}/balance?as_of=2024-01-10", headers=headers).json()
+    assert (as_of["balance"], as_of["transactions"]) == (pytest.approx(80), 3)
+    assert client.get(f"{base}/balance?as_of=2023-12-31", headers=headers).json()["balance"] == 0
+
+    statement = client.get(f"{base}/ledger?start=2024-01-05&end=2024-01-10", headers=headers).json()
+    assert statement["opening_balance"] == pytest.approx(10)
+    assert statement["closing_balance"] == pytest.approx(80)
+    assert [(e["amount"], e["balance"]) for e in statement["entries"]] == [("100", 110), ("-30", 80)]
+    listed = client.get(f"{base}/transactions", headers=headers).json()
+    assert [t["date"] for t in listed] == ["2024-01-05", "2024-01-10", "2024-01-20", "2024-01-01"]  # as stored
+    assert "balance" not in listed[0]
+    ranged = client.get(f"{base}/transactions?start=2024-01-05T00:00:00&end=2024-01-10", headers=headers).json()
+    assert [t["date"] for t in ranged] == ["2024-01-05", "2024-01-10"]
+    assert client.get(f"{base}/transactions?start=Jan 5", headers=headers).status_code == 400
+
+    client.put(f"/api/v1/operations/transactions/{late}", headers=headers, json={"date": "2024-01-02", "amount": "5"})
+    client.delete(f"/api/v1/operations/transactions/{backdated}", headers=headers)
+    as_of = client.get(f"{base}/balance?as_of=2024-01-05", headers=headers).json()
+    assert (as_of["balance"], as_of["transactions"]) == (pytest.approx(105), 2)
+    balances = client.get("/api/v1/operations/accounts/balances?as_of=2024-01-31", headers=headers).json()
+    assert balances["total"] == pytest.approx(75)
+
+
+def test_reconciliation_reports_breaks(client, register, create_portfolio):
+    headers = register("reconuser")
+    pid = create_portfolio(headers, "Recon")
+    acct = client.post("/api/v1/operations/accounts", headers=headers, json={"name": "Settle", "portfolio_id": pid}).json()["id"]
+
+    def fill(symbol, qty, price):
+        order = client.post("/api/v1/trading/orders", headers=headers, json={
+            "portfolio_id": pid, "symbol": symbol, "side": "BUY", "quantity": qty,
+        }).json()
+        client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "FILLED", "fill_price": price})
+        return order["id"]
+
+    def cash(amount, order_id):
+        client.post("/api/v1/operations/transactions", headers=headers, json={
+            "account_id": acct, "type": "buy", "amount": amount, "date": "2025-01-02", "order_id": order_id,
+        })
+
+    good, short_cash, no_cash = fill("RCA", "10", 5), fill("RCB", "4", 2), fill("RCC", "1", 3)
+    cash("-50", good)
+    cash("-7", short_cash)
+    cash("-1", "not-an-order")
+    holding = next(h for h in client.get(f"/api/v1/portfolios/{pid}/holdings", headers=headers).json() if h["symbol"] == "RCA")
+    client.put(f"/api/v1/portfolios/{pid}/holdings/{holding['id']}", headers=headers, json={"quantity": "8"})
+
+    summary = client.post("/api/v1/operations/reconciliation", headers=headers, json={}).json()
+    assert (summary["filled_orders"], summary["holdings"], summary["transactions"]) == (3, 3, 3)
+    assert summary["by_type"] == {
+        "quantity_mismatch": 1, "missing_holding": 0, "missing_cash_leg": 1,
+        "cash_amount_mismatch": 1, "orphan_cash_leg": 1,
+    }
+    breaks = client.get("/api/v1/operations/reconciliation/breaks", headers=headers).json()
+    by_type = {b["break_type"]: b for b in breaks}
+    assert (by_type["quantity_mismatch"]["symbol"], by_type["quantity_mismatch"]["difference"]) == ("RCA", "-2")
+    assert by_type["missing_cash_leg"]["order_id"] == no_cash
+    assert (by_type["cash_amount_mismatch"]["expected"], by_type["cash_amount_mismatch"]["actual"]) == ("8", "7")
+
+    # A rerun replaces the previous breaks.
+    client.post("/api/v1/operations/reconciliation", headers=headers, json={"cash_tolerance": 5})
+    again = client.get("/api/v1/operations/reconciliation/breaks?break_type=cash_amount_mismatch", headers=headers)
+    assert again.json() == []
+    assert len(client.get("/api/v1/operations/reconciliation/breaks", headers=headers).json()) == 3
+    assert client.get("/api/v1/operations/reconciliation/breaks?break_type=bogus", headers=headers).status_code == 400
+
+
+def test_cash_ladder_projects_settlement_and_scheduled_flows(client, register, create_portfolio):
+    headers = register("ladderuser")
+    pid = create_portfolio(headers, "Ladder")
+    acct = client.post("/api/v1/operations/accounts", headers=headers, json={"name": "Settle", "portfolio_id": pid}).json()["id"]
+    assert client.post("/api/v1/operations/accounts", headers=headers, json={"name": "X", "portfolio_id": "nope"}).status_code == 404
+    client.post("/api/v1/market-data/securities", headers=headers, json={"securities": [
+        {"symbol": "LADA", "asset_class": "equity", "currency": "USD"},
+    ]})
+
+    def post(amount, date):
+        client.post("/api/v1/operations/transactions", headers=headers, json={
+            "account_id": acct, "type": "deposit", "amount": amount, "date": date,
+        })
+
+    post("100", "2025-03-01")
+    post("-20", "2025-03-05")
+    post("5", "2025-04-30")  # past the horizon
+    for symbol, side, qty, limit in (("LADA", "BUY", "10", 3), ("LADB", "SELL", "2", 50)):
+        client.post("/api/v1/trading/orders", headers=headers, json={
+            "portfolio_id": pid, "symbol": symbol, "side": side, "quantity": qty,
+            "order_type": "LIMIT", "limit_price": limit,
+        })
+
+    url = f"/api/v1/operations/accounts/{acct}/cash-ladder?days=5&as_of=2025-03-03"
+    ladder = client.get(url, headers=headers).json()
+    assert ladder["dates"][:2] == ["2025-03-03", "2025-03-04"]
+    [usd] = ladder["currencies"]
+    # Equity buy settles T+1; the unclassified sell T+2, alongside the scheduled -20.
+    assert usd["flows"] == [0, -30, 80, 0, 0, 0]
+    assert usd["balances"] == [100, 70, 150, 150, 150, 150]
+    assert (usd["scheduled_transactions"], usd["pending_orders"], usd["min_balance"]) == (1, 2, 70)
+
+    post("1", "2025-03-04")  # invalidates the cached ladder
+    assert client.get(url, headers=headers).json()["currencies"][0]["flows"][1] == -29
+    everything = client.get("/api/v1/operations/accounts/cash-ladder?days=5&as_of=2025-03-03", headers=headers).json()
+    assert [a["account_id"] for a in everything["accounts"]] == [acct]
+    assert client.get(f"/api/v1/operations/accounts/{acct}/cash-ladder?days=0", headers=headers).status_code == 400
+    assert client.get("/api/v1/operations/accounts/nope/cash-ladder", headers=headers).status_code == 404
+
+
+def test_reconciliation_counts_positions_held_before_first_fill(client, register, create_portfolio):
+    headers = register("reconopening")
+    pid = create_portfolio(headers, "Opening", holdings=[("RCO", "equity", "100", "1")])
+    for qty in ("10", "5"):
+        order = client.post("/api/v1/trading/orders", headers=headers, json={
+            "portfolio_id": pid, "symbol": "RCO", "side": "BUY", "quantity": qty,
+        }).json()
+        client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "FILLED", "fill_price": 1})
+    holdings = client.get(f"/api/v1/portfolios/{pid}/holdings", headers=headers).json()
+    assert [h["quantity"] for h in holdings] == ["115"]
+
+    summary = client.post("/api/v1/operations/reconciliation", headers=headers, json={}).json()
+    assert summary["by_type"]["quantity_mismatch"] == 0
+    assert summary["by_type"]["missing_cash_leg"] == 0  # no cash account settles this portfolio
+
+    client.put(f"/api/v1/portfolios/{pid}/holdings/{holdings[0]['id']}", headers=headers, json={"quantity": "112"})
+    client.post("/api/v1/operations/reconciliation", headers=headers, json={})
+    [brk] = client.get("/api/v1/operations/reconciliation/breaks?break_type=quantity_mismatch", headers=headers).json()
+    assert (brk["expected"], brk["actual"]) == ("115", "112")
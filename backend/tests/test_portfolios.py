@@ -1,4 +1,5 @@
 """Tests for portfolios API: full CRUD and user isolation."""
+import pytest
 
 
 def test_create_portfolio(client, auth_headers):
@@ -146,3 +147,99 @@ def test_user_isolation_user_b_cannot_update_or_delete_user_a_portfolio(
     get_a = client.get(f"/api/v1/portfolios/{pid}", headers=auth_headers)
     assert get_a.status_code == 200
     assert get_a.json()["name"] == "A's Portfolio"
+
+
+def test_portfolio_valuation(client, auth_headers, create_portfolio):
+    """Valuation multiplies quantities by latest closes and falls back to avg_cost when unpriced."""
+    client.post(
+        "/api/v1/market-data/prices",
+        headers=auth_headers,
+        json={"prices": [{"symbol": "VALA", "date": "2025-04-01", "close": 12.0}]},
+    )
+    pid = create_portfolio(auth_headers, "Valued", holdings=[("VALA", "equity", "10", "10"), ("VALB", "fixed_income", "5", "20")])
+
+    response = client.get(f"/api/v1/portfolios/{pid}/valuation", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["market_value"] == 220.0
+    assert data["cost_basis"] == 200.0
+    assert data["unrealized_pnl"] == 20.0
+    assert data["unpriced_count"] == 1
+    by_class = {r["key"]: r for r in data["by_asset_class"]}
+    assert by_class["equity"]["market_value"] == 120.0
+    assert round(by_class["fixed_income"]["weight_pct"], 4) == round(100 / 220 * 100, 4)
+
+    multi = client.get(f"/api/v1/portfolios/valuation?portfolio_id={pid}", headers=auth_headers)
+    assert multi.status_code == 200
+    assert multi.json()["portfolios"][0]["market_value"] == 220.0
+    assert "positions" not in multi.json()
+
+
+def test_exposure_tracks_holding_changes(client, register, create_portfolio):
+    """Exposure aggregates follow holding inserts, updates, deletes and currency changes."""
+    headers = register("exposureuser")
+    client.get("/api/v1/portfolios/exposure", headers=headers)  # build aggregates first
+    usd = create_portfolio(headers, "USD", "USD")
+    eur = create_portfolio(headers, "EUR", "EUR")
+    h1 = client.post(
+        f"/api/v1/portfolios/{usd}/holdings",
+        headers=headers,
+        json={"symbol": "EXPA", "asset_class": "equity", "quantity": "10", "avg_cost": "5"},
+    ).json()["id"]
+    client.post(
+        f"/api/v1/portfolios/{eur}/holdings",
+        headers=headers,
+        json={"symbol": "EXPA", "asset_class": "equity", "quantity": "4", "avg_cost": "5"},
+    )
+    client.put(f"/api/v1/portfolios/{usd}/holdings/{h1}", headers=headers, json={"quantity": "6"})
+
+    data = client.get("/api/v1/portfolios/exposure", headers=headers).json()
+    assert data["by_symbol"] == [
+        {"key": "EXPA", "net": 50.0, "long": 50.0, "short": 0.0, "gross": 50.0, "weight_pct": 100.0, "quantity": 10.0}
+    ]
+    by_ccy = {r["key"]: r["net"] for r in data["by_currency"]}
+    assert by_ccy == {"USD": 30.0, "EUR": 20.0}
+
+    client.put(f"/api/v1/portfolios/{usd}", headers=headers, json={"currency": "EUR"})
+    client.delete(f"/api/v1/portfolios/{usd}/holdings/{h1}", headers=headers)
+    data = client.get("/api/v1/portfolios/exposure", headers=headers).json()
+    assert {r["key"]: r["net"] for r in data["by_currency"]} == {"EUR": 20.0}
+    assert data["buckets"] == 1
+
+
+def test_fx_conversion(client, register, create_portfolio):
+    """Cross rates triangulate through the base currency; valuation, exposure and balances convert."""
+    headers = register("fx_user")
+    resp = client.post("/api/v1/market-data/fx", headers=headers, json={"rates": [
+        {"currency": "eur", "rate": 1.1},
+        {"currency": "GBP", "rate": 1.25},
+    ]})
+    assert resp.status_code == 200
+    matrix = client.get("/api/v1/market-data/fx/matrix", headers=headers).json()
+    idx = {c: i for i, c in enumerate(matrix["currencies"])}
+    assert matrix["matrix"][idx["GBP"]][idx["EUR"]] == pytest.approx(1.25 / 1.1)
+
+    pid = create_portfolio(headers, "Euro", "EUR", [("NOPRICE1", "equity", "10", "100")])
+    native = client.get(f"/api/v1/portfolios/{pid}/valuation", headers=headers).json()
+    in_gbp = client.get(f"/api/v1/portfolios/{pid}/valuation?currency=GBP", headers=headers).json()
+    assert in_gbp["currency"] == "GBP"
+    assert in_gbp["market_value"] == pytest.approx(native["market_value"] * 1.1 / 1.25)
+    exposure = client.get("/api/v1/portfolios/exposure?currency=USD", headers=headers).json()
+    assert exposure["net"] == pytest.approx(native["market_value"] * 1.1)
+    assert client.get(f"/api/v1/portfolios/{pid}/valuation?currency=XXX", headers=headers).status_code == 400
+
+    acct = client.post("/api/v1/operations/accounts", headers=headers, json={
+        "name": "GBP cash", "account_type": "cash", "currency": "GBP",
+    }).json()
+    client.post("/api/v1/operations/transactions", headers=headers, json={
+        "account_id": acct["id"], "amount": "200", "type": "deposit", "date": "2024-01-02",
+    })
+    balances = client.get("/api/v1/operations/accounts/balances?currency=EUR", headers=headers).json()
+    assert balances["total"] == pytest.approx(200 * 1.25 / 1.1)
+
+    # An account in a currency with no rate is listed unconverted instead of failing the request.
+    client.post("/api/v1/operations/accounts", headers=headers, json={"name": "Yen", "currency": "JPY"})
+    balances = client.get("/api/v1/operations/accounts/balances", headers=headers).json()
+    assert balances["unconverted_currencies"] == ["JPY"]
+    assert balances["total"] == pytest.approx(200 * 1.25)
+    assert [a["converted"] for a in balances["accounts"] if a["account_currency"] == "JPY"] == [None]
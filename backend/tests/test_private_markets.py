@@ -0,0 +1,61 @@
+"""Tests for private markets: fund cash flows and IRR / multiple analytics."""
+import numpy as np
+import pytest
+
+from app.services import private_markets
+
+
+def test_irr_newton_and_bisection_fallback():
+    amounts = np.array([[-100, 121, 0], [-1, 1000, 0], [100, 10, 0]])
+    years = np.array([[0, 2, 0], [0, 1, 0], [0, 1, 0]])
+    rates = private_markets.irr(amounts, years)
+    assert rates[0] == pytest.approx(0.1)
+    assert rates[1] == pytest.approx(999)  # Newton from 10% overshoots; bisection finds it
+    assert np.isnan(rates[2])  # no outflow, no IRR
+
+
+def test_fund_analytics_and_rollups(client, register):
+    headers = register("pmuser")
+    base = "/api/v1/private-markets"
+
+    def fund(name, strategy):
+        return client.post(f"{base}/funds", headers=headers, json={
+            "name": name, "strategy": strategy, "vintage_year": "2021",
+        }).json()["id"]
+
+    def flow(fund_id, flow_type, amount, date):
+        return client.post(f"{base}/cash-flows", headers=headers, json={
+            "fund_id": fund_id, "flow_type": flow_type, "amount": amount, "date": date,
+        })
+
+    buyout, venture = fund("Buyout I", "buyout"), fund("Venture I", "venture")
+    client.post(f"{base}/commitments", headers=headers, json={"fund_id": buyout, "amount": "150", "date": "2021-01-01"})
+    flow(buyout, "call", "100", "2021-01-01")
+    flow(buyout, "distribution", "121", "2023-01-01")
+    flow(venture, "call", "100", "2021-01-01")
+    flow(venture, "nav", "120", "2021-06-30")  # superseded by the later mark
+    flow(venture, "nav", "150", "2022-01-01")
+    assert flow(venture, "fee", "1", "2022-01-01").status_code == 400
+    assert flow(venture, "call", "-5", "2022-01-01").status_code == 400
+
+    stats = client.get(f"{base}/funds/{buyout}/analytics", headers=headers).json()
+    assert (stats["irr"], stats["tvpi"], stats["dpi"], stats["rvpi"]) == (
+        pytest.approx(0.1), pytest.approx(1.21), pytest.approx(1.21), 0,
+    )
+    assert (stats["committed"], stats["unfunded"]) == (150, 50)
+    stats = client.get(f"{base}/funds/{venture}/analytics", headers=headers).json()
+    assert (stats["irr"], stats["nav"], stats["rvpi"]) == (pytest.approx(0.5), 150, pytest.approx(1.5))
+
+    by_strategy = client.get(f"{base}/analytics?group_by=strategy", headers=headers).json()
+    assert {g["strategy"]: g["funds"] for g in by_strategy["groups"]} == {"buyout": 1, "venture": 1}
+    vintage = client.get(f"{base}/analytics?group_by=vintage", headers=headers).json()
+    [group] = vintage["groups"]
+    assert group["vintage"] == "2021"
+    assert group["tvpi"] == pytest.approx(271 / 200) == vintage["total"]["tvpi"]
+    assert 0.1 < group["irr"] < 0.5
+
+    # Editing a flow invalidates that fund's cached analytics.
+    flows = client.get(f"{base}/funds/{venture}/cash-flows", headers=headers).json()
+    client.put(f"{base}/cash-flows/{flows[-1]['id']}", headers=headers, json={"amount": "200"})
+    assert client.get(f"{base}/funds/{venture}/analytics", headers=headers).json()["irr"] == pytest.approx(1.0)
+    assert client.get(f"{base}/analytics?group_by=bogus", headers=headers).status_code == 400
@@ -0,0 +1,275 @@
+"""Tests for the risk engines: scenario execution, historical and Monte Carlo VaR."""
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.db import csv_store, price_store
+from app.services import covariance, monte_carlo, pool, var
+from app.services import scenarios as scenario_engine
+
+
+def test_parse_params():
+    shocks, overrides, ignored = scenario_engine.parse_params(
+        '{"rate_change_bps": 100, "drawdown_pct": 20, "shocks": {"cash": 1}, "mystery": 3}'
+    )
+    assert shocks.tolist() == [0.01, -0.2, 0.0, 0.0]
+    assert overrides == {"cash": 0.01}
+    assert ignored == ["mystery"]
+
+
+def test_run_scenario_writes_results_once(client, register, create_portfolio):
+    headers = register("stressuser")
+    pid = create_portfolio(headers, holdings=[
+        ("RSKEQ", "equity", "10", "100"),
+        ("RSKFI", "fixed_income", "10", "100"),
+    ])
+    scenario = client.post(
+        "/api/v1/risk/scenarios",
+        headers=headers,
+        json={"name": "Rates +100", "params_json": '{"rate_change_bps": 100}'},
+    ).json()
+
+    for _ in range(2):
+        response = client.post(f"/api/v1/risk/scenarios/{scenario['id']}/run", headers=headers)
+        assert response.status_code == 200
+
+    results = client.get(f"/api/v1/risk/scenarios/{scenario['id']}/results", headers=headers).json()
+    values = {(r["portfolio_id"], r["metric"]): r["value"] for r in results}
+    assert len(results) == 2
+    # equity -2%, fixed income -6% on 1,000 each
+    assert values[(pid, "Stress_PnL")] == "-80.00"
+    assert values[(pid, "Stress_Return")] == "-4.00%"
+
+
+def test_run_scenario_invalid_params(client, register):
+    headers = register("badparamsuser")
+    scenario = client.post(
+        "/api/v1/risk/scenarios", headers=headers, json={"name": "Broken", "params_json": "{not json"}
+    ).json()
+    response = client.post(f"/api/v1/risk/scenarios/{scenario['id']}/run", headers=headers)
+    assert response.status_code == 400
+
+
+def test_stress_results_many_scenarios_and_portfolios():
+    """50 scenarios x 200 portfolios are evaluated in one matrix product."""
+    portfolio_ids = [f"p{i}" for i in range(200)]
+    holdings = [
+        {"portfolio_id": pid, "symbol": f"S{j}", "asset_class": ac, "quantity": "1", "avg_cost": "100"}
+        for pid in portfolio_ids
+        for j, ac in enumerate(["equity", "fixed_income", "cash"])
+    ]
+    scenarios = [{"id": f"s{k}", "params_json": f'{{"drawdown_pct": {k}}}'} for k in range(50)]
+    rows, _ = scenario_engine.stress_results("u", scenarios, portfolio_ids, holdings)
+    assert len(rows) == 50 * 200 * 2
+    last = [r for r in rows if r["scenario_id"] == "s49" and r["metric"] == "Stress_PnL"]
+    # equity -49% of 100 and fixed income -0.05 * 49% of 100
+    assert {r["value"] for r in last} == {f"{-49.0 - 0.05 * 49.0:.2f}"}
+
+
+def test_var_es_tail():
+    returns = np.array([[r] for r in (-0.10, -0.05, 0.0, 0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.07)])
+    value_at_risk, shortfall = var.var_es(returns, np.array([[1000.0]]), 0.8)
+    # 20% quantile of P&L (-100, -50, 0, ...) interpolates to -10; tail mean is -75
+    assert value_at_risk[0] == pytest.approx(10.0)
+    assert shortfall[0] == pytest.approx(75.0)
+
+
+def test_run_historical_var_scenario(client, register, create_portfolio):
+    headers = register("varuser")
+    closes = [100.0, 90.0, 99.0, 99.0, 108.9, 108.9]
+    price_store.upsert_series("VARSYM", [f"2024-01-0{i + 1}" for i in range(len(closes))], closes)
+    pid = create_portfolio(headers, holdings=[("VARSYM", "equity", "10", "100")])
+    scenario = client.post(
+        "/api/v1/risk/scenarios",
+        headers=headers,
+        json={
+            "name": "Hist VaR",
+            "scenario_type": "historical_var",
+            "params_json": '{"lookback_days": 5, "confidence": 0.99}',
+        },
+    ).json()
+    response = client.post(f"/api/v1/risk/scenarios/{scenario['id']}/run", headers=headers)
+    assert response.status_code == 200
+    values = {r["metric"]: r["value"] for r in response.json()["results"] if r["portfolio_id"] == pid}
+    # Worst daily return is -10%, valued at the latest close of 108.9
+    assert values["VaR_99_1d"] == "-9.60%"
+    assert values["Expected_Shortfall_99_1d"] == "-10.00%"
+    assert values["Expected_Shortfall_99_1d_amount"] == "-108.90"
+
+
+def test_monte_carlo_matches_normal_quantile():
+    est = monte_carlo.simulate(np.zeros(1), np.array([[0.01]]), np.array([[1000.0]]), 1, 0.95, 200_000, seed=7)
+    expected = 1000.0 * -np.expm1(-1.6448536 * 0.01)
+    assert abs(est["var"][0] - expected) < 4 * est["var_stderr"][0]
+    assert est["es"][0] > est["var"][0]
+
+
+def test_monte_carlo_reproducible_across_workers(monkeypatch):
+    args = (np.zeros(2), np.array([[0.02, 0.0], [0.01, 0.01]]), np.array([[500.0, 500.0], [1000.0, -200.0]]), 5, 0.99)
+    serial = monte_carlo.simulate(*args, paths=4_000, seed=3)
+    monkeypatch.setattr(settings, "risk_workers", 2)
+    monkeypatch.setattr(settings, "mc_parallel_min_paths", 1)
+    try:
+        parallel = monte_carlo.simulate(*args, paths=4_000, seed=3)
+    finally:
+        pool.shutdown()
+    for key in serial:
+        np.testing.assert_allclose(parallel[key], serial[key])
+
+
+def test_monte_carlo_memory_limit_groups_portfolios(monkeypatch):
+    args = (np.zeros(2), np.array([[0.02, 0.0], [0.01, 0.01]]), np.array([[500.0, 500.0], [1000.0, -200.0]]), 5, 0.99)
+    together = monte_carlo.simulate(*args, paths=4_000, seed=3)
+    # k worst paths and 400-path blocks: 3k + 400 floats per portfolio in-process.
+    per_portfolio = 3 * monte_carlo.tail_size(4_000, 0.99) + 400
+    monkeypatch.setattr(settings, "mc_memory_floats", per_portfolio)
+    grouped = monte_carlo.simulate(*args, paths=4_000, seed=3)
+    for key in together:
+        np.testing.assert_allclose(grouped[key], together[key])
+    monkeypatch.setattr(settings, "mc_memory_floats", per_portfolio - 1)
+    with pytest.raises(ValueError):
+        monte_carlo.simulate(*args, paths=4_000, seed=3)
+
+
+def test_run_monte_carlo_scenario(client, register, create_portfolio):
+    headers = register("mcuser")
+    price_store.upsert_series("MCSYM", [f"2024-02-{d:02d}" for d in range(1, 11)], [100, 101, 99, 100, 102, 101, 103, 102, 104, 103])
+    pid = create_portfolio(headers, holdings=[("MCSYM", "equity", "10", "100")])
+    scenario = client.post(
+        "/api/v1/risk/scenarios",
+        headers=headers,
+        json={"name": "MC", "scenario_type": "monte_carlo", "params_json": '{"paths": 5000, "horizon_days": 10}'},
+    ).json()
+    first = client.post(f"/api/v1/risk/scenarios/{scenario['id']}/run", headers=headers).json()["results"]
+    second = client.post(f"/api/v1/risk/scenarios/{scenario['id']}/run", headers=headers).json()["results"]
+    values = {r["metric"]: r["value"] for r in first if r["portfolio_id"] == pid}
+    assert values["MC_Paths"] == "5000"
+    assert float(values["MC_VaR_95_10d_amount"]) < 0
+    assert float(values["MC_VaR_95_10d_stderr"]) > 0
+    assert [r["value"] for r in first] == [r["value"] for r in second]
+
+    # Another portfolio adds a symbol to the batch, so the cached result no longer applies.
+    price_store.upsert_series("MCSYM2", [f"2024-02-{d:02d}" for d in range(1, 11)], [50, 52, 51, 49, 50, 53, 52, 51, 54, 55])
+    other = create_portfolio(headers, holdings=[("MCSYM2", "equity", "5", "50")])
+    url = f"/api/v1/risk/scenarios/{scenario['id']}/run"
+    client.post(url, headers=headers, json={"portfolio_ids": [pid]})
+    assert client.post(url, headers=headers, json={"portfolio_ids": [pid]}).json()["cache"] == {"hits": 1, "misses": 0}
+    wider = client.post(url, headers=headers, json={"portfolio_ids": [pid, other]}).json()
+    assert wider["cache"] == {"hits": 0, "misses": 2}
+
+
+def test_covariance_incremental_matches_rebuild():
+    rng = np.random.default_rng(11)
+    dates = np.arange(np.datetime64("2023-01-02"), np.datetime64("2023-03-13"))
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), 3)), axis=0))
+    names = ["COVA", "COVB", "COVC"]
+    for j, name in enumerate(names):
+        price_store.upsert_series(name, dates[:-5], closes[:-5, j])
+    for method in covariance.METHODS:
+        covariance.estimate(names, window=30, method=method)
+    for j, name in enumerate(names):
+        price_store.upsert_series(name, dates[-5:], closes[-5:, j])
+
+    returns = np.diff(np.log(closes), axis=0)[-30:]
+    for method in covariance.METHODS:
+        slid = covariance.estimate(names, window=30, method=method)
+        assert covariance._windows[(tuple(names), 30, covariance.DEFAULT_DECAY)].slides == 5
+        state = covariance._windows.pop((tuple(names), 30, covariance.DEFAULT_DECAY))
+        covariance._cache.clear()
+        rebuilt = covariance.estimate(names, window=30, method=method)
+        assert slid["observations"] == 30
+        np.testing.assert_allclose(slid["matrix"], rebuilt["matrix"], atol=1e-12)
+        if method == "sample":
+            np.testing.assert_allclose(slid["matrix"], np.cov(returns, rowvar=False), atol=1e-12)
+        if method == "ledoit_wolf":
+            assert 0 <= slid["shrinkage"] <= 1
+        covariance._windows[(tuple(names), 30, covariance.DEFAULT_DECAY)] = state
+
+    # A correction inside the window forces a rebuild rather than a slide.
+    closes[-10, 0] *= 1.05
+    price_store.upsert_series(names[0], dates[-10:-9], closes[-10:-9, 0])
+    corrected = covariance.estimate(names, window=30, method="sample")
+    assert covariance._windows[(tuple(names), 30, covariance.DEFAULT_DECAY)].slides == 0
+    returns = np.diff(np.log(closes), axis=0)[-30:]
+    np.testing.assert_allclose(corrected["matrix"], np.cov(returns, rowvar=False), atol=1e-12)
+
+
+def test_covariance_endpoint(client, register):
+    headers = register("covuser")
+    for name, drift in (("COVX", 1.01), ("COVY", 0.99)):
+        price_store.upsert_series(name, [f"2023-05-{d:02d}" for d in range(1, 31)], 100 * drift ** np.arange(30) * (1 + 0.01 * (np.arange(30) % 3)))
+    response = client.get(
+        "/api/v1/risk/covariance",
+        headers=headers,
+        params={"symbol": ["COVY", "COVX"], "window": 20, "method": "ewma", "as_of": "2023-05-30"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["symbols"] == ["COVX", "COVY"]
+    assert len(body["matrix"]) == 2 and body["observations"] == 20
+    bad = client.get("/api/v1/risk/covariance", headers=headers, params={"method": "nope"})
+    assert bad.status_code == 400
+
+
+def test_rerun_served_from_cache_until_holdings_change(client, register, create_portfolio):
+    headers = register("cacheuser")
+    pid = create_portfolio(headers, holdings=[("CACHEQ", "equity", "10", "100")])
+    other = create_portfolio(headers, holdings=[("CACHEQ", "equity", "5", "100")])
+    scenario = client.post(
+        "/api/v1/risk/scenarios", headers=headers, json={"name": "Crash", "params_json": '{"drawdown_pct": 10}'}
+    ).json()
+    url = f"/api/v1/risk/scenarios/{scenario['id']}/run"
+
+    assert client.post(url, headers=headers).json()["cache"] == {"hits": 0, "misses": 2}
+    version = csv_store.table_version("risk_results")
+    assert client.post(url, headers=headers).json()["cache"] == {"hits": 2, "misses": 0}
+    assert csv_store.table_version("risk_results") == version  # nothing rewritten
+
+    client.post(
+        f"/api/v1/portfolios/{pid}/holdings",
+        headers=headers,
+        json={"symbol": "CACHFI", "asset_class": "fixed_income", "quantity": "1", "avg_cost": "100"},
+    )
+    rerun = client.post(url, headers=headers).json()
+    assert rerun["cache"] == {"hits": 1, "misses": 1}
+    values = {(r["portfolio_id"], r["metric"]): r["value"] for r in rerun["results"]}
+    assert values[(pid, "Stress_PnL")] == "-100.50"
+    assert values[(other, "Stress_PnL")] == "-50.00"
+
+    stats = client.get("/api/v1/risk/cache/stats", headers=headers).json()
+    assert stats["hits"] >= 3 and 0 < stats["hit_rate"] < 1
+
+
+def test_factor_decomposition_components_add_up(client, register, create_portfolio):
+    headers = register("factoruser")
+    client.post(
+        "/api/v1/risk/factors/loadings",
+        headers=headers,
+        json={"loadings": [{"symbol": "FCTA", "equity": 1.2, "fx": 0.5, "specific_vol": 0.2}]},
+    )
+    first = create_portfolio(headers, holdings=[("FCTA", "equity", "10", "100"), ("FCTB", "fixed_income", "20", "50")])
+    second = create_portfolio(headers, holdings=[("FCTB", "fixed_income", "-5", "50")])
+    body = client.get("/api/v1/risk/factors", headers=headers).json()
+    by_pid = {p["portfolio_id"]: p for p in body["portfolios"]}
+    assert set(by_pid) == {first, second}
+
+    p = by_pid[first]
+    exposures = {f["factor"]: f["exposure"] for f in p["factors"]}
+    # FCTA loads from the table (1.2 * 1000), FCTB falls back to fixed_income (0.05 * 1000)
+    assert exposures["equity"] == pytest.approx(1200 + 50)
+    assert exposures["rates"] == pytest.approx(-6.0 * 1000)
+    factor_total = sum(f["component"] for f in p["factors"]) + p["specific"]["component"]
+    assert factor_total == pytest.approx(p["total_risk"])
+    assert sum(h["component"] for h in p["holdings"]) == pytest.approx(p["total_risk"])
+    assert p["specific_risk"] == pytest.approx(1000 * 0.2)
+
+    x = np.array([exposures[f] for f in body["factors"]])
+    cov = np.array(body["factor_covariance"])
+    assert p["factor_risk"] == pytest.approx(np.sqrt(x @ cov @ x))
+
+    # Two lots of one symbol carry its specific risk once, on their combined value.
+    split = create_portfolio(headers, holdings=[("FCTA", "equity", "4", "100"), ("FCTA", "equity", "6", "100")])
+    body = client.get("/api/v1/risk/factors", headers=headers).json()
+    p = next(r for r in body["portfolios"] if r["portfolio_id"] == split)
+    assert p["specific_risk"] == pytest.approx(1000 * 0.2)
+    assert sum(h["component"] for h in p["holdings"]) == pytest.approx(p["total_risk"])
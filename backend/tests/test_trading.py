@@ -0,0 +1,243 @@
+"""Tests for trading: order fills, position keeping, snapshots and tax lots."""
+from app.core.config import settings
+from app.services import positions, tax_lots
+
+
+def _fill(client, headers, pid, symbol, side, qty, price):
+    order = client.post(
+        "/api/v1/trading/orders",
+        headers=headers,
+        json={"portfolio_id": pid, "symbol": symbol, "side": side, "quantity": qty},
+    ).json()
+    response = client.put(
+        f"/api/v1/trading/orders/{order['id']}",
+        headers=headers,
+        json={"status": "FILLED", "fill_price": price},
+    )
+    assert response.status_code == 200
+    return order["id"]
+
+
+def test_apply_trade_average_cost():
+    assert positions.apply_trade((0.0, 0.0), "BUY", 10, 5.0) == (10.0, 5.0)
+    assert positions.apply_trade((10.0, 5.0), "BUY", 10, 7.0) == (20.0, 6.0)
+    assert positions.apply_trade((20.0, 6.0), "SELL", 5, 9.0) == (15.0, 6.0)
+    assert positions.apply_trade((15.0, 6.0), "SELL", 20, 8.0) == (-5.0, 8.0)
+    assert positions.apply_trade((15.0, 6.0), "SELL", 15, 8.0) == (0.0, 0.0)
+
+
+def test_filled_orders_update_holdings(client, register, create_portfolio):
+    headers = register("fillsuser")
+    pid = create_portfolio(headers)
+    _fill(client, headers, pid, "fila", "BUY", "10", 5.0)
+    _fill(client, headers, pid, "FILA", "BUY", "10", 7.0)
+    _fill(client, headers, pid, "FILA", "SELL", "5", 9.0)
+
+    holdings = client.get(f"/api/v1/portfolios/{pid}/holdings", headers=headers).json()
+    assert [(h["symbol"], h["quantity"], h["avg_cost"]) for h in holdings] == [("FILA", "15", "6")]
+
+    _fill(client, headers, pid, "FILA", "SELL", "15", 9.0)
+    assert client.get(f"/api/v1/portfolios/{pid}/holdings", headers=headers).json() == []
+
+
+def test_fill_without_price_requires_fill_price(client, register, create_portfolio):
+    headers = register("nopriceuser")
+    pid = create_portfolio(headers)
+    order = client.post(
+        "/api/v1/trading/orders",
+        headers=headers,
+        json={"portfolio_id": pid, "symbol": "UNPRICED", "side": "BUY", "quantity": "1"},
+    ).json()
+    response = client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "FILLED"})
+    assert response.status_code == 400
+
+
+def test_positions_as_of_uses_snapshots(client, monkeypatch, register, create_portfolio):
+    """Rebuilding as of a date replays only the events after the nearest snapshot."""
+    monkeypatch.setattr(settings, "position_snapshot_interval", 2)
+    headers = register("snapuser")
+    pid = create_portfolio(headers)
+    for i in range(5):
+        _fill(client, headers, pid, "SNAP", "BUY", "1", 10.0 + i)
+
+    current = client.get(f"/api/v1/trading/positions?portfolio_id={pid}", headers=headers).json()
+    assert current["positions"] == [{"symbol": "SNAP", "quantity": 5.0, "avg_cost": 12.0}]
+    assert current["replayed_events"] == 1
+    assert current["snapshot_as_of"] is not None
+
+    events = client.get(f"/api/v1/trading/positions/events?portfolio_id={pid}", headers=headers).json()
+    as_of = events[2]["executed_at"]
+    earlier = client.get(
+        "/api/v1/trading/positions", headers=headers, params={"portfolio_id": pid, "as_of": as_of}
+    ).json()
+    assert earlier["positions"] == [{"symbol": "SNAP", "quantity": 3.0, "avg_cost": 11.0}]
+    assert earlier["replayed_events"] == 1
+
+
+def test_positions_start_from_hand_entered_holdings(client, register, create_portfolio):
+    headers = register("openposuser")
+    pid = create_portfolio(headers, holdings=[("OPEN", "equity", "100", "100")])
+    _fill(client, headers, pid, "OPEN", "SELL", "50", 120.0)
+
+    holdings = client.get(f"/api/v1/portfolios/{pid}/holdings", headers=headers).json()
+    assert [(h["symbol"], h["quantity"]) for h in holdings] == [("OPEN", "50")]
+    current = client.get(f"/api/v1/trading/positions?portfolio_id={pid}", headers=headers).json()
+    assert current["positions"] == [{"symbol": "OPEN", "quantity": 50.0, "avg_cost": 100.0}]
+
+
+def test_lot_book_relief_order():
+    """FIFO, LIFO and HIFO relieve different lots from the same book."""
+    for method, expected in [("FIFO", ["a", "b"]), ("LIFO", ["c", "b"]), ("HIFO", ["b", "c"])]:
+        book = tax_lots.LotBook()
+        for seq, (lot_id, cost) in enumerate([("a", 10.0), ("b", 30.0), ("c", 20.0)]):
+            book.open(tax_lots.Lot(lot_id, seq, "2025-01-01", 5.0, cost), 1)
+        taken = book.relieve(8.0, method)
+        assert [lot.lot_id for lot, _ in taken] == expected
+        assert [q for _, q in taken] == [5.0, 3.0]
+        assert book.open_quantity == 7.0
+
+
+def test_realized_gains_follow_lot_preference(client, register, create_portfolio):
+    headers = register("lotsuser")
+    client.put(
+        "/api/v1/design-principles/preferences",
+        headers=headers,
+        json={"key": "lot_relief_method", "value": "HIFO"},
+    )
+    pid = create_portfolio(headers)
+    _fill(client, headers, pid, "LOTS", "BUY", "10", 10.0)
+    _fill(client, headers, pid, "LOTS", "BUY", "10", 20.0)
+    _fill(client, headers, pid, "LOTS", "SELL", "5", 25.0)
+
+    lots = client.get(f"/api/v1/portfolios/{pid}/lots", headers=headers).json()
+    assert sorted((lot["cost"], lot["remaining"]) for lot in lots) == [(10.0, 10.0), (20.0, 5.0)]
+
+    gains = client.get(f"/api/v1/portfolios/{pid}/realized-gains?include_records=true", headers=headers).json()
+    assert gains["realized_gain"] == 25.0
+    assert gains["short_term"] == 25.0
+    assert gains["by_symbol"]["LOTS"]["count"] == 1
+    assert gains["records"][0]["cost"] == 20.0
+
+    none = client.get(f"/api/v1/portfolios/{pid}/realized-gains?end=2000-01-01", headers=headers).json()
+    assert none["realized_gain"] == 0.0
+
+
+def test_selling_out_of_a_hand_entered_holding(client, register, create_portfolio):
+    headers = register("openlotsuser")
+    pid = create_portfolio(headers, holdings=[("OPENLOT", "equity", "100", "100")])
+    _fill(client, headers, pid, "OPENLOT", "SELL", "50", 120.0)
+
+    lots = client.get(f"/api/v1/portfolios/{pid}/lots", headers=headers).json()
+    assert [(lot["side"], lot["remaining"], lot["cost"]) for lot in lots] == [("LONG", 50.0, 100.0)]
+    gains = client.get(f"/api/v1/portfolios/{pid}/realized-gains", headers=headers).json()
+    assert gains["realized_gain"] == 1000.0
+    current = client.get(f"/api/v1/trading/positions?portfolio_id={pid}", headers=headers).json()
+    assert current["positions"] == [{"symbol": "OPENLOT", "quantity": 50.0, "avg_cost": 100.0}]
+
+
+def test_execution_simulator_matches_orders(client, register, create_portfolio):
+    """Limit orders cross internally at the resting price; market orders take the close; sweep fills resting limits."""
+    headers = register("execuser")
+    buyer, seller = create_portfolio(headers, "Buyer"), create_portfolio(headers, "Seller")
+    client.post("/api/v1/market-data/prices", headers=headers, json={"prices": [{"symbol": "EXE", "date": "2025-01-02", "close": 100.0}]})
+
+    batch = client.post("/api/v1/trading/orders/batch", headers=headers, json={"orders": [
+        {"portfolio_id": seller, "symbol": "EXE", "side": "SELL", "quantity": "5", "order_type": "LIMIT", "limit_price": 102},
+        {"portfolio_id": seller, "symbol": "EXE", "side": "SELL", "quantity": "5", "order_type": "LIMIT", "limit_price": 101},
+        {"portfolio_id": buyer, "symbol": "EXE", "side": "BUY", "quantity": "8", "order_type": "LIMIT", "limit_price": 102},
+    ]})
+    assert batch.status_code == 200
+    ask_102, ask_101, bid = batch.json()
+    assert (bid["status"], bid["filled_quantity"], bid["avg_fill_price"]) == ("FILLED", "8", "101.375")
+    assert (ask_101["status"], ask_102["status"], ask_102["filled_quantity"]) == ("FILLED", "PARTIALLY_FILLED", "3")
+    book = client.get("/api/v1/trading/book/exe", headers=headers).json()
+    assert book["asks"] == [{"price": 102.0, "quantity": 2.0, "orders": 1}] and book["bids"] == []
+
+    market = client.post("/api/v1/trading/orders", headers=headers, json={
+        "portfolio_id": buyer, "symbol": "EXE", "side": "BUY", "quantity": "1",
+    }).json()
+    assert (market["status"], market["avg_fill_price"]) == ("FILLED", "102")  # crosses the resting ask first
+
+    resting = client.post("/api/v1/trading/orders", headers=headers, json={
+        "portfolio_id": buyer, "symbol": "EXE", "side": "BUY", "quantity": "4", "order_type": "LIMIT", "limit_price": 95,
+    }).json()
+    assert resting["status"] == "NEW"
+    client.post("/api/v1/market-data/prices", headers=headers, json={"prices": [{"symbol": "EXE", "date": "2025-01-03", "close": 94.0}]})
+    assert client.post("/api/v1/trading/execution/sweep", headers=headers, json={}).json()["orders_filled"] == 1
+    orders = {o["id"]: o for o in client.get("/api/v1/trading/orders", headers=headers).json()}
+    assert orders[resting["id"]]["avg_fill_price"] == "94"
+    assert orders[ask_102["id"]]["status"] == "PARTIALLY_FILLED"  # asks at 102 stay above a 94 close
+
+    holdings = client.get(f"/api/v1/portfolios/{buyer}/holdings", headers=headers).json()
+    assert [h["quantity"] for h in holdings] == ["13"]
+    bad = client.post("/api/v1/trading/orders", headers=headers, json={
+        "portfolio_id": buyer, "symbol": "EXE", "side": "BUY", "quantity": "1", "order_type": "LIMIT",
+    })
+    assert bad.status_code == 400
+
+
+def test_order_state_machine_and_history(client, register, create_portfolio):
+    """Status changes are validated, appended to the event log and replayed as history."""
+    headers = register("lifecycleuser")
+    pid = create_portfolio(headers)
+    order = client.post("/api/v1/trading/orders", headers=headers, json={
+        "portfolio_id": pid, "symbol": "LIFE", "side": "BUY", "quantity": "3",
+    }).json()
+    assert order["status"] == "NEW"
+    cancelled = client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "cancelled"})
+    assert cancelled.json()["status"] == "CANCELLED"
+    reopened = client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "FILLED", "fill_price": 1})
+    assert reopened.status_code == 409
+    assert client.put(f"/api/v1/trading/orders/{order['id']}", headers=headers, json={"status": "BOGUS"}).status_code == 400
+
+    history = client.get(f"/api/v1/trading/orders/{order['id']}/history", headers=headers).json()
+    assert [(h["status"], h["reason"]) for h in history] == [("NEW", "created"), ("CANCELLED", "manual")]
+    assert client.get(f"/api/v1/trading/orders/{order['id']}", headers=headers).json()["status"] == "CANCELLED"
+    assert client.get(f"/api/v1/trading/positions?portfolio_id={pid}", headers=headers).json()["positions"] == []
+
+
+def test_pre_trade_compliance(client, register, create_portfolio):
+    """Batch orders are checked together; only the orders causing a breach are rejected."""
+    headers = register("complianceuser")
+    pid = create_portfolio(headers, holdings=[("CASHUSD", "cash", "1000", "1")])
+    client.post("/api/v1/market-data/prices", headers=headers, json={"prices": [
+        {"symbol": "CMPA", "date": "2025-01-02", "close": 10.0},
+        {"symbol": "CMPB", "date": "2025-01-02", "close": 10.0},
+    ]})
+    for name, rule_type, params in [
+        ("Max 30% per name", "max_weight_symbol", '{"max_pct": 30}'),
+        ("No CMPB", "restricted_symbols", '{"symbols": ["cmpb"], "sides": ["BUY"]}'),
+        ("Keep 10% cash", "min_cash", '{"min_pct": 10}'),
+    ]:
+        resp = client.post("/api/v1/trading/compliance/rules", headers=headers, json={
+            "name": name, "rule_type": rule_type, "params_json": params,
+        })
+        assert resp.status_code == 200
+    bad = client.post("/api/v1/trading/compliance/rules", headers=headers, json={"name": "x", "rule_type": "min_cash"})
+    assert bad.status_code == 400
+
+    proposed = {"orders": [
+        {"portfolio_id": pid, "symbol": "CMPA", "side": "BUY", "quantity": "20"},  # 20% of NAV
+        {"portfolio_id": pid, "symbol": "CMPB", "side": "BUY", "quantity": "1"},
+    ]}
+    check = client.post("/api/v1/trading/compliance/check", headers=headers, json=proposed).json()
+    assert [r["passed"] for r in check["orders"]] == [True, False]
+    assert "restricted" in check["orders"][1]["reasons"][0]
+
+    proposed["orders"][0]["quantity"] = "40"  # 40% of NAV breaches the per-name limit
+    rows = client.post("/api/v1/trading/orders/batch", headers=headers, json=proposed).json()
+    assert [r["status"] for r in rows] == ["REJECTED", "REJECTED"]
+    assert "Max 30% per name" in rows[0]["compliance_reasons"][0]
+    history = client.get(f"/api/v1/trading/orders/{rows[0]['id']}/history", headers=headers).json()
+    assert history[-1]["reason"].startswith("compliance:")
+
+    ok = client.post("/api/v1/trading/orders", headers=headers, json={
+        "portfolio_id": pid, "symbol": "CMPA", "side": "BUY", "quantity": "25",
+    }).json()
+    assert ok["status"] == "FILLED" and ok["compliance_reasons"] == []
+    # 25% CMPA plus another 25% would leave 50% cash but breach 30% per name.
+    again = client.post("/api/v1/trading/compliance/check", headers=headers, json={"orders": [
+        {"portfolio_id": pid, "symbol": "CMPA", "side": "BUY", "quantity": "25"},
+        {"portfolio_id": pid, "symbol": "CMPA", "side": "SELL", "quantity": "5"},
+    ]}).json()
+    assert [r["passed"] for r in again["orders"]] == [False, True]
@@ -0,0 +1,140 @@
+"""Tests for wealth management: model rebalancing, drift monitoring and model optimization."""
+import json
+
+import numpy as np
+import pytest
+
+from app.db import price_store
+from app.services import drift, optimizer, rebalance
+
+
+def test_parse_allocation_reads_percentages():
+    assert rebalance.parse_allocation('{"AAA": 0.5, "BBB": 0.5}') == {"AAA": 0.005, "BBB": 0.005}
+    assert rebalance.parse_allocation('{"equity": 60, "fixed_income": 40}') == {"equity": 0.6, "fixed_income": 0.4}
+    with pytest.raises(ValueError):
+        rebalance.parse_allocation('{"equity": 80, "fixed_income": 40}')
+
+
+def test_model_rebalance(client, register, create_portfolio):
+    headers = register("rebalanceuser")
+    drifted, steady = (
+        create_portfolio(headers, name, holdings=[("RBEQ", "equity", equity, "10"), ("RBFI", "fixed_income", bonds, "10")])
+        for name, equity, bonds in (("Drifted", "80", "20"), ("Steady", "60", "40"))
+    )
+    bad = client.post("/api/v1/wealth/models", headers=headers, json={"name": "Bad", "allocation_json": '{"equity": 80, "fixed_income": 40}'})
+    assert bad.status_code == 200  # stored as given; reported when used
+    model = client.post("/api/v1/wealth/models", headers=headers, json={
+        "name": "60/40", "allocation_json": '{"equity": 60, "fixed_income": 40}',
+    }).json()["id"]
+    for name, pid in (("Drifted", drifted), ("Steady", steady), ("Unlinked", None)):
+        client.post("/api/v1/wealth/client-accounts", headers=headers, json={"model_id": model, "name": name, "portfolio_id": pid})
+
+    plan = client.post("/api/v1/wealth/rebalance", headers=headers, json={"model_id": model}).json()
+    assert plan["summary"] == {"models": 1, "accounts": 2, "rebalanced": 1, "orders": 2}
+    assert [s["name"] for s in plan["skipped"]] == ["Unlinked"]
+    by_name = {a["name"]: a for a in plan["accounts"]}
+    assert by_name["Drifted"]["max_drift_pct"] == pytest.approx(20.0)
+    assert not by_name["Steady"]["orders"]
+    assert [(o["side"], o["symbol"], o["quantity"]) for o in plan["orders"]] == [("SELL", "RBEQ", "20"), ("BUY", "RBFI", "20")]
+
+    submitted = client.post("/api/v1/wealth/rebalance", headers=headers, json={"model_id": model, "dry_run": False}).json()
+    assert len(submitted["orders"]) == 2
+    assert all(o["portfolio_id"] == drifted and o["compliance_reasons"] == [] for o in submitted["orders"])
+    assert client.post("/api/v1/wealth/rebalance", headers=headers, json={"model_id": "missing"}).status_code == 404
+    client.post("/api/v1/wealth/client-accounts", headers=headers, json={"model_id": bad.json()["id"], "name": "OnBad", "portfolio_id": steady})
+    assert client.post("/api/v1/wealth/rebalance", headers=headers, json={"model_id": bad.json()["id"]}).status_code == 400
+    everything = client.post("/api/v1/wealth/rebalance", headers=headers, json={}).json()
+    assert [e["model_id"] for e in everything["errors"]] == [bad.json()["id"]]
+
+
+def test_drift_monitor_tracks_changes(client, register_user, create_portfolio):
+    user_id, headers = register_user("driftuser")
+    model = client.post("/api/v1/wealth/models", headers=headers, json={
+        "name": "Balanced", "allocation_json": '{"equity": 50, "fixed_income": 50}',
+    }).json()["id"]
+    holding_ids = {}
+    for name, equity in (("Near", "52"), ("Far", "70"), ("Mid", "60")):
+        pid = create_portfolio(headers, name)
+        for symbol, asset_class, qty in (("DREQ", "equity", equity), ("DRFI", "fixed_income", str(100 - int(equity)))):
+            holding = client.post(f"/api/v1/portfolios/{pid}/holdings", headers=headers, json={
+                "symbol": symbol, "asset_class": asset_class, "quantity": qty, "avg_cost": "10",
+            }).json()
+            holding_ids[(name, symbol)] = (pid, holding["id"])
+        client.post("/api/v1/wealth/client-accounts", headers=headers, json={"model_id": model, "name": name, "portfolio_id": pid})
+
+    top = client.get("/api/v1/wealth/drift/top", headers=headers).json()
+    assert [(a["name"], round(a["max_drift_pct"])) for a in top] == [("Far", 20), ("Mid", 10), ("Near", 2)]
+    assert drift.refresh(user_id) == 0
+
+    pid, hid = holding_ids[("Near", "DREQ")]
+    client.put(f"/api/v1/portfolios/{pid}/holdings/{hid}", headers=headers, json={"quantity": "192"})
+    assert drift.refresh(user_id) == 1  # only the account linked to that portfolio
+    top = client.get("/api/v1/wealth/drift/top?limit=2", headers=headers).json()
+    assert [(a["name"], round(a["max_drift_pct"])) for a in top] == [("Near", 30), ("Far", 20)]
+
+    client.put(f"/api/v1/wealth/models/{model}", headers=headers, json={"allocation_json": '{"equity": 70, "fixed_income": 30}'})
+    assert drift.refresh(user_id) == 3
+    top = client.get("/api/v1/wealth/drift/top", headers=headers).json()
+    assert [round(a["max_drift_pct"]) for a in top] == [10, 10, 0] and top[-1]["name"] == "Far"
+
+    price_store.upsert_series("DRUNRELATED", ["2024-01-02"], [5.0])
+    assert drift.refresh(user_id) == 0  # nobody holds it
+    price_store.upsert_series("DRFI", ["2024-01-02"], [12.0])
+    assert drift.refresh(user_id) == 3
+
+
+def test_optimizer_solver_constraints():
+    mu = np.array([0.10, 0.06, 0.02])
+    cov = np.diag([0.04, 0.01, 0.0025])
+    lo, hi = np.zeros(3), np.full(3, 0.6)
+    gammas = np.array([100.0, 10.0, 1.0])
+    w, _ = optimizer.solve(mu, cov, gammas, lo, hi, np.full(3, 1 / 3))
+    assert np.allclose(w.sum(axis=0), 1.0) and (w >= -1e-12).all() and (w <= 0.6 + 1e-12).all()
+    returns = mu @ w
+    assert returns[0] < returns[1] < returns[2]  # less risk aversion, more return
+    # Unconstrained by bounds, the high-aversion point is the minimum-variance portfolio.
+    w_mv, _ = optimizer.solve(mu, cov, np.array([1e6]), lo, np.ones(3), np.full(3, 1 / 3))
+    inverse = 1 / np.diag(cov)
+    assert np.allclose(w_mv[:, 0], inverse / inverse.sum(), atol=1e-4)
+
+    w0 = np.array([0.2, 0.3, 0.5])
+    capped, _ = optimizer.solve(mu, cov, gammas, lo, hi, w0, w0, 0.1)
+    assert (np.abs(capped - w0[:, None]).sum(axis=0) <= 0.1 + 1e-8).all()
+
+
+def test_optimize_model_endpoint(client, register, create_portfolio):
+    headers = register("optimizeuser")
+    create_portfolio(headers, holdings=[("OPTA", "equity", "10", "100"), ("OPTB", "fixed_income", "10", "100")])
+    rng = np.random.default_rng(7)
+    dates = [str(d) for d in np.arange("2024-01-01", "2024-04-01", dtype="datetime64[D]")]
+    for symbol, vol in (("OPTA", 0.02), ("OPTB", 0.01), ("OPTC", 0.005)):
+        price_store.upsert_series(symbol, dates, list(100 * np.exp(np.cumsum(rng.normal(0, vol, len(dates))))))
+    model = client.post("/api/v1/wealth/models", headers=headers, json={
+        "name": "Opt", "allocation_json": '{"OPTA": 40, "OPTB": 30, "OPTC": 30}',
+    }).json()["id"]
+    body = {
+        "model_id": model,
+        "expected_returns": {"OPTA": 0.12, "OPTB": 0.06, "OPTC": 0.03},
+        "max_weight": 0.5,
+        "max_turnover": 0.2,
+        "frontier_points": 5,
+        "save": True,
+    }
+    result = client.post("/api/v1/wealth/models/optimize", headers=headers, json=body).json()
+    assert result["warm_start"] and result["saved"]
+    assert result["portfolio"]["turnover"] <= 0.2 + 1e-6
+    assert len(result["frontier"]) == 5
+    assert all(max(p["weights"].values()) <= 0.5 + 1e-9 for p in result["frontier"])
+    saved = client.get(f"/api/v1/wealth/models/{model}", headers=headers).json()["allocation_json"]
+    assert saved == result["portfolio"]["allocation_json"]
+    assert sum(json.loads(saved).values()) == pytest.approx(100.0)
+
+    body.update(model_id=None, save=False, max_turnover=None, symbols=["OPTA"])
+    assert client.post("/api/v1/wealth/models/optimize", headers=headers, json=body).status_code == 400
+
+    # A model with asset-class sleeves is rejected rather than overwritten with symbols.
+    sleeves = '{"equity": 60, "fixed_income": 40}'
+    classes = client.post("/api/v1/wealth/models", headers=headers, json={"name": "Classes", "allocation_json": sleeves}).json()["id"]
+    body.update(model_id=classes, save=True, symbols=["OPTA", "OPTB"])
+    assert client.post("/api/v1/wealth/models/optimize", headers=headers, json=body).status_code == 400
+    assert client.get(f"/api/v1/wealth/models/{classes}", headers=headers).json()["allocation_json"] == sleeves